@@ -0,0 +1,290 @@
+import asyncio
+import tempfile
+import time
+import uuid
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from app.main import FOCOClient
+
+
+def csv_row_ends(chunk: bytes, in_quotes: bool) -> Tuple[List[int], bool]:
+    # Posições (após o "\n") onde terminam linhas do CSV, ignorando quebras dentro de aspas
+    ends: List[int] = []
+    if not in_quotes and b'"' not in chunk:
+        i = chunk.find(b"\n")
+        while i >= 0:
+            ends.append(i + 1)
+            i = chunk.find(b"\n", i + 1)
+        return ends, False
+    start = 0
+    i = chunk.find(b"\n")
+    while i >= 0:
+        if chunk.count(b'"', start, i) % 2:
+            in_quotes = not in_quotes
+        start = i
+        if not in_quotes:
+            ends.append(i + 1)
+        i = chunk.find(b"\n", i + 1)
+    if chunk.count(b'"', start) % 2:
+        in_quotes = not in_quotes
+    return ends, in_quotes
+
+
+def _count_rows(chunk: bytes, in_quotes: bool) -> Tuple[int, bool]:
+    if not in_quotes and b'"' not in chunk:
+        return chunk.count(b"\n"), False
+    ends, in_quotes = csv_row_ends(chunk, in_quotes)
+    return len(ends), in_quotes
+
+
+def last_row_end(chunk: bytes, in_quotes: bool) -> int:
+    # Posição após o último "\n" fora de aspas (0 se não houver). Normalmente o último "\n" do
+    # chunk já é um fim de linha: confere a paridade das aspas antes dele sem percorrer linha a linha
+    i = chunk.rfind(b"\n")
+    if i < 0:
+        return 0
+    if (chunk.count(b'"', 0, i) % 2 == 1) == in_quotes:
+        return i + 1
+    ends, _ = csv_row_ends(chunk, in_quotes)
+    return ends[-1] if ends else 0
+
+
+# Limite de bytes aguardando um fim de linha fora de aspas. A Bulk API aceita registros de até
+# 400.000 caracteres: acima disso só há aspas sem fechamento, e o bloco é cortado na última quebra
+MAX_RECORD_BYTES = 2 * 1024 * 1024
+
+
+async def iter_csv_blocks(
+    source: AsyncIterator[bytes], max_record_bytes: int = MAX_RECORD_BYTES
+) -> AsyncIterator[bytes]:
+    # Reagrupa os chunks recebidos em blocos que terminam sempre em fim de linha do CSV
+    pending = b""
+    async for chunk in source:
+        if not chunk:
+            continue
+        end = last_row_end(chunk, _in_quotes(pending))
+        if not end:
+            pending += chunk
+            if len(pending) > max_record_bytes:
+                cut = pending.rfind(b"\n") + 1
+                if not cut:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Registro do CSV excede {max_record_bytes} bytes sem quebra de linha",
+                    )
+                block, pending = pending[:cut], pending[cut:]
+                yield block
+            continue
+        block, pending = pending + chunk[:end], chunk[end:]
+        yield block
+    if pending:
+        yield pending
+
+
+# Acima deste tamanho o corpo recebido vai para disco em vez de ficar em memória
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+async def spool_stream(source: AsyncIterator[bytes]):
+    # Respostas em streaming não podem ler o corpo da requisição ao mesmo tempo (o Starlette
+    # também consome receive() para detectar desconexão): grava o corpo antes de responder
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        async for chunk in source:
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def iter_spooled(spool) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            chunk = spool.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+def _in_quotes(data: bytes) -> bool:
+    return data.count(b'"') % 2 == 1
+
+
+class CsvPartitioner:
+    # Divide um CSV recebido em streaming em partes que respeitam o limite de bytes/registros
+    # de um job de ingestão, cortando sempre em fim de linha e repetindo o cabeçalho em cada parte.
+    def __init__(self, source: AsyncIterator[bytes], max_bytes: int, max_records: Optional[int] = None):
+        self._source = source.__aiter__()
+        self.max_bytes = max_bytes
+        self.max_records = max_records or None
+        self.header: Optional[bytes] = None
+        self._pending = b""
+        self._exhausted = False
+        self.total_bytes = 0
+        self.total_records = 0
+
+    async def _read(self) -> bytes:
+        if self._pending:
+            chunk, self._pending = self._pending, b""
+            return chunk
+        if self._exhausted:
+            return b""
+        try:
+            while True:
+                chunk = await self._source.__anext__()
+                if chunk:
+                    return chunk
+        except StopAsyncIteration:
+            self._exhausted = True
+            return b""
+
+    async def read_header(self) -> bytes:
+        buf = b""
+        while True:
+            chunk = await self._read()
+            if not chunk:
+                break
+            buf += chunk
+            ends, _ = csv_row_ends(buf, False)
+            if ends:
+                self.header, self._pending = buf[: ends[0]], buf[ends[0]:]
+                return self.header
+        if not buf:
+            raise HTTPException(status_code=400, detail="CSV vazio")
+        # Só há cabeçalho (sem quebra de linha final)
+        self.header = buf + b"\n"
+        return self.header
+
+    async def has_more(self) -> bool:
+        if not self._pending:
+            self._pending = await self._read()
+        return bool(self._pending)
+
+    async def part(self, stats: dict) -> AsyncIterator[bytes]:
+        # Gera o conteúdo de uma parte; os bytes excedentes ficam em _pending para a próxima
+        header = self.header or b""
+        size = len(header)
+        records = 0
+        in_quotes = False
+        tail = b""
+        yield header
+        while True:
+            chunk = await self._read()
+            if not chunk:
+                break
+            fits_bytes = size + len(chunk) <= self.max_bytes
+            if fits_bytes and self.max_records is None:
+                rows, in_quotes = _count_rows(chunk, in_quotes)
+                records += rows
+                size += len(chunk)
+                tail = chunk
+                yield chunk
+                continue
+            ends, after = csv_row_ends(chunk, in_quotes)
+            limit = self.max_bytes - size
+            cut = None
+            if self.max_records is not None and records + len(ends) >= self.max_records:
+                cut = ends[self.max_records - records - 1] if self.max_records > records else 0
+            if not fits_bytes:
+                within = [e for e in ends if e <= limit]
+                if within:
+                    cut = min(cut, within[-1]) if cut is not None else within[-1]
+                elif ends:
+                    # Nenhum fim de linha cabe no limite: fecha no primeiro (excede no máximo uma linha)
+                    cut = min(cut, ends[0]) if cut is not None else ends[0]
+            if cut is None:
+                # Ainda dentro do limite de registros, ou linha maior que o chunk: segue enviando
+                records += len(ends)
+                in_quotes = after
+                size += len(chunk)
+                tail = chunk
+                yield chunk
+                continue
+            if cut > 0:
+                records += sum(1 for e in ends if e <= cut)
+                size += cut
+                yield chunk[:cut]
+            self._pending = chunk[cut:]
+            break
+        if tail and not tail.endswith(b"\n") and not self._pending and self._exhausted:
+            # Última linha do arquivo sem quebra de linha final
+            records += 1
+        stats["bytes"] = size
+        stats["records"] = records
+        self.total_bytes += size
+        self.total_records += records
+
+
+class BulkIngestAggregate:
+    # Handle único para um upload que pode ter gerado vários jobs de ingestão
+    def __init__(self, job_spec: dict):
+        self.id = uuid.uuid4().hex
+        self.job_spec = job_spec
+        self.jobs: List[dict] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[object] = None
+        # ValidationReport quando o CSV passou pela validação prévia
+        self.validation: Optional[object] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "object": self.job_spec.get("object"),
+            "operation": self.job_spec.get("operation"),
+            "jobs": self.jobs,
+            "parts": len(self.jobs),
+            "bytes": sum(j.get("bytes", 0) for j in self.jobs),
+            "records": sum(j.get("records", 0) for j in self.jobs),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "validation": self.validation.as_dict() if self.validation is not None else None,
+        }
+
+
+async def stream_ingest(
+    client: "FOCOClient",
+    source: AsyncIterator[bytes],
+    job_spec: dict,
+    max_bytes: int,
+    max_records: Optional[int] = None,
+    close: bool = True,
+) -> BulkIngestAggregate:
+    aggregate = BulkIngestAggregate(job_spec)
+    partitioner = CsvPartitioner(source, max_bytes=max_bytes, max_records=max_records)
+    await partitioner.read_header()
+    try:
+        while await partitioner.has_more():
+            job = await client.bulk_create_job(dict(job_spec))
+            entry: Dict[str, object] = {"id": job.get("id"), "state": job.get("state")}
+            aggregate.jobs.append(entry)
+            try:
+                await client.bulk_upload_batch(job["id"], partitioner.part(entry))
+            except Exception:
+                # Job com upload incompleto não deve ser processado
+                try:
+                    await client.bulk_close_job(job["id"], state="Aborted")
+                    entry["state"] = "Aborted"
+                except Exception:
+                    pass
+                raise
+            if close:
+                closed = await client.bulk_close_job(job["id"])
+                entry["state"] = closed.get("state", "UploadComplete")
+    except HTTPException as e:
+        aggregate.error = {"status_code": e.status_code, "detail": e.detail}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        aggregate.error = {"status_code": 502, "detail": str(e)}
+    aggregate.finished_at = time.time()
+    return aggregate
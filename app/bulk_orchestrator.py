@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+from app.jsoncodec import dumps
+
+if TYPE_CHECKING:
+    from app.main import FOCOClient
+
+logger = logging.getLogger("mapeamentofoco")
+
+TERMINAL_STATES = ("JobComplete", "Failed", "Aborted")
+RESULT_KINDS = ("failedResults", "unprocessedrecords")
+# Intervalo mínimo (s) entre duas varreduras de arquivos de resultado órfãos em results_dir
+SWEEP_INTERVAL = 3600.0
+
+
+class TrackedJob:
+    def __init__(self, job_id: str, now: float, interval: float):
+        self.job_id = job_id
+        self.state: Optional[str] = None
+        self.status: dict = {}
+        self.tracked_at = now
+        self.updated_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.next_poll = now
+        self.interval = interval
+        self.polls = 0
+        self.error: Optional[str] = None
+        self.results: Dict[str, dict] = {}
+        # Download dos resultados, fora do polling para não atrasar os demais jobs
+        self.download: Optional[asyncio.Task] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "jobId": self.job_id,
+            "state": self.state,
+            "object": self.status.get("object"),
+            "operation": self.status.get("operation"),
+            "numberRecordsProcessed": self.status.get("numberRecordsProcessed"),
+            "numberRecordsFailed": self.status.get("numberRecordsFailed"),
+            "trackedAt": self.tracked_at,
+            "updatedAt": self.updated_at,
+            "finishedAt": self.finished_at,
+            "polls": self.polls,
+            "nextPollIn": None if self.finished_at else max(round(self.next_poll - time.time(), 1), 0),
+            "error": self.error,
+            "results": self.results,
+        }
+
+
+class BulkJobOrchestrator:
+    # Acompanha jobs de ingestão no servidor: um único polling por job (com backoff exponencial),
+    # independente de quantos clientes estejam observando, e publica mudanças via SSE.
+    def __init__(
+        self,
+        client: "FOCOClient",
+        results_dir: str,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        concurrency: int = 8,
+        retention: float = 3600.0,
+    ):
+        self.client = client
+        self.results_dir = results_dir
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.concurrency = max(1, concurrency)
+        self.retention = retention
+        self.jobs: Dict[str, TrackedJob] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._downloads = asyncio.Semaphore(self.concurrency)
+        self._swept_at = 0.0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for job in self.jobs.values():
+            if job.download is not None:
+                job.download.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def track(self, job_id: str) -> TrackedJob:
+        job = self.jobs.get(job_id)
+        if job is None or job.finished_at is not None:
+            job = TrackedJob(job_id, time.time(), self.min_interval)
+            self.jobs[job_id] = job
+            self._publish("tracked", job)
+        self._wakeup.set()
+        return job
+
+    def untrack(self, job_id: str) -> bool:
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        self._discard(job)
+        return True
+
+    def _discard(self, job: TrackedJob) -> None:
+        # Job fora da memória: interrompe o download (que apaga o arquivo parcial) e remove os resultados
+        if job.download is not None and not job.download.done():
+            job.download.cancel()
+            return
+        _remove_files(self._result_paths(job.job_id))
+
+    def _result_paths(self, job_id: str) -> List[str]:
+        return [os.path.join(self.results_dir, f"{job_id}_{kind}.csv") for kind in RESULT_KINDS]
+
+    def snapshot(self, job_ids: Optional[List[str]] = None) -> List[dict]:
+        jobs = self.jobs.values() if job_ids is None else [self.jobs[j] for j in job_ids if j in self.jobs]
+        return [j.as_dict() for j in jobs]
+
+    def in_flight(self) -> int:
+        return sum(1 for j in self.jobs.values() if j.finished_at is None)
+
+    # -----------------------------
+    # Publicação (SSE)
+    # -----------------------------
+    def _publish(self, event: str, job: TrackedJob) -> None:
+        message = (event, job.as_dict())
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Cliente lento: descarta o evento mais antigo em vez de bloquear o polling
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(message)
+
+    async def events(self, job_ids: Optional[List[str]] = None, heartbeat: float = 15.0) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+        self._subscribers.add(queue)
+        wanted = set(job_ids) if job_ids else None
+        try:
+            for item in self.snapshot(job_ids):
+                yield _sse("snapshot", item)
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if wanted is None or data["jobId"] in wanted:
+                    yield _sse(event, data)
+        finally:
+            self._subscribers.discard(queue)
+
+    # -----------------------------
+    # Polling
+    # -----------------------------
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            now = time.time()
+            self._expire(now)
+            if now - self._swept_at >= SWEEP_INTERVAL:
+                self._swept_at = now
+                await asyncio.to_thread(self._sweep, now)
+            due = [j for j in self.jobs.values() if j.finished_at is None and j.next_poll <= now]
+            if due:
+                try:
+                    await asyncio.gather(*(self._poll(job, semaphore) for job in due))
+                except Exception:
+                    # Nunca derruba o loop: os jobs seguem no próximo ciclo
+                    logger.exception("Falha no polling de jobs bulk")
+            pending = [j.next_poll for j in self.jobs.values() if j.finished_at is None]
+            timeout = max(min(pending) - time.time(), 0.05) if pending else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _expire(self, now: float) -> None:
+        for job_id in [j.job_id for j in self.jobs.values() if j.finished_at and now - j.finished_at > self.retention]:
+            self._discard(self.jobs.pop(job_id))
+
+    def _sweep(self, now: float) -> None:
+        # Resultados órfãos (processos anteriores, outros workers) somem pela idade; na primeira
+        # volta do loop isso limpa o que ficou de execuções anteriores
+        try:
+            entries = list(os.scandir(self.results_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            job_id = entry.name.rsplit("_", 1)[0]
+            if job_id in self.jobs:
+                continue
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > self.retention:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    async def _poll(self, job: TrackedJob, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            job.polls += 1
+            try:
+                status = await self.client.bulk_job_status(job.job_id)
+            except HTTPException as e:
+                job.error = f"{e.status_code}: {e.detail}"
+                if e.status_code == 404:
+                    job.finished_at = time.time()
+                    # "error" é reservado ao EventSource do navegador (falhas de conexão)
+                    self._publish("jobError", job)
+                    return
+                self._backoff(job, changed=False)
+                return
+            except Exception as e:
+                job.error = str(e)
+                self._backoff(job, changed=False)
+                return
+            job.error = None
+            changed = status.get("state") != job.state or status.get("numberRecordsProcessed") != job.status.get("numberRecordsProcessed")
+            job.status = status
+            job.state = status.get("state")
+            if changed:
+                job.updated_at = time.time()
+                # Registros gravados pelo job tornam obsoletas as consultas em cache do objeto
+                self.client.invalidate_queries(status.get("object"))
+            if job.state in TERMINAL_STATES:
+                job.finished_at = time.time()
+                self._publish("state", job)
+                if job.state in ("JobComplete", "Failed"):
+                    job.download = asyncio.create_task(self._fetch_results(job))
+                return
+            if changed:
+                self._publish("state", job)
+            self._backoff(job, changed)
+
+    def _backoff(self, job: TrackedJob, changed: bool) -> None:
+        # Volta ao intervalo mínimo quando há progresso; senão dobra até o máximo
+        job.interval = self.min_interval if changed else min(job.interval * 2, self.max_interval)
+        job.next_poll = time.time() + job.interval * random.uniform(0.9, 1.1)
+
+    async def _fetch_results(self, job: TrackedJob) -> None:
+        async with self._downloads:
+            os.makedirs(self.results_dir, exist_ok=True)
+            for kind, path in zip(RESULT_KINDS, self._result_paths(job.job_id)):
+                try:
+                    size = await self._download(job.job_id, kind, path)
+                    job.results[kind] = {"path": path, "bytes": size}
+                except asyncio.CancelledError:
+                    # Job descartado durante o download: nada dele fica em disco
+                    _remove_files(self._result_paths(job.job_id))
+                    raise
+                except Exception as e:
+                    job.results[kind] = {"error": getattr(e, "detail", None) or str(e)}
+        self._publish("results", job)
+
+    async def _download(self, job_id: str, kind: str, path: str) -> int:
+        resp = await self.client.bulk_results_stream(job_id, kind)
+        size = 0
+        try:
+            with open(path, "wb") as fh:
+                async for chunk in resp.aiter_bytes():
+                    size += len(chunk)
+                    fh.write(chunk)
+        finally:
+            await resp.aclose()
+        return size
+
+    def result_path(self, job_id: str, kind: str) -> Optional[str]:
+        job = self.jobs.get(job_id)
+        info = job.results.get(kind) if job else None
+        return info.get("path") if info else None
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _sse(event: str, data: dict) -> bytes:
+    # Mesmo codec das respostas REST; JSON compacto nunca contém quebra de linha
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
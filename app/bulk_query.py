@@ -0,0 +1,144 @@
+import asyncio
+import os
+import tempfile
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from app.main import FOCOClient
+
+# Páginas acima deste tamanho saem da memória para arquivo temporário enquanto aguardam a vez
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class BulkQueryDownload:
+    # Baixa as páginas de resultado de um job /jobs/query e as entrega em ordem como um único CSV.
+    # O locator da página seguinte vem no header Sforce-Locator, então a próxima requisição é
+    # disparada assim que os headers chegam, enquanto os corpos ainda estão sendo baixados.
+    def __init__(self, client: "FOCOClient", job_id: str, max_records: Optional[int] = None, concurrency: int = 4):
+        self.client = client
+        self.job_id = job_id
+        self.max_records = max_records
+        self.concurrency = max(1, concurrency)
+        self.pages = 0
+        self.records = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    async def _download(self, resp, spool) -> None:
+        try:
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                spool.write(chunk)
+        finally:
+            await resp.aclose()
+        spool.seek(0)
+
+    async def _producer(self, queue: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        locator: Optional[str] = None
+        try:
+            while True:
+                # Cada slot é liberado só depois que a página é escrita na saída,
+                # limitando memória/disco a `concurrency` páginas
+                await slots.acquire()
+                resp = await self.client.bulk_query_results(self.job_id, locator=locator, max_records=self.max_records)
+                try:
+                    self.records += int(resp.headers.get("Sforce-NumberOfRecords") or 0)
+                except ValueError:
+                    pass
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+                await queue.put((asyncio.create_task(self._download(resp, spool)), spool))
+                locator = resp.headers.get("Sforce-Locator")
+                if not locator or locator == "null":
+                    break
+        except Exception as e:
+            await queue.put((None, e))
+            return
+        await queue.put(None)
+
+    async def iter_csv(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.concurrency)
+        producer = asyncio.create_task(self._producer(queue, slots))
+        pending = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                task, spool = item
+                if task is None:
+                    # Falha do producer (ex.: HTTPException do gateway)
+                    raise spool
+                pending.append((task, spool))
+                await task
+                first_chunk = True
+                while True:
+                    chunk = spool.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if first_chunk and self.pages > 0:
+                        # Cada página repete o cabeçalho do CSV: mantém só o da primeira
+                        chunk = _strip_header(chunk, spool)
+                    first_chunk = False
+                    if chunk:
+                        self.bytes += len(chunk)
+                        yield chunk
+                spool.close()
+                pending.remove((task, spool))
+                self.pages += 1
+                slots.release()
+        finally:
+            producer.cancel()
+            for task, spool in pending:
+                task.cancel()
+                spool.close()
+            # Descarta páginas já enfileiradas que não chegaram a ser consumidas
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item and item[0] is not None:
+                    item[0].cancel()
+                    item[1].close()
+
+    async def write_to(self, path: str) -> dict:
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, "wb") as fh:
+                async for chunk in self.iter_csv():
+                    await asyncio.to_thread(fh.write, chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "jobId": self.job_id,
+            "pages": self.pages,
+            "records": self.records,
+            "bytes": self.bytes,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+def _strip_header(chunk: bytes, spool) -> bytes:
+    newline = chunk.find(b"\n")
+    while newline < 0:
+        more = spool.read(CHUNK_SIZE)
+        if not more:
+            return b""
+        chunk += more
+        newline = chunk.find(b"\n")
+    return chunk[newline + 1:]
+
+
+async def ensure_job_complete(client: "FOCOClient", job_id: str, wait: bool, timeout: float) -> dict:
+    status = await client.bulk_query_wait(job_id, timeout=timeout) if wait else await client.bulk_query_job_status(job_id)
+    state = status.get("state")
+    if state != "JobComplete":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} em estado {state}; resultados indisponíveis")
+    return status
@@ -0,0 +1,601 @@
+import asyncio
+import csv
+import io
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime
+from operator import itemgetter
+from typing import AsyncIterator, Callable, Dict, FrozenSet, List, Optional, Pattern, Set, Tuple
+
+from fastapi import HTTPException
+
+from app.bulk_ingest import csv_row_ends, iter_csv_blocks
+from app.picklists import PicklistField, PicklistIndex
+
+# columnDelimiter da Bulk API v2 → caractere
+DELIMITERS = {"COMMA": ",", "TAB": "\t", "PIPE": "|", "SEMICOLON": ";", "CARET": "^", "BACKQUOTE": "`"}
+
+# Na Bulk API, "#N/A" grava nulo explicitamente; célula vazia não altera o campo no update
+NULL_MARKER = "#N/A"
+
+OPERATIONS = ("insert", "update", "upsert", "delete", "hardDelete")
+STRING_TYPES = ("string", "textarea", "url", "phone", "email", "encryptedstring", "combobox")
+NUMBER_TYPES = ("double", "currency", "percent")
+
+_ID_RE = re.compile(r"^[a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?$")
+_INT_RE = re.compile(r"^[+-]?\d+$")
+_NUMBER_RE = re.compile(r"^[+-]?(\d*)(?:\.(\d*))?$")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_BOOLEANS = frozenset(("true", "false", "1", "0", "yes", "no"))
+# Quebras de linha reconhecidas pelo csv.reader (StringIO com newline="")
+_LINE_END_RE = re.compile(rb"\r\n|\r|\n")
+
+# Limite de valores memorizados por coluna (picklists não restritas podem ter texto livre)
+VERDICT_CACHE_SIZE = 4096
+
+# Recebe o valor (nunca vazio) e devolve a mensagem de erro, ou None
+Check = Callable[[str], Optional[str]]
+
+# Padrões rápidos, aplicados de uma vez a todos os valores distintos de uma coluna no bloco.
+# Aceitam só um subconjunto dos valores válidos: se falham, cada valor passa pela checagem exata.
+_FAST_ID = r"[a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?"
+_FAST_BOOLEAN = r"(?i:true|false|1|0|yes|no)"
+_FAST_DATE = r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|1\d|2[0-8])"
+_FAST_DATETIME = _FAST_DATE + r"T(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:\.\d{1,6})?(?:Z|[+-]\d{2}:\d{2})?"
+_FAST_EMAIL = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+
+
+def _fast_int(digits: int) -> str:
+    return r"[+-]?\d{1,%d}" % digits if digits else r"[+-]?\d+"
+
+
+def _fast_number(integer_digits: int) -> str:
+    whole = r"\d{0,%d}" % integer_digits if integer_digits else r"\d*"
+    return r"[+-]?(?=\.?\d)0*" + whole + r"(?:\.\d*)?"
+
+
+def _check_id(value: str) -> Optional[str]:
+    return None if _ID_RE.match(value) else "Id inválido"
+
+
+def _check_boolean(value: str) -> Optional[str]:
+    return None if value.lower() in _BOOLEANS else "booleano inválido"
+
+
+def _check_int(digits: int) -> Check:
+    def check(value: str) -> Optional[str]:
+        if not _INT_RE.match(value):
+            return "inteiro inválido"
+        if digits and len(value.lstrip("+-")) > digits:
+            return f"excede {digits} dígitos"
+        return None
+    return check
+
+
+def _check_number(integer_digits: int) -> Check:
+    # Casas decimais além da escala são arredondadas pelo gateway; só a parte inteira é limitada
+    def check(value: str) -> Optional[str]:
+        match = _NUMBER_RE.match(value)
+        if not match or not (match.group(1) or match.group(2)):
+            return "número inválido"
+        if integer_digits and len(match.group(1).lstrip("0")) > integer_digits:
+            return f"excede {integer_digits} dígitos inteiros"
+        return None
+    return check
+
+
+def _check_date(value: str) -> Optional[str]:
+    try:
+        if _DATE_RE.match(value):
+            date.fromisoformat(value)
+            return None
+    except ValueError:
+        pass
+    return "data inválida (AAAA-MM-DD)"
+
+
+def _check_datetime(value: str) -> Optional[str]:
+    try:
+        datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith(("Z", "z")) else value)
+        return None
+    except ValueError:
+        return "data/hora inválida (ISO 8601)"
+
+
+def _check_length(length: int, inner: Optional[Check] = None) -> Check:
+    def check(value: str) -> Optional[str]:
+        if len(value) > length:
+            return f"excede {length} caracteres"
+        return inner(value) if inner else None
+    return check
+
+
+def _check_email(value: str) -> Optional[str]:
+    return None if _EMAIL_RE.match(value) else "e-mail inválido"
+
+
+def field_check(field: dict) -> Tuple[Optional[Check], Optional[str], int]:
+    # (checagem exata, padrão rápido, tamanho máximo) para o tipo do campo
+    kind = field.get("type")
+    length = int(field.get("length") or 0)
+    if kind in ("id", "reference"):
+        return _check_id, _FAST_ID, 0
+    if kind == "boolean":
+        return _check_boolean, _FAST_BOOLEAN, 0
+    if kind == "int":
+        digits = int(field.get("digits") or 0)
+        return _check_int(digits), _fast_int(digits), 0
+    if kind in NUMBER_TYPES:
+        precision = int(field.get("precision") or 0)
+        integer_digits = precision - int(field.get("scale") or 0) if precision else 0
+        return _check_number(integer_digits), _fast_number(integer_digits), 0
+    if kind == "date":
+        return _check_date, _FAST_DATE, 0
+    if kind == "datetime":
+        return _check_datetime, _FAST_DATETIME, 0
+    if kind == "email":
+        return (_check_length(length, _check_email) if length else _check_email), _FAST_EMAIL, length
+    if kind in STRING_TYPES and length:
+        return _check_length(length), None, length
+    return None, None, 0
+
+
+class Column:
+    def __init__(self, index: int, name: str, field: Optional[dict], rule: Tuple[Optional[Check], Optional[str], int]):
+        self.index = index
+        self.name = name
+        self.field = field
+        self.check, pattern, self.max_length = rule
+        # Valores distintos unidos por "\n" casam com o padrão repetido em uma única chamada
+        self.pattern: Optional[Pattern] = re.compile(f"(?:{pattern})(?:\n(?:{pattern}))*") if pattern else None
+        # Vazio/#N/A rejeitados: obrigatórios no insert, Id no update, chave externa no upsert
+        self.required = False
+        self.nullable = True
+        self.picklist: Optional[PicklistField] = None
+        self.restricted = False
+        # Valores aceitos sem conversão; os demais são analisados (e memorizados) um a um
+        self.accepted: FrozenSet[str] = frozenset()
+        self.verdicts: Dict[str, Tuple[Optional[str], List[str]]] = {}
+        self.controller: Optional[int] = None
+        self.pairs: Dict[Tuple[str, str], List[str]] = {}
+
+    def fast(self, values: Set[str]) -> bool:
+        if self.max_length and max(map(len, values)) > self.max_length:
+            return False
+        if self.pattern is not None:
+            joined = "\n".join(values)
+            # Um valor com quebra de linha poderia casar como dois: nesse caso vai para a checagem exata
+            if joined.count("\n") != len(values) - 1 or not self.pattern.fullmatch(joined):
+                return False
+        return True
+
+
+class ValidationReport:
+    # Resultado de uma passagem de validação; as linhas rejeitadas ficam em disco
+    def __init__(self, object_name: str, operation: str, rejects_dir: str):
+        self.id = uuid.uuid4().hex
+        self.object_name = object_name
+        self.operation = operation
+        self.rejects_path = os.path.join(rejects_dir, f"{self.id}.csv")
+        self.rows = 0
+        self.valid = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.warnings: List[str] = []
+        self.errors_by_field: Counter = Counter()
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "object": self.object_name,
+            "operation": self.operation,
+            "rows": self.rows,
+            "valid": self.valid,
+            "rejected": self.rejected,
+            "bytes": self.bytes,
+            "warnings": self.warnings,
+            "errors_by_field": dict(self.errors_by_field.most_common()),
+            "rejects": self.rejected > 0,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class CsvValidator:
+    # Valida um CSV de ingestão contra o describe em uma única passagem, bloco a bloco: as linhas
+    # válidas seguem byte a byte para o upload e as rejeitadas vão para um CSV com os motivos.
+    def __init__(
+        self,
+        describe: dict,
+        operation: str,
+        report: ValidationReport,
+        external_id: Optional[str] = None,
+        index: Optional[PicklistIndex] = None,
+        delimiter: str = ",",
+        map_picklists: bool = False,
+        active_only: bool = True,
+    ):
+        if operation not in OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"Operação inválida: {operation}")
+        self.describe = describe
+        self.operation = operation
+        self.report = report
+        self.external_id = external_id
+        self.index = index or PicklistIndex(describe)
+        self.delimiter = delimiter
+        self.map_picklists = map_picklists
+        self.active_only = active_only
+        self.fields: Dict[str, dict] = {f["name"].lower(): f for f in describe.get("fields") or []}
+        self.relationships: Dict[str, dict] = {
+            f["relationshipName"].lower(): f for f in describe.get("fields") or [] if f.get("relationshipName")
+        }
+        # Aspas só abrem após delimitador/quebra de linha e só fecham antes deles ("" escapa): se o bloco
+        # todo segue essa forma, a paridade das aspas delimita os mesmos registros que o csv.reader
+        sep = re.escape(delimiter).encode()
+        self._well_quoted: Pattern = re.compile(
+            rb'(?:[^"]*(?<![^%s\r\n])"[^"]*(?:""[^"]*)*"(?![^%s\r\n]))*[^"]*' % (sep, sep)
+        )
+        self.header: Optional[List[str]] = None
+        self.columns: List[Column] = []
+        self.width = 0
+        self._lineterminator = "\n"
+        self._records = 0
+        self._rejects = None
+        self._writer = None
+
+    def _writable(self, field: dict) -> bool:
+        if self.operation == "insert":
+            return bool(field.get("createable"))
+        if self.operation == "update":
+            return bool(field.get("updateable"))
+        return bool(field.get("createable") or field.get("updateable"))
+
+    def prepare(self, header: List[str]) -> None:
+        errors: List[str] = []
+        columns: List[Column] = []
+        seen: Dict[str, int] = {}
+        for i, name in enumerate(header):
+            key = name.strip().lower()
+            if key in seen:
+                errors.append(f"{name}: coluna duplicada")
+            seen[key] = i
+            if self.operation in ("delete", "hardDelete"):
+                if key != "id":
+                    errors.append(f"{name}: apenas a coluna Id é aceita em {self.operation}")
+                columns.append(Column(i, name, self.fields.get("id"), (_check_id, _FAST_ID, 0)))
+                continue
+            if "." in key:
+                # Referência por chave externa: Relacionamento.CampoExterno (ou Relacionamento:Tipo.Campo)
+                relationship = key.split(".", 1)[0].split(":", 1)[0]
+                field = self.relationships.get(relationship)
+                if field is None:
+                    errors.append(f"{name}: relacionamento inexistente em {self.describe.get('name')}")
+                elif not self._writable(field):
+                    errors.append(f"{name}: {field['name']} não pode ser gravado em {self.operation}")
+                columns.append(Column(i, name, field, (None, None, 0)))
+                continue
+            field = self.fields.get(key)
+            if field is None:
+                errors.append(f"{name}: campo inexistente em {self.describe.get('name')}")
+                columns.append(Column(i, name, None, (None, None, 0)))
+                continue
+            if (key != "id" or self.operation == "insert") and not self._writable(field):
+                errors.append(f"{name}: campo não pode ser gravado em {self.operation}")
+            column = Column(i, name, field, field_check(field))
+            column.nullable = bool(field.get("nillable", True)) or field.get("type") == "boolean"
+            pf = self.index.fields.get(field["name"])
+            if pf is not None:
+                column.picklist = pf
+                column.restricted = bool(field.get("restrictedPicklist"))
+                column.accepted = pf.active if self.active_only else frozenset(pf.values)
+            columns.append(column)
+        by_name = {c.field["name"]: c for c in columns if c.field is not None and "." not in c.name}
+        for column in columns:
+            if column.picklist is not None and column.picklist.allowed_by_controller:
+                controller = by_name.get(column.picklist.controller)
+                column.controller = controller.index if controller is not None else None
+        if self.operation in ("update", "delete", "hardDelete"):
+            if "id" not in seen:
+                errors.append(f"coluna Id obrigatória em {self.operation}")
+            else:
+                columns[seen["id"]].required = True
+        if self.operation == "upsert":
+            key = (self.external_id or "").lower()
+            field = self.fields.get(key)
+            if not key:
+                errors.append("externalIdFieldName obrigatório em upsert")
+            elif field is None or not (key == "id" or field.get("externalId") or field.get("idLookup")):
+                errors.append(f"{self.external_id}: não é um campo de Id externo")
+            elif key not in seen:
+                errors.append(f"coluna {self.external_id} (Id externo) obrigatória em upsert")
+            else:
+                columns[seen[key]].required = True
+        if self.operation in ("insert", "upsert"):
+            for field in self.fields.values():
+                name = field["name"]
+                if (
+                    field.get("nillable", True)
+                    or not field.get("createable")
+                    or field.get("defaultedOnCreate")
+                    or field.get("type") == "boolean"
+                ):
+                    continue
+                if name.lower() in seen:
+                    columns[seen[name.lower()]].required = self.operation == "insert"
+                elif self.operation == "insert":
+                    errors.append(f"coluna {name} obrigatória em insert")
+                else:
+                    # No upsert só as linhas que criam registros exigem o campo
+                    self.report.warnings.append(f"coluna {name} ausente: linhas que criarem registros serão recusadas")
+        if errors:
+            raise HTTPException(status_code=400, detail={"message": "Cabeçalho do CSV inválido", "errors": errors})
+        self.header = header
+        self.columns = [c for c in columns if c.check or c.required or not c.nullable or c.picklist]
+        self.width = len(header)
+
+    def _picklist(self, column: Column, value: str) -> Tuple[Optional[str], List[str]]:
+        # (valor convertido ou None, erros) para um valor fora de column.accepted
+        verdict = column.verdicts.get(value)
+        if verdict is not None:
+            return verdict
+        pf = column.picklist
+        errors: List[str] = []
+        parts = [p.strip() for p in value.split(";") if p.strip()] if pf.type == "multipicklist" else [value]
+        lookup = pf.lookup_active if self.active_only else pf.lookup_all
+        mapped: List[str] = []
+        for part in parts:
+            if part in lookup:
+                mapped.append(lookup[part] if self.map_picklists else part)
+                if not self.map_picklists and lookup[part] != part:
+                    errors.append(f"label '{part}' em vez do valor (use mapPicklists)")
+            elif part in pf.lookup_all:
+                mapped.append(part)
+                errors.append(f"valor inativo '{part}'")
+            else:
+                mapped.append(part)
+                # Picklists não restritas aceitam valores fora da lista
+                if column.restricted:
+                    errors.append(f"valor inválido '{part}'")
+        new_value = ";".join(mapped) if pf.type == "multipicklist" else mapped[0]
+        verdict = (new_value if new_value != value else None), errors
+        if len(column.verdicts) < VERDICT_CACHE_SIZE:
+            column.verdicts[value] = verdict
+        return verdict
+
+    def _dependency(self, column: Column, controller: str, value: str) -> List[str]:
+        key = (controller, value)
+        errors = column.pairs.get(key)
+        if errors is not None:
+            return errors
+        pf = column.picklist
+        cpf = self.index.fields.get(pf.controller)
+        if cpf is None:
+            # Controlador checkbox
+            controller = "true" if controller.lower() in ("true", "1", "yes") else "false"
+        elif self.map_picklists:
+            controller = cpf.lookup_all.get(controller, controller)
+        if self.map_picklists:
+            value = self._picklist(column, value)[0] or value
+        selected = [p.strip() for p in value.split(";") if p.strip()] if pf.type == "multipicklist" else [value]
+        allowed = pf.allowed_by_controller.get(controller, frozenset())
+        errors = [f"'{v}' não é permitido para {pf.controller}='{controller}'" for v in selected if v not in allowed]
+        if len(column.pairs) < VERDICT_CACHE_SIZE:
+            column.pairs[key] = errors
+        return errors
+
+    def check_rows(self, rows: List[List[str]]) -> Tuple[Dict[int, List[str]], Dict[int, Dict[int, str]]]:
+        # Checagem por coluna: cada valor distinto do bloco é avaliado uma vez; as linhas só são
+        # percorridas quando algum valor falha ou precisa de conversão.
+        # Devolve ({linha: erros}, {linha: {coluna: valor convertido}}), indexados por posição em rows
+        errors: Dict[int, List[str]] = {}
+        rewrites: Dict[int, Dict[int, str]] = {}
+        if not rows:
+            return errors, rewrites
+        table: Dict[int, List[str]] = {}
+
+        def values_of(index: int) -> List[str]:
+            if index not in table:
+                table[index] = list(map(itemgetter(index), rows))
+            return table[index]
+
+        for column in self.columns:
+            values = values_of(column.index)
+            distinct = set(values)
+            bad: Dict[str, List[str]] = {}
+            mapped: Dict[str, str] = {}
+            for empty in ("", NULL_MARKER):
+                if empty in distinct:
+                    distinct.discard(empty)
+                    if column.required or (empty == NULL_MARKER and not column.nullable):
+                        bad[empty] = ["obrigatório"]
+            if column.check is not None and distinct and not column.fast(distinct):
+                for value in distinct:
+                    err = column.check(value)
+                    if err:
+                        bad[value] = [err]
+            if column.picklist is not None and distinct:
+                for value in distinct - column.accepted:
+                    if value in bad:
+                        continue
+                    new_value, errs = self._picklist(column, value)
+                    if errs:
+                        bad[value] = errs
+                    elif new_value is not None:
+                        mapped[value] = new_value
+            if column.controller is not None and distinct:
+                for controller, value in set(zip(values_of(column.controller), values)):
+                    if controller in ("", NULL_MARKER) or value in ("", NULL_MARKER) or value in bad:
+                        continue
+                    errs = self._dependency(column, controller, value)
+                    if errs:
+                        for i, (c, v) in enumerate(zip(values_of(column.controller), values)):
+                            if c == controller and v == value:
+                                errors.setdefault(i, []).extend(f"{column.name}: {e}" for e in errs)
+            if bad:
+                for i, value in enumerate(values):
+                    if value in bad:
+                        errors.setdefault(i, []).extend(f"{column.name}: {e}" for e in bad[value])
+            if mapped:
+                for i, value in enumerate(values):
+                    if value in mapped:
+                        rewrites.setdefault(i, {})[column.index] = mapped[value]
+        return errors, rewrites
+
+    def _reject(self, line: int, row: List[str], errors: List[str]) -> None:
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.report.rejects_path) or ".", exist_ok=True)
+            self._rejects = open(self.report.rejects_path, "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._rejects, lineterminator=self._lineterminator)
+            self._writer.writerow(["linha", "erros"] + list(self.header or []))
+        self._writer.writerow([line, "; ".join(errors)] + row)
+        self.report.rejected += 1
+        for err in errors:
+            self.report.errors_by_field[err.split(":", 1)[0]] += 1
+
+    def process_block(self, block: bytes) -> bytes:
+        # Síncrono (roda em thread): o bloco sempre termina em fim de linha do CSV
+        self.report.bytes += len(block)
+        offset = 3 if self.header is None and block.startswith(b"\xef\xbb\xbf") else 0
+        rows, lines = self._parse(block, offset)
+        out = io.BytesIO()
+        spans: Optional[Tuple[List[int], List[int]]] = None
+        first = 0
+        body = 0
+        if self.header is None:
+            while first < len(rows) and not rows[first]:
+                first += 1
+            if first == len(rows):
+                return b""
+            spans = self._spans(block, offset, lines)
+            header = block[spans[0][first]:spans[1][first]]
+            self._lineterminator = "\r\n" if header.endswith(b"\r\n") else "\n"
+            self.prepare(rows[first])
+            out.write(header)
+            body = spans[1][first]
+            first += 1
+            self._records = first
+        base = self._records - first
+        self._records += len(rows) - first
+        skip: Dict[int, Optional[List[str]]] = {}
+        if not all(rows[first:]):
+            skip.update((i, None) for i in range(first, len(rows)) if not rows[i])
+        if set(map(len, rows[first:])) - {self.width, 0}:
+            for i in range(first, len(rows)):
+                if rows[i] and len(rows[i]) != self.width:
+                    skip[i] = [f"colunas: esperadas {self.width}, encontradas {len(rows[i])}"]
+        if lines is not None:
+            # Aspas soltas (ex.: TV 5" tela): o registro é ambíguo para a Bulk API e seria gravado
+            # diferente do que o parser leu
+            spans = spans or self._spans(block, offset, lines)
+            for i in range(first, len(rows)):
+                if rows[i] and block.count(b'"', spans[0][i], spans[1][i]) % 2:
+                    skip[i] = ["aspas: sem fechamento no registro"]
+        positions = [i for i in range(first, len(rows)) if i not in skip] if skip else range(first, len(rows))
+        errors, rewrites = self.check_rows([rows[i] for i in positions] if skip else rows[first:])
+        for k, errs in errors.items():
+            skip[positions[k]] = errs
+        replaced: Dict[int, bytes] = {}
+        for k, changes in rewrites.items():
+            i = positions[k]
+            if i not in skip:
+                row = list(rows[i])
+                for index, value in changes.items():
+                    row[index] = value
+                replaced[i] = self._encode(row)
+        if not skip and not replaced:
+            # Caso comum: o bloco inteiro segue sem alterações
+            out.write(block[body:])
+        else:
+            # Trechos contíguos de linhas válidas seguem com os bytes originais (aspas e quebras preservadas)
+            starts, ends = spans or self._spans(block, offset, lines)
+            cursor = starts[first] if first < len(rows) else len(block)
+            for i in sorted(skip.keys() | replaced.keys()):
+                out.write(block[cursor:starts[i]])
+                cursor = ends[i]
+                if i in replaced:
+                    out.write(replaced[i])
+                elif skip[i] is not None:
+                    # Número do registro no arquivo, contando o cabeçalho como 1
+                    self._reject(base + i + 1, rows[i], skip[i])
+            out.write(block[cursor:])
+        blank = sum(1 for v in skip.values() if v is None)
+        self.report.rows += len(rows) - first - blank
+        self.report.valid = self.report.rows - self.report.rejected
+        data = out.getvalue()
+        if data and not data.endswith(b"\n"):
+            data += self._lineterminator.encode()
+        return data
+
+    def _parse(self, block: bytes, offset: int) -> Tuple[List[List[str]], Optional[List[int]]]:
+        # Registros do bloco e, se as aspas estiverem malformadas, quantas linhas físicas o parser
+        # consumiu até o fim de cada um (a paridade das aspas deixa de delimitar os registros)
+        reader = csv.reader(io.StringIO(block[offset:].decode("utf-8"), newline=""), delimiter=self.delimiter)
+        rows: List[List[str]] = []
+        lines: Optional[List[int]] = None
+        try:
+            if b'"' not in block or self._well_quoted.fullmatch(block, offset):
+                rows = list(reader)
+            else:
+                lines = []
+                for row in reader:
+                    rows.append(row)
+                    lines.append(reader.line_num)
+        except csv.Error as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"CSV malformado perto do registro {self._records + len(rows) + 1}: {e}",
+            )
+        return rows, lines
+
+    def _spans(self, block: bytes, offset: int, lines: Optional[List[int]]) -> Tuple[List[int], List[int]]:
+        # (inícios, fins) em bytes de cada registro; cada registro do csv.reader corresponde a um
+        # fim de linha (linhas em branco viram [])
+        if lines is None:
+            ends, _ = csv_row_ends(block, False)
+        else:
+            breaks = [m.end() for m in _LINE_END_RE.finditer(block, offset)]
+            ends = [breaks[n - 1] if n <= len(breaks) else len(block) for n in lines]
+        if not ends or ends[-1] != len(block):
+            ends.append(len(block))
+        return [offset] + ends[:-1], ends
+
+    def _encode(self, row: List[str]) -> bytes:
+        buf = io.StringIO()
+        csv.writer(buf, delimiter=self.delimiter, lineterminator=self._lineterminator).writerow(row)
+        return buf.getvalue().encode("utf-8")
+
+    def finish(self) -> None:
+        if self._rejects is not None:
+            self._rejects.close()
+            self._rejects = None
+        if self.report.finished_at is None:
+            self.report.finished_at = time.time()
+
+    async def stream(self, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        # Parsing e checagens saem do event loop: cada bloco é processado em uma thread
+        try:
+            async for block in iter_csv_blocks(source):
+                data = await asyncio.to_thread(self.process_block, block)
+                if data:
+                    yield data
+            if self.header is None:
+                raise HTTPException(status_code=400, detail="CSV vazio")
+        finally:
+            await asyncio.to_thread(self.finish)
+
+    async def start(self, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        # Valida o cabeçalho antes de devolver o stream: erros viram 400 antes de qualquer upload
+        stream = self.stream(source)
+        first = await stream.__anext__()
+
+        async def chained() -> AsyncIterator[bytes]:
+            yield first
+            async for data in stream:
+                yield data
+        return chained()
@@ -1,17 +1,43 @@
+import asyncio
+import logging
 import os
-from typing import Optional
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import httpx
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.requests import Request
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
+from app.bulk_ingest import BulkIngestAggregate, iter_spooled, spool_stream, stream_ingest
+from app.bulk_orchestrator import BulkJobOrchestrator
+from app.bulk_query import BulkQueryDownload, ensure_job_complete
+from app.csv_validation import DELIMITERS, CsvValidator, ValidationReport
+from app.jsoncodec import JSONResponse, dumps, loads
+from app.metadata_cache import CacheEntry, MetadataCache, MetadataStore
+from app.picklists import PicklistIndex, transform_csv
+from app.metrics import Metrics, MetricsMiddleware, counter_value, gauge
+from app.mirror import MirrorStore, SObjectMirror, UnsupportedQuery
+from app.query_cache import QueryCache, normalize_soql, primary_object, written_objects
+from app.shared_state import ConfigRecord, MemoryStateStore, StateStore, TokenRecord, config_fingerprint, create_state_store
+from app.schema_graph import ObjectSchema, SchemaGraph
+from app.ratelimit import BATCH, INTERACTIVE, CircuitBreaker, RateLimiter, TrafficPool
+from app.record_writer import COMPOSITE_BATCH_SIZE, InvalidRecord, iter_json_array, iter_ndjson, write_records
+from app.soql_stream import QueryStreamStats, csv_stream, ndjson_stream, select_columns
+
 load_dotenv()
 
+logger = logging.getLogger("mapeamentofoco")
+
 FOCO_BASE_URL = os.getenv("FOCO_BASE_URL", "https://hlg-gateway.sebrae.com.br/foco-stg")
 FOCO_LOGIN_URL = os.getenv("FOCO_LOGIN_URL", "https://hlg-gateway.sebrae.com.br/foco-stg/services/oauth2/token")
 FOCO_CLIENT_ID = os.getenv("FOCO_CLIENT_ID")
@@ -26,6 +52,172 @@ FOCO_DOCS_URL = os.getenv(
     "https://anypoint.mulesoft.com/exchange/portals/sebrae-2/a7bc5ec0-9afc-42bf-bc65-96a43cd68385/mapeamento-sas-x-foco/minor/1.0/console/summary/",
 )
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Transporte HTTP compartilhado (pool de conexões com o gateway)
+FOCO_HTTP_MAX_CONNECTIONS = int(_env_float("FOCO_HTTP_MAX_CONNECTIONS", 100))
+FOCO_HTTP_MAX_KEEPALIVE = int(_env_float("FOCO_HTTP_MAX_KEEPALIVE", 20))
+FOCO_HTTP_KEEPALIVE_EXPIRY = _env_float("FOCO_HTTP_KEEPALIVE_EXPIRY", 30.0)
+FOCO_HTTP_CONNECT_TIMEOUT = _env_float("FOCO_HTTP_CONNECT_TIMEOUT", 10.0)
+FOCO_HTTP_POOL_TIMEOUT = _env_float("FOCO_HTTP_POOL_TIMEOUT", 10.0)
+FOCO_HTTP2 = _env_bool("FOCO_HTTP2", False)
+
+# Timeouts (leitura/escrita, em segundos) por operação do FOCOClient.
+# Podem ser sobrescritos com FOCO_TIMEOUT_<OPERACAO>, ex.: FOCO_TIMEOUT_QUERY=120
+DEFAULT_OPERATION_TIMEOUTS: Dict[str, float] = {
+    "default": 30.0,
+    "query": 60.0,
+    "composite": 60.0,
+    "composite_sobjects": 60.0,
+    "bulk_upload_batch": 60.0,
+    "bulk_results": 60.0,
+}
+
+# Ciclo de vida do token: validade assumida quando o gateway não informa expires_in
+# e antecedência com que o token é renovado em segundo plano
+FOCO_TOKEN_TTL = _env_float("FOCO_TOKEN_TTL", 7200.0)
+FOCO_TOKEN_REFRESH_MARGIN = _env_float("FOCO_TOKEN_REFRESH_MARGIN", 300.0)
+
+# Cache de metadados (sobjects/describe): TTL (s), tamanho do LRU e arquivo de persistência
+# (FOCO_METADATA_CACHE_PATH vazio desativa a persistência em disco). Entradas vencidas ainda servem
+# para revalidar com ETag; no disco são apagadas após FOCO_METADATA_CACHE_DISK_MAX_AGE (s; 0 = nunca)
+FOCO_METADATA_CACHE_TTL = _env_float("FOCO_METADATA_CACHE_TTL", 3600.0)
+FOCO_METADATA_CACHE_MAX_ENTRIES = int(_env_float("FOCO_METADATA_CACHE_MAX_ENTRIES", 256))
+FOCO_METADATA_CACHE_PATH = os.getenv("FOCO_METADATA_CACHE_PATH", ".cache/foco_metadata.sqlite3")
+FOCO_METADATA_CACHE_DISK_MAX_AGE = _env_float("FOCO_METADATA_CACHE_DISK_MAX_AGE", 7 * 86400.0)
+
+# Describe em lote: describes simultâneos e uso do composite/batch (até 25 describes por chamada)
+# para os objetos que ainda não estão no cache
+FOCO_DESCRIBE_CONCURRENCY = int(_env_float("FOCO_DESCRIBE_CONCURRENCY", 8))
+FOCO_DESCRIBE_COMPOSITE = _env_bool("FOCO_DESCRIBE_COMPOSITE", True)
+
+# Métricas: cabeçalho Server-Timing (tempo no gateway x local) e validade do resultado de /api/ready (s)
+FOCO_SERVER_TIMING = _env_bool("FOCO_SERVER_TIMING", False)
+FOCO_READY_CACHE_TTL = _env_float("FOCO_READY_CACHE_TTL", 10.0)
+
+# Estado compartilhado entre workers (token, instance_url e configuração): backend sqlite (padrão) ou memory,
+# intervalo mínimo entre leituras do estado (s) e prazo máximo de um lock entre processos (s)
+FOCO_STATE_BACKEND = os.getenv("FOCO_STATE_BACKEND", "sqlite")
+FOCO_STATE_PATH = os.getenv("FOCO_STATE_PATH", ".cache/foco_state.sqlite3")
+FOCO_STATE_SYNC_INTERVAL = _env_float("FOCO_STATE_SYNC_INTERVAL", 1.0)
+FOCO_STATE_LOCK_TTL = _env_float("FOCO_STATE_LOCK_TTL", 60.0)
+
+# Cache de resultados de /api/query (opt-in): TTL padrão (s) e memória máxima (bytes)
+FOCO_QUERY_CACHE_ENABLED = _env_bool("FOCO_QUERY_CACHE_ENABLED", False)
+FOCO_QUERY_CACHE_TTL = _env_float("FOCO_QUERY_CACHE_TTL", 60.0)
+FOCO_QUERY_CACHE_MAX_BYTES = int(_env_float("FOCO_QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Escrita em lotes via composite/sobjects: lotes enviados em paralelo
+FOCO_COMPOSITE_CONCURRENCY = int(_env_float("FOCO_COMPOSITE_CONCURRENCY", 4))
+
+# Bulk API v2 (Ingest): limites por job usados para dividir uploads grandes em vários jobs
+# (o Salesforce aceita até 150 MB por job; 0 em FOCO_BULK_MAX_JOB_RECORDS desativa o limite de registros)
+FOCO_BULK_MAX_JOB_BYTES = int(_env_float("FOCO_BULK_MAX_JOB_BYTES", 100 * 1024 * 1024))
+FOCO_BULK_MAX_JOB_RECORDS = int(_env_float("FOCO_BULK_MAX_JOB_RECORDS", 0)) or None
+
+# Acompanhamento de jobs no servidor: intervalo mínimo/máximo do polling (s), polls simultâneos
+# e por quanto tempo jobs finalizados permanecem visíveis (s)
+FOCO_BULK_POLL_MIN_INTERVAL = _env_float("FOCO_BULK_POLL_MIN_INTERVAL", 1.0)
+FOCO_BULK_POLL_MAX_INTERVAL = _env_float("FOCO_BULK_POLL_MAX_INTERVAL", 30.0)
+FOCO_BULK_POLL_CONCURRENCY = int(_env_float("FOCO_BULK_POLL_CONCURRENCY", 8))
+FOCO_BULK_TRACK_RETENTION = _env_float("FOCO_BULK_TRACK_RETENTION", 3600.0)
+# Handles de upload (/api/bulk/ingest) e validações de CSV guardados em memória, por tipo; os
+# finalizados também expiram após FOCO_BULK_TRACK_RETENTION (com o CSV de linhas rejeitadas)
+FOCO_BULK_MAX_HANDLES = int(_env_float("FOCO_BULK_MAX_HANDLES", 1000))
+
+# Bulk API v2 (Query): páginas baixadas em paralelo, registros por página e pasta de downloads locais
+FOCO_BULK_QUERY_CONCURRENCY = int(_env_float("FOCO_BULK_QUERY_CONCURRENCY", 4))
+FOCO_BULK_QUERY_MAX_RECORDS = int(_env_float("FOCO_BULK_QUERY_MAX_RECORDS", 0)) or None
+FOCO_BULK_DOWNLOAD_DIR = os.getenv("FOCO_BULK_DOWNLOAD_DIR", ".cache/bulk")
+
+# Espelho local (SQLite) de objetos de referência: objetos (separados por vírgula; vazio desativa),
+# arquivo, intervalo entre sincronizações (s), folga aplicada às marcas d'água (s), idade máxima
+# aceita pelo modo auto de /api/query (s; 0 = 2x o intervalo) e origem padrão de /api/query
+FOCO_MIRROR_OBJECTS = [o.strip() for o in os.getenv("FOCO_MIRROR_OBJECTS", "").split(",") if o.strip()]
+FOCO_MIRROR_PATH = os.getenv("FOCO_MIRROR_PATH", ".cache/foco_mirror.sqlite3")
+FOCO_MIRROR_INTERVAL = _env_float("FOCO_MIRROR_INTERVAL", 300.0)
+FOCO_MIRROR_LAG = _env_float("FOCO_MIRROR_LAG", 60.0)
+FOCO_MIRROR_MAX_STALENESS = _env_float("FOCO_MIRROR_MAX_STALENESS", 0.0) or None
+FOCO_MIRROR_QUERY_SOURCE = os.getenv("FOCO_MIRROR_QUERY_SOURCE", "gateway").strip().lower()
+if FOCO_MIRROR_QUERY_SOURCE not in ("gateway", "local", "auto"):
+    FOCO_MIRROR_QUERY_SOURCE = "gateway"
+
+# Limitação de taxa: requisições/s, rajada e concorrência por classe de tráfego (interativo x lotes),
+# desaceleração pelo consumo em Sforce-Limit-Info, retentativas 429/503 e circuit breaker
+FOCO_RATE_LIMIT_ENABLED = _env_bool("FOCO_RATE_LIMIT_ENABLED", True)
+FOCO_RATE_INTERACTIVE_RPS = _env_float("FOCO_RATE_INTERACTIVE_RPS", 20.0)
+FOCO_RATE_INTERACTIVE_BURST = _env_float("FOCO_RATE_INTERACTIVE_BURST", 40.0)
+FOCO_RATE_INTERACTIVE_CONCURRENCY = int(_env_float("FOCO_RATE_INTERACTIVE_CONCURRENCY", 16))
+FOCO_RATE_BATCH_RPS = _env_float("FOCO_RATE_BATCH_RPS", 10.0)
+FOCO_RATE_BATCH_BURST = _env_float("FOCO_RATE_BATCH_BURST", 20.0)
+FOCO_RATE_BATCH_CONCURRENCY = int(_env_float("FOCO_RATE_BATCH_CONCURRENCY", 8))
+FOCO_RATE_SOFT_LIMIT = _env_float("FOCO_RATE_SOFT_LIMIT", 0.8)
+FOCO_RATE_HARD_LIMIT = _env_float("FOCO_RATE_HARD_LIMIT", 0.95)
+FOCO_RETRY_MAX = int(_env_float("FOCO_RETRY_MAX", 3))
+FOCO_RETRY_BASE_DELAY = _env_float("FOCO_RETRY_BASE_DELAY", 0.5)
+FOCO_RETRY_MAX_DELAY = _env_float("FOCO_RETRY_MAX_DELAY", 30.0)
+FOCO_CIRCUIT_THRESHOLD = int(_env_float("FOCO_CIRCUIT_THRESHOLD", 5))
+FOCO_CIRCUIT_COOLDOWN = _env_float("FOCO_CIRCUIT_COOLDOWN", 30.0)
+
+_SOBJECT_PATH_RE = re.compile(r"/sobjects/([A-Za-z_][A-Za-z0-9_]*)")
+
+def _sobject_label(url: str, params: object) -> str:
+    # sObject da chamada para as métricas: caminho /sobjects/<Nome> ou FROM da SOQL
+    match = _SOBJECT_PATH_RE.search(url)
+    if match:
+        return match.group(1)
+    if isinstance(params, dict) and isinstance(params.get("q"), str):
+        return primary_object(params["q"]) or ""
+    return ""
+
+def _upstream_encoding(accept_encoding: Optional[str]) -> str:
+    # Em passthrough o corpo segue comprimido até o cliente: só pede gzip se ele aceitar.
+    # Sem cabeçalho (None), o consumidor é interno e o httpx descomprime.
+    if accept_encoding is None:
+        return "gzip, deflate"
+    return "gzip" if _accepts_gzip(accept_encoding) else "identity"
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    # "gzip;q=0" recusa explicitamente; "*" vale para gzip quando ele não aparece na lista
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip()] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+def _load_operation_timeouts() -> Dict[str, float]:
+    timeouts = dict(DEFAULT_OPERATION_TIMEOUTS)
+    prefix = "FOCO_TIMEOUT_"
+    for key, value in os.environ.items():
+        if key.startswith(prefix) and key != prefix:
+            op = key[len(prefix):].lower()
+            try:
+                timeouts[op] = float(value)
+            except ValueError:
+                pass
+    return timeouts
+
 class ConfigUpdate(BaseModel):
     base_url: Optional[str] = None
     login_url: Optional[str] = None
@@ -37,8 +229,11 @@ class ConfigUpdate(BaseModel):
     security_token: Optional[str] = None
     grant_type: Optional[str] = None
 
+# Campos de configuração do cliente compartilhados entre workers (POST /api/config)
+CONFIG_FIELDS = ("base_url", "login_url", "api_version", "client_id", "client_secret", "username", "password", "security_token", "grant_type")
+
 class FOCOClient:
-    def __init__(self, base_url: str, login_url: str, client_id: str, client_secret: str, username: str, password: str, security_token: str, api_version: str, grant_type: str = "password"):
+    def __init__(self, base_url: str, login_url: str, client_id: str, client_secret: str, username: str, password: str, security_token: str, api_version: str, grant_type: str = "password", state: Optional[StateStore] = None):
         # Sanitiza e normaliza URLs e grant_type
         self.base_url = (base_url or "").strip().strip('`"').rstrip("/")
         _login = (login_url or "").strip().strip('`"')
@@ -52,208 +247,898 @@ class FOCOClient:
         self.grant_type = (grant_type or "password").strip().lower()
         self.access_token: Optional[str] = None
         self.instance_url: Optional[str] = None
+        # Cliente httpx único por processo (criado no lifespan ou sob demanda)
+        self.max_connections = FOCO_HTTP_MAX_CONNECTIONS
+        self.max_keepalive_connections = FOCO_HTTP_MAX_KEEPALIVE
+        self.keepalive_expiry = FOCO_HTTP_KEEPALIVE_EXPIRY
+        self.connect_timeout = FOCO_HTTP_CONNECT_TIMEOUT
+        self.pool_timeout = FOCO_HTTP_POOL_TIMEOUT
+        self.http2 = FOCO_HTTP2
+        self.timeouts: Dict[str, float] = _load_operation_timeouts()
+        self._http: Optional[httpx.AsyncClient] = None
+        # Token: login single-flight, variante de login memorizada e renovação antecipada
+        self.token_ttl = FOCO_TOKEN_TTL
+        self.token_refresh_margin = FOCO_TOKEN_REFRESH_MARGIN
+        self.token_issued_at: Optional[float] = None
+        self.token_expires_at: Optional[float] = None
+        self.login_count = 0
+        self.refresh_count = 0
+        self._login_variant: Optional[str] = None
+        self._login_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Token e configuração compartilhados entre workers; a versão detecta mudanças de config
+        self.state: StateStore = state or MemoryStateStore()
+        self.config_version = 0
+        self.state_sync_interval = FOCO_STATE_SYNC_INTERVAL
+        self.state_lock_ttl = FOCO_STATE_LOCK_TTL
+        self._env_fingerprint = config_fingerprint(self.config_dict())
+        self._state_bootstrapped = False
+        self._state_checked_at = 0.0
+        # Índices de picklist por describe (reconstruídos só quando o describe muda)
+        self._picklist_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+        # Resumos de describe (mesma regra) e o grafo de relacionamentos dos objetos já explorados
+        self._object_schemas: "OrderedDict[str, tuple]" = OrderedDict()
+        self.schema_graph: Optional[SchemaGraph] = None
+        # Nomes da lista sobjects em cache (minúsculo → nome original), usados no rótulo das métricas
+        self._sobject_names: Optional[tuple] = None
+        store = (
+            MetadataStore(FOCO_METADATA_CACHE_PATH, max_age=max(FOCO_METADATA_CACHE_DISK_MAX_AGE, 0) or None)
+            if FOCO_METADATA_CACHE_PATH
+            else None
+        )
+        self.metadata_cache = MetadataCache(
+            max_entries=FOCO_METADATA_CACHE_MAX_ENTRIES,
+            ttl=FOCO_METADATA_CACHE_TTL,
+            store=store,
+        )
+        # Resultados de SOQL (invalidados por escritas nos objetos consultados)
+        self.query_cache_enabled = FOCO_QUERY_CACHE_ENABLED
+        self.query_cache = QueryCache(max_bytes=FOCO_QUERY_CACHE_MAX_BYTES, ttl=FOCO_QUERY_CACHE_TTL)
+        self._in_flight = 0
+        self._requests_total = 0
+        self.metrics = Metrics()
+        self._ready: Optional[tuple] = None
+        self.rate_limiter = RateLimiter(
+            pools={
+                INTERACTIVE: TrafficPool(INTERACTIVE, FOCO_RATE_INTERACTIVE_RPS, FOCO_RATE_INTERACTIVE_BURST, FOCO_RATE_INTERACTIVE_CONCURRENCY),
+                BATCH: TrafficPool(BATCH, FOCO_RATE_BATCH_RPS, FOCO_RATE_BATCH_BURST, FOCO_RATE_BATCH_CONCURRENCY),
+            },
+            soft_limit=FOCO_RATE_SOFT_LIMIT,
+            hard_limit=FOCO_RATE_HARD_LIMIT,
+            max_retries=FOCO_RETRY_MAX,
+            base_delay=FOCO_RETRY_BASE_DELAY,
+            max_delay=FOCO_RETRY_MAX_DELAY,
+            breaker=CircuitBreaker(FOCO_CIRCUIT_THRESHOLD, FOCO_CIRCUIT_COOLDOWN),
+            enabled=FOCO_RATE_LIMIT_ENABLED,
+        )
 
-    async def login(self) -> str:
+    # -----------------------------
+    # Transporte HTTP compartilhado
+    # -----------------------------
+    def _build_http_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                # HTTP/2 requer o extra httpx[http2]; sem ele seguimos em HTTP/1.1
+                http2 = False
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        return httpx.AsyncClient(limits=limits, timeout=self._timeout("default"), http2=http2)
+
+    async def start(self) -> None:
+        if self._http is None or self._http.is_closed:
+            self._http = self._build_http_client()
+
+    async def aclose(self) -> None:
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # Fallback para uso fora do lifespan (scripts, testes)
+        if self._http is None or self._http.is_closed:
+            self._http = self._build_http_client()
+        return self._http
+
+    def _timeout(self, operation: str) -> httpx.Timeout:
+        value = self.timeouts.get(operation, self.timeouts.get("default", 30.0))
+        return httpx.Timeout(value, connect=self.connect_timeout, pool=self.pool_timeout)
+
+    async def _send(self, operation: str, method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", self._timeout(operation))
+
+        sobject = self._known_sobject(_sobject_label(url, kwargs.get("params")))
+
+        async def send() -> httpx.Response:
+            self._in_flight += 1
+            self._requests_total += 1
+            started = time.perf_counter()
+            status = "error"
+            request_bytes = response_bytes = 0
+            try:
+                client = self._client()
+                if stream:
+                    # Corpo não é lido: o chamador consome com aiter_bytes() e fecha com aclose()
+                    resp = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                    response_bytes = int(resp.headers.get("Content-Length") or 0)
+                else:
+                    resp = await client.request(method, url, **kwargs)
+                    response_bytes = len(resp.content)
+                status = str(resp.status_code)
+                request_bytes = int(resp.request.headers.get("Content-Length") or 0)
+                return resp
+            finally:
+                self._in_flight -= 1
+                self.metrics.observe_upstream(operation, sobject, status, time.perf_counter() - started, request_bytes, response_bytes)
+
+        # Uploads em streaming não podem ser reenviados em caso de 429/503
+        replayable = isinstance(kwargs.get("content"), (bytes, str, type(None)))
+        return await self.rate_limiter.call(operation, send, replayable=replayable, method=method)
+
+    async def _request(self, operation: str, method: str, url: str, headers: Optional[dict] = None, auth: bool = True, stream: bool = False, **kwargs) -> httpx.Response:
+        if not auth:
+            return await self._send(operation, method, url, stream=stream, headers=headers, **kwargs)
+        token = await self._ensure_token()
+        resp = await self._send(operation, method, url, stream=stream, headers={**(headers or {}), "Authorization": f"Bearer {token}"}, **kwargs)
+        replayable = isinstance(kwargs.get("content"), (bytes, str, type(None)))
+        if resp.status_code == 401 and replayable:
+            # Token revogado/expirado no gateway: renova uma única vez e repete
+            await resp.aclose()
+            token = await self._ensure_token(stale_token=token)
+            resp = await self._send(operation, method, url, stream=stream, headers={**(headers or {}), "Authorization": f"Bearer {token}"}, **kwargs)
+        return resp
+
+    def pool_stats(self) -> dict:
+        stats = {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "http2": self.http2,
+            "timeouts": dict(self.timeouts),
+            "started": self._http is not None and not self._http.is_closed,
+            "in_flight": self._in_flight,
+            "requests_total": self._requests_total,
+            "connections": 0,
+            "active": 0,
+            "idle": 0,
+            "queued": 0,
+        }
+        # httpx não expõe o pool publicamente; lemos o pool do httpcore quando disponível
+        transport = getattr(self._http, "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        if pool is None:
+            return stats
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        stats["connections"] = len(connections)
+        stats["idle"] = idle
+        stats["active"] = len(connections) - idle
+        stats["queued"] = max(len(getattr(pool, "_requests", []) or []) - (len(connections) - idle), 0)
+        return stats
+
+    def _login_payload(self) -> dict:
         if self.grant_type == "client_credentials":
-            data = {
+            return {
                 "grant_type": "client_credentials",
                 "client_id": self.client_id,
                 "client_secret": self.client_secret,
             }
+        return {
+            "grant_type": "password",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "username": self.username,
+            "password": f"{self.password}{self.security_token}",
+        }
+
+    async def _login_attempt(self, variant: str, data: dict) -> httpx.Response:
+        if variant == "form":
+            # POST com corpo x-www-form-urlencoded
+            return await self._request("login", "POST", self.login_url, auth=False, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
+        if variant == "query":
+            # POST com querystring (alguns gateways exigem este formato)
+            return await self._request("login", "POST", self.login_url, auth=False, params=data)
+        # GET com querystring
+        return await self._request("login", "GET", self.login_url, auth=False, params=data)
+
+    async def _login_locked(self) -> str:
+        data = self._login_payload()
+        # Usa primeiro a variante que funcionou da última vez; as demais só como fallback
+        variants = ["form", "query", "get"]
+        if self._login_variant in variants:
+            variants.remove(self._login_variant)
+            variants.insert(0, self._login_variant)
+        resp = None
+        for variant in variants:
+            try:
+                resp = await self._login_attempt(variant, data)
+            except Exception:
+                if resp is None:
+                    raise
+                continue
+            if resp.status_code < 400:
+                self._login_variant = variant
+                break
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        body = resp.json()
+        self.access_token = body.get("access_token")
+        inst = body.get("instance_url")
+        if isinstance(inst, str):
+            inst_norm = inst.strip().strip('`"').strip()
+            if inst_norm:
+                self.instance_url = inst_norm
+        if not self.instance_url:
+            self.instance_url = self.base_url
+        self._set_token_times(body)
+        self.login_count += 1
+        # Publica para os demais workers (chamado sempre sob o lock "token" do estado compartilhado)
+        await asyncio.to_thread(self.state.save_token, self._token_record())
+        return self.access_token or ""
+
+    def _set_token_times(self, body: dict) -> None:
+        now = time.time()
+        issued_at = now
+        try:
+            # Salesforce retorna issued_at em milissegundos desde a época
+            issued = float(body.get("issued_at")) / 1000.0
+            # Ignora relógios muito divergentes do gateway
+            if abs(issued - now) < self.token_ttl:
+                issued_at = min(issued, now)
+        except (TypeError, ValueError):
+            pass
+        ttl = self.token_ttl
+        try:
+            ttl = float(body["expires_in"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        self.token_issued_at = issued_at
+        self.token_expires_at = issued_at + ttl
+
+    def _token_expired(self) -> bool:
+        return self.token_expires_at is not None and time.time() >= self.token_expires_at
+
+    def _token_needs_refresh(self) -> bool:
+        return self.token_expires_at is not None and time.time() >= self.token_expires_at - self.token_refresh_margin
+
+    def reset_token(self) -> None:
+        self.access_token = None
+        self.instance_url = None
+        self.token_issued_at = None
+        self.token_expires_at = None
+        self._login_variant = None
+
+    async def login(self) -> str:
+        # Login explícito: sempre renova, mas serializado com os demais logins (de todos os workers)
+        async with self._login_lock:
+            async with self.state.lock("token", ttl=self.state_lock_ttl):
+                await self.sync_state(force=True)
+                return await self._login_locked()
+
+    async def logout(self) -> None:
+        # Descarta o token em todos os workers; a próxima chamada faz um novo login
+        async with self._login_lock:
+            async with self.state.lock("token", ttl=self.state_lock_ttl):
+                await asyncio.to_thread(self.state.clear_token)
+                self.reset_token()
+
+    async def _ensure_token(self, stale_token: Optional[str] = None) -> str:
+        await self.sync_state()
+        token = self.access_token
+        if token and token != stale_token and not self._token_expired():
+            if self._token_needs_refresh():
+                self._schedule_refresh()
+            return token
+        async with self._login_lock:
+            async with self.state.lock("token", ttl=self.state_lock_ttl):
+                # Outro coroutine (ou outro worker) pode ter renovado enquanto aguardávamos o lock
+                await self.sync_state(force=True)
+                token = self.access_token
+                if token and token != stale_token and not self._token_expired():
+                    return token
+                if stale_token is not None:
+                    self.refresh_count += 1
+                return await self._login_locked()
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+
+    async def _background_refresh(self) -> None:
+        try:
+            async with self._login_lock:
+                async with self.state.lock("token", ttl=self.state_lock_ttl):
+                    await self.sync_state(force=True)
+                    if self.access_token and not self._token_needs_refresh():
+                        return
+                    await self._login_locked()
+                    self.refresh_count += 1
+        except Exception as e:
+            # Mantém o token atual; a próxima chamada tenta de novo (ou renova após 401)
+            logger.warning("Falha ao renovar token em segundo plano: %s", e)
+
+    async def readiness(self, max_age: float = 0.0) -> dict:
+        # Verifica de fato o token (login se preciso) e o gateway; o resultado vale por max_age segundos
+        now = time.monotonic()
+        if self._ready is not None and now - self._ready[0] < max_age:
+            return self._ready[1]
+        checks: Dict[str, dict] = {}
+        started = time.perf_counter()
+        try:
+            await self._ensure_token()
+            checks["token"] = {"ok": not self._token_expired(), "expires_at": self.token_expires_at}
+        except Exception as e:
+            checks["token"] = {"ok": False, "error": getattr(e, "detail", None) or str(e)}
+        if checks["token"]["ok"]:
+            url = f"{self._data_base()}/services/data/v{self.api_version}/"
+            try:
+                resp = await self._request("readiness", "GET", url)
+                checks["gateway"] = {"ok": resp.status_code < 400, "status": resp.status_code}
+            except Exception as e:
+                checks["gateway"] = {"ok": False, "error": getattr(e, "detail", None) or str(e)}
         else:
-            data = {
-                "grant_type": "password",
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "username": self.username,
-                "password": f"{self.password}{self.security_token}",
-            }
-        async with httpx.AsyncClient(timeout=30) as client:
-            # 1) POST com corpo x-www-form-urlencoded
-            resp = await client.post(self.login_url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
-            # 2) Fallback: POST com querystring (alguns gateways exigem este formato)
-            if resp.status_code >= 400:
-                try:
-                    resp = await client.post(self.login_url, params=data)
-                except Exception:
-                    pass
-            # 3) Fallback final: GET com querystring
-            if resp.status_code >= 400:
-                try:
-                    resp = await client.get(self.login_url, params=data)
-                except Exception:
-                    pass
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            body = resp.json()
-            self.access_token = body.get("access_token")
-            inst = body.get("instance_url")
-            if isinstance(inst, str):
-                inst_norm = inst.strip().strip('`"').strip()
-                if inst_norm:
-                    self.instance_url = inst_norm
-            if not self.instance_url:
-                self.instance_url = self.base_url
-            return self.access_token or ""
-
-    async def _auth_headers(self) -> dict:
-        if not self.access_token:
-            await self.login()
-        return {"Authorization": f"Bearer {self.access_token}"}
+            checks["gateway"] = {"ok": False, "error": "sem token válido"}
+        result = {
+            "ready": all(c["ok"] for c in checks.values()),
+            "checks": checks,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self._ready = (now, result)
+        return result
+
+    def render_metrics(self, bulk_jobs_in_flight: int = 0, mirror: Optional[dict] = None) -> str:
+        pool = self.pool_stats()
+        limits = self.rate_limiter.stats()
+        metadata = self.metadata_cache.stats()
+        queries = self.query_cache.stats()
+        usage = limits["api_usage"]
+        extra = [
+            counter_value("foco_logins_total", "Logins realizados no gateway", self.login_count),
+            counter_value("foco_token_refreshes_total", "Renovações de token (antecipadas ou após 401)", self.refresh_count),
+            counter_value("foco_upstream_retries_total", "Retentativas após 429/503 ou falha de conexão", limits["retries"]),
+            gauge("foco_http_pool_connections", "Conexões do pool httpx por estado", [({"state": "active"}, pool["active"]), ({"state": "idle"}, pool["idle"])]),
+            gauge("foco_http_pool_queued", "Requisições aguardando conexão livre", [({}, pool["queued"])]),
+            gauge("foco_upstream_in_flight", "Chamadas ao gateway em andamento", [({}, pool["in_flight"])]),
+            gauge("foco_rate_limit_in_flight", "Chamadas em andamento por pool do limitador", [({"pool": name}, p["in_flight"]) for name, p in limits["pools"].items()]),
+            gauge("foco_rate_limit_rate", "Taxa atual (req/s) por pool do limitador", [({"pool": name}, p["rate"]) for name, p in limits["pools"].items()]),
+            gauge("foco_circuit_open", "Circuit breaker aberto (1) ou fechado (0)", [({}, 0 if limits["circuit"]["state"] == "closed" else 1)]),
+            gauge("foco_api_usage_ratio", "Consumo da cota diária segundo Sforce-Limit-Info", [({}, usage["used"] / usage["limit"])] if usage else []),
+            gauge("foco_bulk_jobs_in_flight", "Jobs de ingestão acompanhados e ainda não finalizados", [({}, bulk_jobs_in_flight)]),
+            gauge("foco_token_valid", "Token de acesso presente e não expirado", [({}, 1 if self.access_token and not self._token_expired() else 0)]),
+            counter_value("foco_metadata_cache_hits_total", "Acertos do cache de metadados", metadata["hits"]),
+            counter_value("foco_metadata_cache_misses_total", "Buscas do cache de metadados no gateway", metadata["misses"]),
+            counter_value("foco_query_cache_hits_total", "Acertos do cache de SOQL", queries["hits"]),
+            counter_value("foco_query_cache_misses_total", "Buscas do cache de SOQL no gateway", queries["misses"]),
+            gauge("foco_query_cache_bytes", "Memória ocupada pelo cache de SOQL", [({}, queries["bytes"])]),
+        ]
+        if mirror is not None:
+            objects = mirror["objects"]
+            extra += [
+                gauge("foco_mirror_rows", "Registros no espelho local por objeto", [({"object": o["object"]}, o["rows"]) for o in objects]),
+                gauge("foco_mirror_age_seconds", "Tempo desde a última sincronização do espelho", [({"object": o["object"]}, o["age"]) for o in objects if o.get("age") is not None]),
+                counter_value("foco_mirror_full_loads_total", "Cargas completas do espelho (Bulk Query)", mirror["fullLoads"]),
+                counter_value("foco_mirror_delta_syncs_total", "Sincronizações incrementais do espelho", mirror["deltaSyncs"]),
+            ]
+        return self.metrics.render(extra)
+
+    # -----------------------------
+    # Estado compartilhado (token e configuração entre workers)
+    # -----------------------------
+    def config_dict(self) -> dict:
+        return {name: getattr(self, name) for name in CONFIG_FIELDS}
+
+    def _apply_config(self, data: dict, version: int) -> None:
+        self.base_url = (data.get("base_url") or self.base_url or "").strip().strip('`"').rstrip("/")
+        self.login_url = (data.get("login_url") or self.login_url or "").strip().strip('`"').rstrip("/")
+        for name in ("api_version", "client_id", "client_secret", "username", "password", "security_token"):
+            if data.get(name) is not None:
+                setattr(self, name, data[name])
+        self.grant_type = (data.get("grant_type") or self.grant_type or "password").strip().lower()
+        self.config_version = version
+        # Zera token/instância para forçar novo login com a config atualizada
+        self.reset_token()
+
+    def _token_record(self) -> TokenRecord:
+        return TokenRecord(
+            access_token=self.access_token or "",
+            instance_url=self.instance_url,
+            issued_at=self.token_issued_at,
+            expires_at=self.token_expires_at,
+            config_version=self.config_version,
+            login_variant=self._login_variant,
+        )
+
+    def _adopt_token(self, record: TokenRecord) -> None:
+        self.access_token = record.access_token or None
+        self.instance_url = record.instance_url
+        self.token_issued_at = record.issued_at
+        self.token_expires_at = record.expires_at
+        self._login_variant = record.login_variant or self._login_variant
+
+    async def _bootstrap_state(self) -> None:
+        # Adota a config compartilhada, a menos que o .env tenha mudado desde que ela foi gravada
+        async with self.state.lock("config", ttl=self.state_lock_ttl):
+            record: Optional[ConfigRecord] = await asyncio.to_thread(self.state.load_config)
+            if record is None or record.fingerprint != self._env_fingerprint:
+                self.config_version = await asyncio.to_thread(self.state.save_config, self.config_dict(), self._env_fingerprint)
+            elif record.version != self.config_version:
+                self._apply_config(record.data, record.version)
+        self._state_bootstrapped = True
+
+    async def sync_state(self, force: bool = False) -> None:
+        # Lê a config e o token publicados pelos outros workers, no máximo a cada
+        # state_sync_interval segundos (ou sempre, com force)
+        now = time.monotonic()
+        if self._state_bootstrapped and not force and now - self._state_checked_at < self.state_sync_interval:
+            return
+        if not self._state_bootstrapped:
+            await self._bootstrap_state()
+        self._state_checked_at = now
+        record = await asyncio.to_thread(self.state.load_config)
+        if record is not None and record.version != self.config_version:
+            self._apply_config(record.data, record.version)
+        token = await asyncio.to_thread(self.state.load_token)
+        if token is None or token.config_version != self.config_version:
+            if self.access_token:
+                # Token descartado por outro worker (logout ou nova config)
+                self.reset_token()
+            return
+        if token.access_token != self.access_token:
+            self._adopt_token(token)
+
+    async def update_config(self, data: dict) -> int:
+        # Com o lock "token" nenhum worker faz login durante a troca de configuração
+        await self.sync_state(force=True)
+        async with self._login_lock:
+            async with self.state.lock("token", ttl=self.state_lock_ttl):
+                async with self.state.lock("config", ttl=self.state_lock_ttl):
+                    record = await asyncio.to_thread(self.state.load_config)
+                    merged = {**(record.data if record is not None else self.config_dict()), **data}
+                    version = await asyncio.to_thread(self.state.save_config, merged, self._env_fingerprint)
+                    self._apply_config(merged, version)
+        return version
 
     async def userinfo(self) -> dict:
         url = f"{self.base_url}/services/oauth2/userinfo"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(url, headers=await self._auth_headers())
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("userinfo", "GET", url)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    def _metadata_prefix(self) -> str:
+        # Chaves separadas por ambiente/versão para não misturar orgs após POST /api/config
+        return f"{self.base_url}|v{self.api_version}|"
+
+    def metadata_key(self, object_name: Optional[str] = None) -> str:
+        if object_name is None:
+            return f"{self._metadata_prefix()}sobjects"
+        return f"{self._metadata_prefix()}describe/{object_name}"
 
-    async def list_sobjects(self) -> dict:
-        url = f"{self.base_url}/services/data/v{self.api_version}/sobjects"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(url, headers=await self._auth_headers())
+    async def _cached_metadata(self, operation: str, key: str, url: str, force: bool = False) -> CacheEntry:
+        async def fetch(validators: dict) -> httpx.Response:
+            resp = await self._request(operation, "GET", url, headers=validators)
             if resp.status_code >= 400:
                 raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+            return resp
+        return await self.metadata_cache.get_entry(key, fetch, force=force)
 
-    async def describe(self, object_name: str) -> dict:
+    async def metadata_entry(self, object_name: Optional[str] = None, force: bool = False) -> CacheEntry:
+        # Entrada do cache com o corpo original do gateway (entry.raw) e o dict decodificado sob demanda (entry.data)
+        if object_name is None:
+            url = f"{self.base_url}/services/data/v{self.api_version}/sobjects"
+            return await self._cached_metadata("list_sobjects", self.metadata_key(), url, force=force)
         url = f"{self.base_url}/services/data/v{self.api_version}/sobjects/{object_name}/describe"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(url, headers=await self._auth_headers())
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        return await self._cached_metadata("describe", self.metadata_key(object_name), url, force=force)
+
+    def _known_sobject(self, name: str) -> str:
+        # O rótulo vem do caminho ou da SOQL do usuário: só nomes da lista sobjects em cache viram
+        # série própria, o resto (erros de digitação, objetos inexistentes) fica em "other"
+        if not name:
+            return name
+        entry = self.metadata_cache.cached(self.metadata_key())
+        if entry is None:
+            return "other"
+        if self._sobject_names is None or self._sobject_names[0] is not entry:
+            sobjects = entry.data.get("sobjects") or []
+            names = {s["name"].lower(): s["name"] for s in sobjects if s.get("name")}
+            self._sobject_names = (entry, names)
+        return self._sobject_names[1].get(name.lower(), "other")
+
+    async def list_sobjects(self, force: bool = False) -> dict:
+        return (await self.metadata_entry(force=force)).data
+
+    async def describe(self, object_name: str, force: bool = False) -> dict:
+        return (await self.metadata_entry(object_name, force=force)).data
+
+    async def picklist_index(self, object_name: str) -> PicklistIndex:
+        describe = await self.describe(object_name)
+        key = self.metadata_key(object_name)
+        cached = self._picklist_indexes.get(key)
+        # O cache de metadados devolve o mesmo objeto enquanto o describe não muda (hit ou 304)
+        if cached is not None and cached[0] is describe:
+            self._picklist_indexes.move_to_end(key)
+            return cached[1]
+        index = PicklistIndex(describe)
+        self._picklist_indexes[key] = (describe, index)
+        while len(self._picklist_indexes) > self.metadata_cache.max_entries:
+            self._picklist_indexes.popitem(last=False)
+        return index
+
+    def object_schema(self, describe: dict) -> ObjectSchema:
+        key = self.metadata_key(describe.get("name"))
+        cached = self._object_schemas.get(key)
+        if cached is not None and cached[0] is describe:
+            self._object_schemas.move_to_end(key)
+            return cached[1]
+        schema = ObjectSchema(describe)
+        self._object_schemas[key] = (describe, schema)
+        while len(self._object_schemas) > self.metadata_cache.max_entries:
+            self._object_schemas.popitem(last=False)
+        return schema
+
+    async def _describe_batch(self, object_names: List[str]) -> None:
+        # Um composite/batch com até 25 describes; falhas ficam para o describe individual
+        url = f"{self.base_url}/services/data/v{self.api_version}/composite/batch"
+        payload = {"batchRequests": [{"method": "GET", "url": f"v{self.api_version}/sobjects/{name}/describe"} for name in object_names]}
+        resp = await self._request("describe_batch", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        if resp.status_code >= 400:
+            return
+        for name, result in zip(object_names, loads(resp.content).get("results") or []):
+            if result.get("statusCode") == 200 and isinstance(result.get("result"), dict):
+                await self.metadata_cache.put(self.metadata_key(name), dumps(result["result"]))
+
+    async def describe_many(
+        self, object_names: List[str], concurrency: int = 8, composite: bool = True, force: bool = False
+    ) -> Tuple[Dict[str, dict], Dict[str, str]]:
+        # Describes de vários objetos com no máximo `concurrency` chamadas simultâneas. Com composite,
+        # os objetos fora do cache vêm em lotes de 25 e o restante sai do cache (ou revalida com 304)
+        names = list(dict.fromkeys(object_names))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        if composite:
+            cold = names if force else [n for n in names if await self.metadata_cache.peek(self.metadata_key(n)) is None]
 
-    async def query(self, soql: str) -> dict:
-        url = f"{self.base_url}/services/data/v{self.api_version}/query"
+            async def batch(chunk: List[str]) -> None:
+                async with semaphore:
+                    try:
+                        await self._describe_batch(chunk)
+                    except HTTPException:
+                        pass
+
+            await asyncio.gather(*(batch(cold[i:i + 25]) for i in range(0, len(cold), 25)))
+            force = False
+        describes: Dict[str, dict] = {}
+        errors: Dict[str, str] = {}
+
+        async def one(name: str) -> None:
+            async with semaphore:
+                try:
+                    describes[name] = await self.describe(name, force=force)
+                except HTTPException as e:
+                    errors[name] = f"erro {e.status_code}"
+
+        await asyncio.gather(*(one(n) for n in names))
+        return {n: describes[n] for n in names if n in describes}, errors
+
+    async def invalidate_metadata(self, objects: Optional[List[str]] = None, sobjects: bool = False) -> int:
+        if objects is None and not sobjects:
+            return await self.metadata_cache.invalidate(prefix=self._metadata_prefix())
+        keys = [self.metadata_key(o) for o in (objects or [])]
+        if sobjects:
+            keys.append(self.metadata_key())
+        return await self.metadata_cache.invalidate(keys=keys)
+
+    async def _query_response(self, soql: str, include_all: bool = False) -> httpx.Response:
+        resource = "queryAll" if include_all else "query"
+        url = f"{self.base_url}/services/data/v{self.api_version}/{resource}"
         params = {"q": soql}
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.get(url, params=params, headers=await self._auth_headers())
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("query", "GET", url, params=params)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return resp
+
+    async def query(self, soql: str, include_all: bool = False) -> dict:
+        return loads((await self._query_response(soql, include_all)).content)
+
+    async def cached_query(self, soql: str, include_all: bool = False, ttl: Optional[float] = None) -> Tuple[bytes, str, float]:
+        # Devolve (corpo JSON, HIT|MISS|COALESCED, idade); consultas idênticas em voo compartilham a chamada
+        key = f"{self._metadata_prefix()}{'queryAll' if include_all else 'query'}|{normalize_soql(soql)}"
+        return await self.query_cache.get(key, soql, lambda: self._query_response(soql, include_all), ttl=ttl)
+
+    def invalidate_queries(self, *objects: Optional[str]) -> int:
+        return self.query_cache.invalidate_objects(objects)
+
+    async def query_more(self, next_records_url: str) -> dict:
+        # nextRecordsUrl vem como caminho absoluto (/services/data/vXX.X/query/01g...-2000)
+        url = f"{self.base_url}{next_records_url}"
+        resp = await self._request("query", "GET", url)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    # -----------------------------
+    # Passthrough (corpo do gateway repassado sem decodificar)
+    # -----------------------------
+    async def passthrough(self, operation: str, method: str, url: str, accept_encoding: Optional[str] = None, headers: Optional[dict] = None, **kwargs) -> httpx.Response:
+        # Resposta em streaming: o chamador repassa aiter_raw() (ainda comprimido) e fecha com aclose()
+        headers = {**(headers or {}), "Accept-Encoding": _upstream_encoding(accept_encoding)}
+        resp = await self._request(operation, method, url, headers=headers, stream=True, **kwargs)
+        if resp.status_code >= 400:
+            await resp.aread()
+            await resp.aclose()
+            try:
+                err = loads(resp.content)
+            except ValueError:
+                err = resp.text
+            raise HTTPException(status_code=resp.status_code, detail=err)
+        return resp
+
+    async def query_stream(self, soql: str, include_all: bool = False, accept_encoding: Optional[str] = None) -> httpx.Response:
+        resource = "queryAll" if include_all else "query"
+        url = f"{self.base_url}/services/data/v{self.api_version}/{resource}"
+        return await self.passthrough("query", "GET", url, accept_encoding, params={"q": soql})
+
+    async def composite_stream(self, payload: dict, sobjects: bool = False, accept_encoding: Optional[str] = None) -> httpx.Response:
+        resource = "composite/sobjects" if sobjects else "composite"
+        url = f"{self._data_base()}/services/data/v{self.api_version}/{resource}"
+        operation = "composite_sobjects" if sobjects else "composite"
+        try:
+            return await self.passthrough(operation, "POST", url, accept_encoding, content=dumps(payload), headers={"Content-Type": "application/json"})
+        finally:
+            self.invalidate_queries(*written_objects(payload))
+
+    async def query_pages(self, soql: str, include_all: bool = False, first_page: Optional[dict] = None) -> AsyncIterator[dict]:
+        # Segue nextRecordsUrl buscando a próxima página enquanto a atual é consumida
+        page = first_page if first_page is not None else await self.query(soql, include_all=include_all)
+        while True:
+            next_url = None if page.get("done", True) else page.get("nextRecordsUrl")
+            prefetch = asyncio.create_task(self.query_more(next_url)) if next_url else None
+            try:
+                yield page
+            except BaseException:
+                # Consumidor desistiu (cliente desconectou): descarta a página em voo
+                if prefetch is not None:
+                    prefetch.cancel()
+                raise
+            if prefetch is None:
+                return
+            page = await prefetch
 
     def _data_base(self) -> str:
         return (self.instance_url or self.base_url).rstrip("/")
 
     async def create(self, object_name: str, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/sobjects/{object_name}"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("create", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(object_name)
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
+            except Exception:
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
 
     async def update(self, object_name: str, record_id: str, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/sobjects/{object_name}/{record_id}"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.patch(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return {"success": True, "status": resp.status_code}
+        resp = await self._request("update", "PATCH", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(object_name)
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
+            except Exception:
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return {"success": True, "status": resp.status_code}
 
     async def upsert(self, object_name: str, external_field: str, external_value: str, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/sobjects/{object_name}/{external_field}/{external_value}"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.patch(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            created = resp.status_code == 201
-            body = None
+        resp = await self._request("upsert", "PATCH", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(object_name)
+        if resp.status_code >= 400:
             try:
-                body = resp.json()
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
             except Exception:
-                body = None
-            return {"success": True, "created": created, "status": resp.status_code, "body": body}
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        created = resp.status_code == 201
+        body = None
+        try:
+            body = resp.json()
+        except Exception:
+            body = None
+        return {"success": True, "created": created, "status": resp.status_code, "body": body}
 
     async def composite_sobjects(self, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/composite/sobjects"
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("composite_sobjects", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(*written_objects(payload))
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
+            except Exception:
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    async def composite_sobjects_update(self, payload: dict) -> list:
+        url = f"{self._data_base()}/services/data/v{self.api_version}/composite/sobjects"
+        resp = await self._request("composite_sobjects", "PATCH", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(*written_objects(payload))
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise HTTPException(status_code=resp.status_code, detail=err)
+        return loads(resp.content)
+
+    async def composite_sobjects_upsert(self, object_name: str, external_field: str, payload: dict) -> list:
+        url = f"{self._data_base()}/services/data/v{self.api_version}/composite/sobjects/{object_name}/{external_field}"
+        resp = await self._request("composite_sobjects", "PATCH", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(object_name)
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise HTTPException(status_code=resp.status_code, detail=err)
+        return loads(resp.content)
 
     async def composite(self, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/composite"
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("composite", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        self.invalidate_queries(*written_objects(payload))
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
+            except Exception:
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    async def get_deleted(self, object_name: str, start: datetime, end: datetime) -> dict:
+        # Registros excluídos no intervalo (lixeira dos últimos 30 dias; precisão de minutos)
+        url = f"{self._data_base()}/services/data/v{self.api_version}/sobjects/{object_name}/deleted/"
+        params = {"start": start.strftime("%Y-%m-%dT%H:%M:%S+00:00"), "end": end.strftime("%Y-%m-%dT%H:%M:%S+00:00")}
+        resp = await self._request("get_deleted", "GET", url, params=params)
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise HTTPException(status_code=resp.status_code, detail=err)
+        return loads(resp.content)
 
     # -----------------------------
     # Bulk API v2 (Ingest)
     # -----------------------------
     async def bulk_create_job(self, payload: dict) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(url, json=payload, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                try:
-                    err = resp.json()
-                    raise HTTPException(status_code=resp.status_code, detail=err)
-                except Exception:
-                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
-
-    async def bulk_upload_batch(self, job_id: str, csv_data: bytes) -> dict:
-        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest/{job_id}/batches"
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.put(url, content=csv_data, headers={**(await self._auth_headers()), "Content-Type": "text/csv"})
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        resp = await self._request("bulk_create_job", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        if resp.status_code >= 400:
             try:
-                return resp.json()
+                err = resp.json()
+                raise HTTPException(status_code=resp.status_code, detail=err)
             except Exception:
-                return {"status": resp.status_code}
+                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    async def bulk_upload_batch(self, job_id: str, csv_data: Union[bytes, AsyncIterator[bytes]]) -> dict:
+        # csv_data pode ser um iterador assíncrono: o corpo é enviado ao gateway em streaming
+        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest/{job_id}/batches"
+        resp = await self._request("bulk_upload_batch", "PUT", url, content=csv_data, headers={"Content-Type": "text/csv"})
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        try:
+            return loads(resp.content)
+        except Exception:
+            return {"status": resp.status_code}
 
     async def bulk_close_job(self, job_id: str, state: str = "UploadComplete") -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest/{job_id}"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.patch(url, json={"state": state}, headers={**(await self._auth_headers()), "Content-Type": "application/json"})
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("bulk_close_job", "PATCH", url, json={"state": state}, headers={"Content-Type": "application/json"})
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        data = resp.json()
+        if state == "UploadComplete":
+            # O job passa a gravar no objeto; o orquestrador invalida de novo a cada progresso
+            self.invalidate_queries(data.get("object"))
+        return data
 
     async def bulk_job_status(self, job_id: str) -> dict:
         url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest/{job_id}"
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(url, headers=await self._auth_headers())
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await self._request("bulk_job_status", "GET", url)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
 
-    async def bulk_results(self, job_id: str, kind: str) -> str:
+    async def bulk_results_stream(self, job_id: str, kind: str, accept_encoding: Optional[str] = None) -> httpx.Response:
+        # Corpo não é lido: consumir com aiter_bytes (ou aiter_raw, em passthrough) e fechar
         url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/ingest/{job_id}/{kind}"
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.get(url, headers=await self._auth_headers())
-            if resp.status_code >= 400:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.text
+        return await self.passthrough("bulk_results", "GET", url, accept_encoding)
+
+    # -----------------------------
+    # Bulk API v2 (Query)
+    # -----------------------------
+    async def bulk_query_create_job(self, payload: dict) -> dict:
+        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/query"
+        resp = await self._request("bulk_query_create_job", "POST", url, json=payload, headers={"Content-Type": "application/json"})
+        if resp.status_code >= 400:
+            try:
+                err = resp.json()
+            except Exception:
+                err = resp.text
+            raise HTTPException(status_code=resp.status_code, detail=err)
+        return loads(resp.content)
+
+    async def bulk_query_job_status(self, job_id: str) -> dict:
+        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/query/{job_id}"
+        resp = await self._request("bulk_query_job_status", "GET", url)
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
 
-app = FastAPI(title="Mapeamento FOCO", version="0.1.0")
+    async def bulk_query_abort(self, job_id: str) -> dict:
+        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/query/{job_id}"
+        resp = await self._request("bulk_query_abort", "PATCH", url, json={"state": "Aborted"}, headers={"Content-Type": "application/json"})
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return loads(resp.content)
+
+    async def bulk_query_wait(self, job_id: str, timeout: float = 600.0, max_interval: float = 10.0) -> dict:
+        # Polling com backoff exponencial até o job sair de UploadComplete/InProgress
+        deadline = time.monotonic() + timeout
+        interval = 0.5
+        while True:
+            status = await self.bulk_query_job_status(job_id)
+            if status.get("state") in ("JobComplete", "Failed", "Aborted"):
+                return status
+            if time.monotonic() + interval > deadline:
+                raise HTTPException(status_code=504, detail=f"Job {job_id} ainda em {status.get('state')}")
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+    async def bulk_query_results(self, job_id: str, locator: Optional[str] = None, max_records: Optional[int] = None) -> httpx.Response:
+        # Devolve a resposta em streaming: os headers (Sforce-Locator) chegam antes do corpo
+        url = f"{self._data_base()}/services/data/v{self.api_version}/jobs/query/{job_id}/results"
+        params = {}
+        if locator:
+            params["locator"] = locator
+        if max_records:
+            params["maxRecords"] = max_records
+        resp = await self._request("bulk_results", "GET", url, params=params, stream=True)
+        if resp.status_code >= 400:
+            await resp.aread()
+            await resp.aclose()
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return resp
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Um único pool de conexões por processo, fechado no shutdown
+    await foco_client.start()
+    # Adota a configuração/token já publicados por outros workers antes da primeira requisição
+    await foco_client.sync_state(force=True)
+    bulk_orchestrator.start()
+    if sobject_mirror is not None:
+        sobject_mirror.start()
+    try:
+        yield
+    finally:
+        if sobject_mirror is not None:
+            await sobject_mirror.stop()
+            sobject_mirror.store.close()
+        await bulk_orchestrator.stop()
+        await foco_client.aclose()
+        foco_client.metadata_cache.close()
+        foco_client.state.close()
+
+app = FastAPI(title="Mapeamento FOCO", version="0.1.0", lifespan=lifespan)
 
 # Static & Templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -270,8 +1155,32 @@ foco_client = FOCOClient(
     security_token=FOCO_SECURITY_TOKEN or "",
     api_version=FOCO_API_VERSION,
     grant_type=FOCO_GRANT_TYPE,
+    state=create_state_store(FOCO_STATE_BACKEND, FOCO_STATE_PATH),
 )
 
+bulk_orchestrator = BulkJobOrchestrator(
+    foco_client,
+    results_dir=os.path.join(FOCO_BULK_DOWNLOAD_DIR, "results"),
+    min_interval=FOCO_BULK_POLL_MIN_INTERVAL,
+    max_interval=FOCO_BULK_POLL_MAX_INTERVAL,
+    concurrency=FOCO_BULK_POLL_CONCURRENCY,
+    retention=FOCO_BULK_TRACK_RETENTION,
+)
+
+# Espelho local: só existe quando FOCO_MIRROR_OBJECTS está definido
+sobject_mirror: Optional[SObjectMirror] = None
+if FOCO_MIRROR_OBJECTS:
+    sobject_mirror = SObjectMirror(
+        foco_client,
+        MirrorStore(FOCO_MIRROR_PATH),
+        FOCO_MIRROR_OBJECTS,
+        interval=FOCO_MIRROR_INTERVAL,
+        lag=FOCO_MIRROR_LAG,
+        max_staleness=FOCO_MIRROR_MAX_STALENESS,
+    )
+
+app.add_middleware(MetricsMiddleware, metrics=foco_client.metrics, server_timing=FOCO_SERVER_TIMING)
+
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse(
@@ -288,6 +1197,25 @@ async def index(request: Request):
 async def health():
     return {"status": "ok"}
 
+@app.get("/api/ready")
+async def ready(fresh: bool = Query(False, description="Ignora o resultado recente e verifica de novo")):
+    result = await foco_client.readiness(max_age=0 if fresh else FOCO_READY_CACHE_TTL)
+    return JSONResponse(content=result, status_code=200 if result["ready"] else 503)
+
+@app.get("/api/metrics")
+async def metrics():
+    mirror = sobject_mirror.status() if sobject_mirror is not None else None
+    body = foco_client.render_metrics(bulk_jobs_in_flight=bulk_orchestrator.in_flight(), mirror=mirror)
+    return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/http/pool")
+async def http_pool():
+    return foco_client.pool_stats()
+
+@app.get("/api/http/limits")
+async def http_limits():
+    return foco_client.rate_limiter.stats()
+
 @app.post("/api/login")
 async def login():
     token = await foco_client.login()
@@ -298,20 +1226,237 @@ async def whoami():
     data = await foco_client.userinfo()
     return JSONResponse(content=data)
 
+def _passthrough_response(resp: httpx.Response, headers: Optional[dict] = None) -> StreamingResponse:
+    # Repassa os bytes do gateway como chegaram (inclusive comprimidos), sem decodificar/reserializar
+    out = dict(headers or {})
+    for name in ("Content-Encoding", "Content-Length", "Sforce-Limit-Info"):
+        if name in resp.headers:
+            out[name] = resp.headers[name]
+    media_type = resp.headers.get("Content-Type", "application/json")
+    return StreamingResponse(resp.aiter_raw(), status_code=resp.status_code, headers=out, media_type=media_type, background=BackgroundTask(resp.aclose))
+
 @app.get("/api/sobjects")
-async def sobjects():
-    data = await foco_client.list_sobjects()
-    return JSONResponse(content=data)
+async def sobjects(refresh: bool = Query(False, description="Ignora o cache de metadados")):
+    entry = await foco_client.metadata_entry(force=refresh)
+    return Response(content=entry.raw, media_type="application/json")
 
 @app.get("/api/describe/{object_name}")
-async def describe(object_name: str):
-    data = await foco_client.describe(object_name)
-    return JSONResponse(content=data)
+async def describe(object_name: str, refresh: bool = Query(False, description="Ignora o cache de metadados")):
+    entry = await foco_client.metadata_entry(object_name, force=refresh)
+    return Response(content=entry.raw, media_type="application/json")
+
+# -----------------------------
+# API: cache de metadados (sobjects/describe)
+# -----------------------------
+class MetadataInvalidateRequest(BaseModel):
+    objects: Optional[List[str]] = None
+    sobjects: bool = False
+
+class MetadataPrewarmRequest(BaseModel):
+    objects: List[str]
+    sobjects: bool = True
+    concurrency: int = 8
+
+@app.get("/api/metadata/cache")
+async def metadata_cache_stats():
+    return foco_client.metadata_cache.stats()
+
+@app.post("/api/metadata/invalidate")
+async def metadata_invalidate(payload: MetadataInvalidateRequest):
+    # Sem objetos e sem sobjects: limpa todo o cache do ambiente atual
+    removed = await foco_client.invalidate_metadata(payload.objects, sobjects=payload.sobjects)
+    return {"status": "ok", "removed": removed}
+
+@app.post("/api/metadata/prewarm")
+async def metadata_prewarm(payload: MetadataPrewarmRequest):
+    if payload.sobjects:
+        await foco_client.list_sobjects()
+    describes, errors = await foco_client.describe_many(
+        payload.objects, concurrency=payload.concurrency, composite=FOCO_DESCRIBE_COMPOSITE
+    )
+    results = {name: ("ok" if name in describes else errors.get(name)) for name in payload.objects}
+    return {"status": "ok", "objects": results}
+
+# -----------------------------
+# API: describe em lote e índice de relacionamentos (servido da memória)
+# -----------------------------
+class DescribeBatchRequest(BaseModel):
+    objects: List[str] = []
+    custom: bool = False
+    concurrency: Optional[int] = None
+    composite: Optional[bool] = None
+    refresh: bool = False
+    fields: bool = True
+
+@app.post("/api/describe/batch")
+async def describe_batch(payload: DescribeBatchRequest):
+    # Descreve a lista de objetos (e/ou todos os objetos customizados) e atualiza o grafo em memória
+    started = time.perf_counter()
+    names = list(payload.objects)
+    if payload.custom:
+        sobjects = await foco_client.list_sobjects()
+        names += [s["name"] for s in sobjects.get("sobjects") or [] if s.get("name", "").endswith("__c")]
+    if not names:
+        raise HTTPException(status_code=400, detail="Informe objects ou custom=true")
+    describes, errors = await foco_client.describe_many(
+        names,
+        concurrency=payload.concurrency or FOCO_DESCRIBE_CONCURRENCY,
+        composite=FOCO_DESCRIBE_COMPOSITE if payload.composite is None else payload.composite,
+        force=payload.refresh,
+    )
+    schemas = [foco_client.object_schema(d) for d in describes.values()]
+    # O grafo acumula as explorações anteriores; objetos descritos de novo substituem os antigos
+    previous = foco_client.schema_graph.objects if foco_client.schema_graph is not None else {}
+    described = {s.name.lower() for s in schemas}
+    graph = SchemaGraph([s for k, s in previous.items() if k not in described] + schemas)
+    foco_client.schema_graph = graph
+    return JSONResponse(content={
+        "objects": {s.name: s.as_dict(fields=payload.fields) for s in schemas},
+        "errors": errors,
+        "graph": {"objects": len(graph.objects), "edges": len(graph.edges)},
+        "elapsed": round(time.perf_counter() - started, 3),
+    })
+
+def _require_schema_graph() -> SchemaGraph:
+    if foco_client.schema_graph is None:
+        raise HTTPException(status_code=404, detail="Índice vazio: use POST /api/describe/batch")
+    return foco_client.schema_graph
+
+@app.get("/api/schema")
+async def schema_graph(fields: bool = Query(False, description="Inclui a lista compacta de campos de cada objeto")):
+    return JSONResponse(content=_require_schema_graph().as_dict(fields=fields))
+
+@app.get("/api/schema/path")
+async def schema_path(source: str = Query(..., alias="from"), target: str = Query(..., alias="to")):
+    steps = _require_schema_graph().path(source, target)
+    if steps is None:
+        raise HTTPException(status_code=404, detail="Sem caminho entre os objetos no índice")
+    return {"from": source, "to": target, "steps": steps}
+
+@app.get("/api/schema/{object_name}")
+async def schema_object(object_name: str):
+    graph = _require_schema_graph()
+    schema = graph.get(object_name)
+    if schema is None:
+        raise HTTPException(status_code=404, detail="Objeto fora do índice")
+    return JSONResponse(content={**schema.as_dict(), **graph.neighbours(object_name)})
+
+# -----------------------------
+# API: mapeamento de picklists (labels → values) no servidor
+# -----------------------------
+@app.get("/api/picklists/{object_name}")
+async def picklists(object_name: str):
+    index = await foco_client.picklist_index(object_name)
+    return JSONResponse(content=index.summary())
+
+@app.post("/api/picklists/{object_name}/transform")
+async def picklists_transform(
+    object_name: str,
+    request: Request,
+    active_only: bool = Query(True, alias="activeOnly"),
+    validate: bool = Query(True, description="Valida valores inválidos/inativos e dependências"),
+    column_delimiter: Optional[str] = Query(None, alias="columnDelimiter"),
+):
+    # text/csv: CSV reescrito em streaming; JSON: array (ou {"records": [...]}) com erros por registro
+    index = await foco_client.picklist_index(object_name)
+    content_type = request.headers.get("content-type", "")
+    if "text/csv" in content_type:
+        delimiter = _delimiter(column_delimiter)
+        spool = await spool_stream(request.stream())
+        return StreamingResponse(
+            transform_csv(iter_spooled(spool), index, active_only=active_only, delimiter=delimiter), media_type="text/csv"
+        )
+    records = []
+    errors = []
+    async for record in iter_json_array(await request.body()):
+        mapped, record_errors = index.transform_record(record, active_only=active_only, validate=validate)
+        if record_errors:
+            errors.append({"index": len(records), "errors": record_errors})
+        records.append(mapped)
+    return JSONResponse(content={"records": records, "errors": errors})
 
 @app.get("/api/query")
-async def run_query(q: str = Query(..., description="SOQL query string")):
-    data = await foco_client.query(q)
-    return JSONResponse(content=data)
+async def run_query(
+    request: Request,
+    q: str = Query(..., description="SOQL query string"),
+    cache: Optional[bool] = Query(None, description="Usa o cache de resultados (padrão: FOCO_QUERY_CACHE_ENABLED)"),
+    ttl: Optional[float] = Query(None, ge=0, description="Validade desta consulta no cache (s)"),
+    source: str = Query(FOCO_MIRROR_QUERY_SOURCE, pattern="^(gateway|local|auto)$", description="local: só o espelho; auto: espelho quando possível"),
+):
+    if source != "gateway":
+        # auto recorre ao gateway quando o espelho não atende a consulta (ou está desatualizado)
+        try:
+            if sobject_mirror is None:
+                raise UnsupportedQuery("espelho local desativado (FOCO_MIRROR_OBJECTS)")
+            max_age = None if source == "local" else sobject_mirror.max_staleness
+            raw, age = await sobject_mirror.query(q, max_age=max_age)
+            return Response(content=raw, media_type="application/json", headers={"X-Source": "mirror", "Age": str(int(age))})
+        except UnsupportedQuery as e:
+            if source == "local":
+                raise HTTPException(status_code=400, detail=f"Consulta não atendida pelo espelho local: {e}")
+    if not (foco_client.query_cache_enabled if cache is None else cache):
+        resp = await foco_client.query_stream(q, accept_encoding=request.headers.get("accept-encoding", "identity"))
+        return _passthrough_response(resp, headers={"X-Cache": "BYPASS"})
+    raw, status, age = await foco_client.cached_query(q, ttl=ttl)
+    return Response(content=raw, media_type="application/json", headers={"X-Cache": status, "Age": str(int(age))})
+
+@app.get("/api/query/cache")
+async def query_cache_stats():
+    return foco_client.query_cache.stats()
+
+class QueryCacheInvalidateRequest(BaseModel):
+    objects: Optional[List[str]] = None
+
+@app.post("/api/query/cache/invalidate")
+async def query_cache_invalidate(payload: QueryCacheInvalidateRequest):
+    # Sem objetos, limpa o cache inteiro
+    if payload.objects:
+        removed = foco_client.invalidate_queries(*payload.objects)
+    else:
+        removed = foco_client.query_cache.clear()
+    return {"status": "ok", "removed": removed}
+
+def _require_mirror() -> SObjectMirror:
+    if sobject_mirror is None:
+        raise HTTPException(status_code=404, detail="Espelho local desativado (defina FOCO_MIRROR_OBJECTS)")
+    return sobject_mirror
+
+@app.get("/api/mirror")
+async def mirror_status():
+    return _require_mirror().status()
+
+class MirrorSyncRequest(BaseModel):
+    objects: Optional[List[str]] = None
+    full: bool = False
+
+@app.post("/api/mirror/sync")
+async def mirror_sync(payload: MirrorSyncRequest):
+    # Agenda a sincronização (em segundo plano); acompanhe por GET /api/mirror
+    objects = _require_mirror().request_sync(payload.objects, full=payload.full)
+    return {"status": "scheduled", "objects": objects, "full": payload.full}
+
+@app.get("/api/query/stream")
+async def stream_query(
+    q: str = Query(..., description="SOQL query string"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    include_all: bool = Query(False, alias="all", description="Usa queryAll (inclui registros excluídos/arquivados)"),
+    meta: Optional[bool] = Query(
+        None, description="Inclui totais (linhas, páginas, tempo) ao final do stream; padrão: só em NDJSON"
+    ),
+):
+    # A primeira página é buscada antes de responder para que erros de SOQL voltem com o status correto
+    stats = QueryStreamStats()
+    first_page = await foco_client.query(q, include_all=include_all)
+    pages = foco_client.query_pages(q, include_all=include_all, first_page=first_page)
+    headers = {"X-Total-Size": str(first_page.get("totalSize", ""))}
+    if fmt == "csv":
+        # A linha "# totalSize=..." invalida o CSV para planilhas e Bulk API: só com meta=true
+        return StreamingResponse(
+            csv_stream(pages, stats, meta=bool(meta), columns=select_columns(q)), media_type="text/csv", headers=headers
+        )
+    return StreamingResponse(
+        ndjson_stream(pages, stats, meta=meta is not False), media_type="application/x-ndjson", headers=headers
+    )
 
 @app.post("/api/sobjects/{object_name}")
 async def create_object(object_name: str, payload: dict):
@@ -329,13 +1474,48 @@ async def upsert_object(object_name: str, external_field: str, external_value: s
     return JSONResponse(content=data)
 
 @app.post("/api/composite/sobjects")
-async def composite_sobjects(payload: dict):
-    data = await foco_client.composite_sobjects(payload)
-    return JSONResponse(content=data)
+async def composite_sobjects(payload: dict, request: Request):
+    resp = await foco_client.composite_stream(payload, sobjects=True, accept_encoding=request.headers.get("accept-encoding", "identity"))
+    return _passthrough_response(resp)
 
 @app.post("/api/composite")
-async def composite(payload: dict):
-    data = await foco_client.composite(payload)
+async def composite(payload: dict, request: Request):
+    resp = await foco_client.composite_stream(payload, accept_encoding=request.headers.get("accept-encoding", "identity"))
+    return _passthrough_response(resp)
+
+async def _map_picklist_records(index: PicklistIndex, records: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    async for record in records:
+        yield record if isinstance(record, InvalidRecord) else index.transform_record(record, validate=False)[0]
+
+@app.post("/api/records/{object_name}/{operation}")
+async def write_records_batched(
+    object_name: str,
+    operation: str,
+    request: Request,
+    external_field: Optional[str] = Query(None, alias="externalIdField"),
+    all_or_none: bool = Query(False, alias="allOrNone"),
+    batch_size: int = Query(COMPOSITE_BATCH_SIZE, alias="batchSize", ge=1, le=COMPOSITE_BATCH_SIZE),
+    concurrency: Optional[int] = Query(None, ge=1, le=32),
+    map_picklists: bool = Query(False, alias="mapPicklists", description="Converte labels de picklist em values antes do envio"),
+):
+    # Aceita array JSON (ou {"records": [...]}) ou NDJSON em streaming (application/x-ndjson)
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        records = iter_ndjson(request.stream())
+    else:
+        records = iter_json_array(await request.body())
+    if map_picklists:
+        records = _map_picklist_records(await foco_client.picklist_index(object_name), records)
+    data = await write_records(
+        foco_client,
+        object_name,
+        operation,
+        records,
+        external_field=external_field,
+        all_or_none=all_or_none,
+        batch_size=batch_size,
+        concurrency=concurrency or FOCO_COMPOSITE_CONCURRENCY,
+    )
     return JSONResponse(content=data)
 
 # -----------------------------
@@ -354,12 +1534,52 @@ async def bulk_create_job(payload: BulkJobRequest):
     data = await foco_client.bulk_create_job(body)
     return JSONResponse(content=data)
 
+# Validações prévias de CSV (por id); as linhas rejeitadas ficam em FOCO_BULK_DOWNLOAD_DIR/rejects
+bulk_validations: Dict[str, ValidationReport] = {}
+BULK_REJECTS_DIR = os.path.join(FOCO_BULK_DOWNLOAD_DIR, "rejects")
+
+def _delimiter(column_delimiter: Optional[str]) -> str:
+    # columnDelimiter da Bulk API (COMMA, SEMICOLON, TAB...) → caractere usado pelo parser
+    name = (column_delimiter or "COMMA").upper()
+    if name not in DELIMITERS:
+        raise HTTPException(status_code=400, detail=f"columnDelimiter inválido: {column_delimiter}")
+    return DELIMITERS[name]
+
+async def _csv_validator(
+    object_name: str,
+    operation: str,
+    external_id: Optional[str] = None,
+    column_delimiter: Optional[str] = None,
+    map_picklists: bool = False,
+) -> CsvValidator:
+    await _prune_bulk_handles()
+    report = ValidationReport(object_name, operation, BULK_REJECTS_DIR)
+    validator = CsvValidator(
+        await foco_client.describe(object_name),
+        operation,
+        report,
+        external_id=external_id,
+        index=await foco_client.picklist_index(object_name),
+        delimiter=_delimiter(column_delimiter),
+        map_picklists=map_picklists,
+    )
+    bulk_validations[report.id] = report
+    return validator
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
 @app.put("/api/bulk/job/{job_id}/batches")
-async def bulk_upload_batch(job_id: str, request: Request):
+async def bulk_upload_batch(
+    job_id: str,
+    request: Request,
+    validate: bool = Query(False, description="Valida o CSV contra o describe e envia só as linhas válidas"),
+):
     # Aceita 'text/csv' puro ou JSON {"csv": "..."}
     content_type = request.headers.get("content-type", "")
     if "text/csv" in content_type:
-        csv_bytes = await request.body()
+        # Repassa o corpo ao gateway em streaming, sem carregar o arquivo inteiro
+        csv_bytes = request.stream()
     else:
         try:
             body = await request.json()
@@ -369,7 +1589,158 @@ async def bulk_upload_batch(job_id: str, request: Request):
             csv_bytes = csv_text.encode("utf-8")
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"CSV inválido: {e}")
-    data = await foco_client.bulk_upload_batch(job_id, csv_bytes)
+    if not validate:
+        data = await foco_client.bulk_upload_batch(job_id, csv_bytes)
+        return JSONResponse(content=data)
+    job = await foco_client.bulk_job_status(job_id)
+    validator = await _csv_validator(
+        job.get("object"), job.get("operation"), job.get("externalIdFieldName"), job.get("columnDelimiter")
+    )
+    source = _single_chunk(csv_bytes) if isinstance(csv_bytes, bytes) else csv_bytes
+    try:
+        data = await foco_client.bulk_upload_batch(job_id, await validator.start(source))
+    finally:
+        validator.finish()
+    data["validation"] = validator.report.as_dict()
+    return JSONResponse(content=data)
+
+@app.post("/api/bulk/validate")
+async def bulk_validate(
+    request: Request,
+    object_name: str = Query(..., alias="object"),
+    operation: str = Query(...),
+    external_id: Optional[str] = Query(None, alias="externalIdFieldName"),
+    column_delimiter: Optional[str] = Query(None, alias="columnDelimiter"),
+    map_picklists: bool = Query(False, alias="mapPicklists"),
+):
+    # Validação sem upload: percorre o CSV uma vez e devolve o resumo (rejeitadas em /rejects)
+    validator = await _csv_validator(object_name, operation, external_id, column_delimiter, map_picklists)
+    async for _ in validator.stream(request.stream()):
+        pass
+    return validator.report.as_dict()
+
+@app.get("/api/bulk/validation/{validation_id}")
+async def bulk_validation_status(validation_id: str):
+    report = bulk_validations.get(validation_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Validação não encontrada")
+    return report.as_dict()
+
+@app.get("/api/bulk/validation/{validation_id}/rejects")
+async def bulk_validation_rejects(validation_id: str):
+    report = bulk_validations.get(validation_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Validação não encontrada")
+    if not report.rejected or not os.path.exists(report.rejects_path):
+        raise HTTPException(status_code=404, detail="Nenhuma linha rejeitada")
+    return FileResponse(report.rejects_path, media_type="text/csv")
+
+# Uploads que excedem o limite de um job são divididos em vários jobs (handle agregado)
+bulk_aggregates: Dict[str, BulkIngestAggregate] = {}
+
+def _expire_handles(registry: dict, now: float) -> list:
+    # Remove os finalizados há mais que a retenção e, acima de FOCO_BULK_MAX_HANDLES, os mais
+    # antigos (o dict preserva a ordem de criação). Em andamento nunca são removidos
+    finished = [key for key, item in registry.items() if item.finished_at is not None]
+    expired = [key for key in finished if now - registry[key].finished_at > FOCO_BULK_TRACK_RETENTION]
+    excess = len(registry) - len(expired) - max(FOCO_BULK_MAX_HANDLES - 1, 0)
+    if excess > 0:
+        gone = set(expired)
+        expired += [key for key in finished if key not in gone][:excess]
+    return [registry.pop(key) for key in expired]
+
+def _remove_rejects(paths: List[str], now: float) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    # Arquivos órfãos (de processos anteriores ou de outros workers) somem pela idade
+    try:
+        entries = list(os.scandir(BULK_REJECTS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > FOCO_BULK_TRACK_RETENTION:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+async def _prune_bulk_handles() -> None:
+    now = time.time()
+    _expire_handles(bulk_aggregates, now)
+    expired = _expire_handles(bulk_validations, now)
+    await asyncio.to_thread(_remove_rejects, [r.rejects_path for r in expired if r.rejected], now)
+
+@app.put("/api/bulk/ingest")
+async def bulk_ingest_stream(
+    request: Request,
+    object_name: str = Query(..., alias="object"),
+    operation: str = Query(...),
+    external_id: Optional[str] = Query(None, alias="externalIdFieldName"),
+    line_ending: str = Query("LF", alias="lineEnding"),
+    column_delimiter: Optional[str] = Query(None, alias="columnDelimiter"),
+    max_bytes: Optional[int] = Query(None, alias="maxBytes", ge=1024),
+    max_records: Optional[int] = Query(None, alias="maxRecords", ge=1),
+    close: bool = Query(True, description="Fecha cada job (UploadComplete) após o upload"),
+    map_picklists: bool = Query(False, alias="mapPicklists", description="Converte labels de picklist em values antes do envio"),
+    validate: bool = Query(False, description="Valida o CSV contra o describe e envia só as linhas válidas"),
+):
+    source = request.stream()
+    validator: Optional[CsvValidator] = None
+    if validate:
+        # A validação já converte labels de picklist quando mapPicklists=true (uma única passagem)
+        validator = await _csv_validator(object_name, operation, external_id, column_delimiter, map_picklists)
+        source = await validator.start(source)
+    elif map_picklists:
+        source = transform_csv(
+            source, await foco_client.picklist_index(object_name), delimiter=_delimiter(column_delimiter)
+        )
+    job_spec = {"object": object_name, "operation": operation, "contentType": "CSV", "lineEnding": line_ending}
+    if external_id:
+        job_spec["externalIdFieldName"] = external_id
+    if column_delimiter:
+        job_spec["columnDelimiter"] = column_delimiter
+    try:
+        aggregate = await stream_ingest(
+            foco_client,
+            source,
+            job_spec,
+            max_bytes=max_bytes or FOCO_BULK_MAX_JOB_BYTES,
+            max_records=max_records or FOCO_BULK_MAX_JOB_RECORDS,
+            close=close,
+        )
+    finally:
+        if validator is not None:
+            validator.finish()
+    if validator is not None:
+        aggregate.validation = validator.report
+    await _prune_bulk_handles()
+    bulk_aggregates[aggregate.id] = aggregate
+    if close:
+        for job in aggregate.jobs:
+            if job.get("id") and job.get("state") == "UploadComplete":
+                bulk_orchestrator.track(job["id"])
+    status_code = aggregate.error["status_code"] if aggregate.error else 200
+    return JSONResponse(status_code=status_code, content=aggregate.as_dict())
+
+@app.get("/api/bulk/ingest/{aggregate_id}")
+async def bulk_ingest_status(aggregate_id: str):
+    aggregate = bulk_aggregates.get(aggregate_id)
+    if aggregate is None:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    jobs = [j for j in aggregate.jobs if j.get("id")]
+    statuses = await asyncio.gather(*(foco_client.bulk_job_status(j["id"]) for j in jobs), return_exceptions=True)
+    for job, status in zip(jobs, statuses):
+        if isinstance(status, dict):
+            job["state"] = status.get("state", job.get("state"))
+            job["numberRecordsProcessed"] = status.get("numberRecordsProcessed", 0)
+            job["numberRecordsFailed"] = status.get("numberRecordsFailed", 0)
+    data = aggregate.as_dict()
+    data["numberRecordsProcessed"] = sum(j.get("numberRecordsProcessed", 0) for j in jobs)
+    data["numberRecordsFailed"] = sum(j.get("numberRecordsFailed", 0) for j in jobs)
+    data["states"] = sorted({j.get("state") for j in jobs if j.get("state")})
     return JSONResponse(content=data)
 
 class BulkCloseRequest(BaseModel):
@@ -378,6 +1749,9 @@ class BulkCloseRequest(BaseModel):
 @app.patch("/api/bulk/job/{job_id}")
 async def bulk_close(job_id: str, payload: BulkCloseRequest):
     data = await foco_client.bulk_close_job(job_id, state=payload.state or "UploadComplete")
+    if data.get("state") == "UploadComplete":
+        # A partir daqui o status é acompanhado no servidor (ver /api/bulk/tracker)
+        bulk_orchestrator.track(job_id)
     return JSONResponse(content=data)
 
 @app.get("/api/bulk/job/{job_id}")
@@ -385,22 +1759,132 @@ async def bulk_status(job_id: str):
     data = await foco_client.bulk_job_status(job_id)
     return JSONResponse(content=data)
 
-from fastapi.responses import PlainTextResponse
+async def _bulk_results_response(job_id: str, kind: str, request: Request) -> StreamingResponse:
+    resp = await foco_client.bulk_results_stream(job_id, kind, accept_encoding=request.headers.get("accept-encoding", "identity"))
+    return _passthrough_response(resp)
 
 @app.get("/api/bulk/job/{job_id}/successfulResults")
-async def bulk_success(job_id: str):
-    text = await foco_client.bulk_results(job_id, "successfulResults")
-    return PlainTextResponse(text, media_type="text/csv")
+async def bulk_success(job_id: str, request: Request):
+    return await _bulk_results_response(job_id, "successfulResults", request)
 
 @app.get("/api/bulk/job/{job_id}/failedResults")
-async def bulk_failed(job_id: str):
-    text = await foco_client.bulk_results(job_id, "failedResults")
-    return PlainTextResponse(text, media_type="text/csv")
+async def bulk_failed(job_id: str, request: Request):
+    return await _bulk_results_response(job_id, "failedResults", request)
 
 @app.get("/api/bulk/job/{job_id}/unprocessedrecords")
-async def bulk_unprocessed(job_id: str):
-    text = await foco_client.bulk_results(job_id, "unprocessedrecords")
-    return PlainTextResponse(text, media_type="text/csv")
+async def bulk_unprocessed(job_id: str, request: Request):
+    return await _bulk_results_response(job_id, "unprocessedrecords", request)
+
+# -----------------------------
+# API: acompanhamento de jobs de ingestão (polling no servidor + SSE)
+# -----------------------------
+class BulkTrackRequest(BaseModel):
+    jobIds: List[str]
+
+@app.post("/api/bulk/tracker/jobs")
+async def bulk_tracker_add(payload: BulkTrackRequest):
+    jobs = [bulk_orchestrator.track(job_id) for job_id in payload.jobIds]
+    return {"status": "ok", "jobs": [j.as_dict() for j in jobs]}
+
+@app.get("/api/bulk/tracker/jobs")
+async def bulk_tracker_list():
+    return {"in_flight": bulk_orchestrator.in_flight(), "jobs": bulk_orchestrator.snapshot()}
+
+@app.get("/api/bulk/tracker/jobs/{job_id}")
+async def bulk_tracker_job(job_id: str):
+    jobs = bulk_orchestrator.snapshot([job_id])
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job não acompanhado")
+    return jobs[0]
+
+@app.delete("/api/bulk/tracker/jobs/{job_id}")
+async def bulk_tracker_remove(job_id: str):
+    return {"status": "ok", "removed": bulk_orchestrator.untrack(job_id)}
+
+@app.get("/api/bulk/tracker/jobs/{job_id}/{kind}")
+async def bulk_tracker_results(job_id: str, kind: str):
+    # Resultados baixados automaticamente quando o job terminou
+    if kind not in ("failedResults", "unprocessedrecords"):
+        raise HTTPException(status_code=404, detail="Tipo de resultado inválido")
+    path = bulk_orchestrator.result_path(job_id, kind)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Resultado ainda não disponível")
+    return FileResponse(path, media_type="text/csv")
+
+@app.get("/api/bulk/tracker/events")
+async def bulk_tracker_events(job_id: Optional[List[str]] = Query(None, alias="jobId")):
+    return StreamingResponse(
+        bulk_orchestrator.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# -----------------------------
+# API: Bulk API v2 (Query)
+# -----------------------------
+class BulkQueryJobRequest(BaseModel):
+    query: str
+    operation: Optional[str] = "query"
+    columnDelimiter: Optional[str] = None
+    lineEnding: Optional[str] = None
+
+class BulkQueryDownloadRequest(BaseModel):
+    filename: str
+    maxRecords: Optional[int] = None
+    concurrency: Optional[int] = None
+    wait: bool = True
+    timeout: float = 600.0
+
+@app.post("/api/bulk/query")
+async def bulk_query_create(payload: BulkQueryJobRequest):
+    body = payload.model_dump(exclude_none=True)
+    data = await foco_client.bulk_query_create_job(body)
+    return JSONResponse(content=data)
+
+@app.get("/api/bulk/query/{job_id}")
+async def bulk_query_status(job_id: str):
+    data = await foco_client.bulk_query_job_status(job_id)
+    return JSONResponse(content=data)
+
+@app.patch("/api/bulk/query/{job_id}")
+async def bulk_query_abort(job_id: str):
+    data = await foco_client.bulk_query_abort(job_id)
+    return JSONResponse(content=data)
+
+@app.get("/api/bulk/query/{job_id}/results")
+async def bulk_query_results(
+    job_id: str,
+    max_records: Optional[int] = Query(None, alias="maxRecords"),
+    concurrency: Optional[int] = Query(None, ge=1, le=32),
+    wait: bool = Query(False, description="Aguarda o job terminar antes de baixar"),
+    timeout: float = Query(600.0),
+):
+    await ensure_job_complete(foco_client, job_id, wait=wait, timeout=timeout)
+    download = BulkQueryDownload(
+        foco_client,
+        job_id,
+        max_records=max_records or FOCO_BULK_QUERY_MAX_RECORDS,
+        concurrency=concurrency or FOCO_BULK_QUERY_CONCURRENCY,
+    )
+    return StreamingResponse(download.iter_csv(), media_type="text/csv")
+
+@app.post("/api/bulk/query/{job_id}/download")
+async def bulk_query_download(job_id: str, payload: BulkQueryDownloadRequest):
+    # Grava apenas dentro de FOCO_BULK_DOWNLOAD_DIR (o nome do arquivo não pode conter diretórios)
+    filename = os.path.basename(payload.filename.strip())
+    if not filename or filename in (".", ".."):
+        raise HTTPException(status_code=400, detail="Nome de arquivo inválido")
+    os.makedirs(FOCO_BULK_DOWNLOAD_DIR, exist_ok=True)
+    path = os.path.join(FOCO_BULK_DOWNLOAD_DIR, filename)
+    await ensure_job_complete(foco_client, job_id, wait=payload.wait, timeout=payload.timeout)
+    download = BulkQueryDownload(
+        foco_client,
+        job_id,
+        max_records=payload.maxRecords or FOCO_BULK_QUERY_MAX_RECORDS,
+        concurrency=payload.concurrency or FOCO_BULK_QUERY_CONCURRENCY,
+    )
+    stats = await download.write_to(path)
+    return {"status": "ok", "path": path, **stats}
 
 @app.get("/api/config")
 async def get_config():
@@ -410,6 +1894,7 @@ async def get_config():
         if len(s) <= 6:
             return "***"
         return s[:3] + "***" + s[-3:]
+    await foco_client.sync_state()
     return {
         "base_url": foco_client.base_url,
         "login_url": foco_client.login_url,
@@ -420,50 +1905,23 @@ async def get_config():
         "password": "***",
         "security_token": "***",
         "grant_type": foco_client.grant_type,
+        "version": foco_client.config_version,
+        "state_backend": foco_client.state.name,
     }
 
 @app.post("/api/config")
 async def set_config(cfg: ConfigUpdate):
     data = cfg.model_dump(exclude_none=True)
-    # Atualiza client in-memory
-    foco_client.base_url = data.get("base_url", foco_client.base_url).rstrip("/")
-    foco_client.login_url = data.get("login_url", foco_client.login_url)
-    foco_client.api_version = data.get("api_version", foco_client.api_version)
-    foco_client.client_id = data.get("client_id", foco_client.client_id)
-    foco_client.client_secret = data.get("client_secret", foco_client.client_secret)
-    foco_client.username = data.get("username", foco_client.username)
-    foco_client.password = data.get("password", foco_client.password)
-    foco_client.security_token = data.get("security_token", foco_client.security_token)
-    foco_client.grant_type = (data.get("grant_type", foco_client.grant_type) or "password").lower()
-    # Zera token/instância para forçar novo login com config atualizada
-    foco_client.access_token = None
-    foco_client.instance_url = None
-    # Atualiza variáveis de ambiente para persistir durante o processo
-    os.environ["FOCO_BASE_URL"] = foco_client.base_url
-    os.environ["FOCO_LOGIN_URL"] = foco_client.login_url
-    os.environ["FOCO_API_VERSION"] = foco_client.api_version
-    os.environ["FOCO_CLIENT_ID"] = foco_client.client_id
-    os.environ["FOCO_CLIENT_SECRET"] = foco_client.client_secret
-    os.environ["FOCO_USERNAME"] = foco_client.username
-    os.environ["FOCO_PASSWORD"] = foco_client.password
-    os.environ["FOCO_SECURITY_TOKEN"] = foco_client.security_token
-    os.environ["FOCO_GRANT_TYPE"] = foco_client.grant_type
-    return {"status": "ok"}
+    # Gravada no estado compartilhado: os demais workers aplicam ao ver a nova versão
+    version = await foco_client.update_config(data)
+    return {"status": "ok", "version": version}
 
 
 class LogoutResponse(BaseModel):
     status: str
 
-# Add logout endpoint
-@app.post("/api/logout")
+@app.post("/api/logout", response_model=LogoutResponse)
 async def logout():
-    try:
-        # Basic stateless logout: clear cached token in memory if any
-        # If FOCOClient stores token, reset it
-        global fococlient
-        if 'fococlient' in globals() and hasattr(fococlient, 'access_token'):
-            fococlient.access_token = None
-            fococlient.instance_url = None
-        return {"status": "logged_out"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    # Descarta o token deste e dos demais workers
+    await foco_client.logout()
+    return {"status": "logged_out"}
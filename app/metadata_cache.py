@@ -0,0 +1,255 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.jsoncodec import loads
+
+
+@dataclass
+class CacheEntry:
+    raw: bytes
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    _data: Optional[dict] = field(default=None, repr=False, compare=False)
+
+    @property
+    def data(self) -> dict:
+        # Decodificado sob demanda e uma única vez: rotas em passthrough servem `raw` direto
+        if self._data is None:
+            self._data = loads(self.raw)
+        return self._data
+
+
+# Recebe os headers condicionais (If-None-Match / If-Modified-Since) e devolve a resposta do gateway
+Fetcher = Callable[[Dict[str, str]], Awaitable[httpx.Response]]
+
+
+# Intervalo mínimo (s) entre duas limpezas de entradas antigas no disco
+PRUNE_INTERVAL = 3600.0
+
+
+# Persistência em SQLite (payload JSON comprimido) para o processo iniciar com o cache aquecido.
+# Entradas mais velhas que `max_age` (objetos removidos, ambientes que não são mais usados) são
+# apagadas ao abrir e, depois, no máximo uma vez por PRUNE_INTERVAL durante as gravações
+class MetadataStore:
+    def __init__(self, path: str, max_age: Optional[float] = None):
+        self.path = path
+        self.max_age = max_age
+        self._pruned_at = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, fetched_at REAL NOT NULL,"
+            " etag TEXT, last_modified TEXT)"
+        )
+        self._conn.commit()
+        self.prune()
+
+    def _oldest(self) -> float:
+        return time.time() - self.max_age if self.max_age else 0.0
+
+    def prune(self) -> int:
+        self._pruned_at = time.time()
+        if not self.max_age:
+            return 0
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM metadata WHERE fetched_at < ?", (self._oldest(),)).rowcount
+            self._conn.commit()
+        return removed
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, fetched_at, etag, last_modified FROM metadata WHERE key = ? AND fetched_at >= ?",
+                (key, self._oldest()),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            raw = zlib.decompress(row[0])
+        except zlib.error:
+            return None
+        return CacheEntry(raw=raw, fetched_at=row[1], etag=row[2], last_modified=row[3])
+
+    def save(self, key: str, entry: CacheEntry) -> None:
+        blob = zlib.compress(entry.raw)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, data, fetched_at, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, entry.fetched_at, entry.etag, entry.last_modified),
+            )
+            self._conn.commit()
+        if time.time() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+
+    def delete(self, keys: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM metadata WHERE key = ?", [(k,) for k in keys])
+            self._conn.commit()
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM metadata WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# LRU com TTL por entrada para sobjects/describe, revalidado com ETag/If-Modified-Since
+class MetadataCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, store: Optional[MetadataStore] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.store = store
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.disk_hits = 0
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            # Entradas removidas da memória continuam no disco
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.store is None:
+            return None
+        entry = await asyncio.to_thread(self.store.load, key)
+        if entry is not None:
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    async def get(self, key: str, fetch: Fetcher, force: bool = False) -> dict:
+        return (await self.get_entry(key, fetch, force=force)).data
+
+    async def get_entry(self, key: str, fetch: Fetcher, force: bool = False) -> CacheEntry:
+        entry = await self._lookup(key)
+        if entry is not None and not force and time.time() - entry.fetched_at < self.ttl:
+            self.hits += 1
+            return entry
+        # Coalesce buscas concorrentes da mesma chave. A busca é uma tarefa do cache: se quem a
+        # iniciou for cancelado (cliente desconectou), as demais ainda recebem o resultado
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh(key, entry, fetch, force))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Evita "Task exception was never retrieved" quando ninguém mais aguarda
+            task.exception()
+
+    def cached(self, key: str) -> Optional[CacheEntry]:
+        # Entrada em memória, mesmo vencida, sem consultar o disco nem mexer na ordem do LRU
+        return self._entries.get(key)
+
+    async def peek(self, key: str) -> Optional[CacheEntry]:
+        # Entrada ainda válida (memória ou disco), sem buscar no gateway
+        entry = await self._lookup(key)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            return entry
+        return None
+
+    async def put(self, key: str, raw: bytes) -> CacheEntry:
+        # Grava um corpo obtido por outro caminho (ex.: composite/batch); sem ETag, a revalidação
+        # seguinte usa If-Modified-Since com o instante da busca
+        now = time.time()
+        entry = CacheEntry(raw=raw, fetched_at=now, last_modified=formatdate(now, usegmt=True))
+        self.misses += 1
+        self._remember(key, entry)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, key, entry)
+        return entry
+
+    async def _refresh(self, key: str, entry: Optional[CacheEntry], fetch: Fetcher, force: bool) -> CacheEntry:
+        validators: Dict[str, str] = {}
+        if entry is not None and not force:
+            if entry.etag:
+                validators["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                validators["If-Modified-Since"] = entry.last_modified
+        resp = await fetch(validators)
+        now = time.time()
+        if resp.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            entry.fetched_at = now
+        else:
+            self.misses += 1
+            entry = CacheEntry(
+                raw=resp.content,
+                fetched_at=now,
+                etag=resp.headers.get("ETag"),
+                # Sem Last-Modified do gateway, usa o instante da busca como referência
+                last_modified=resp.headers.get("Last-Modified") or formatdate(now, usegmt=True),
+            )
+        self._remember(key, entry)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, key, entry)
+        return entry
+
+    async def invalidate(self, keys: Optional[List[str]] = None, prefix: Optional[str] = None) -> int:
+        removed = 0
+        if keys:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    removed += 1
+            if self.store is not None:
+                await asyncio.to_thread(self.store.delete, list(keys))
+        if prefix is not None:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+                removed += 1
+            if self.store is not None:
+                await asyncio.to_thread(self.store.delete_prefix, prefix)
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "disk_hits": self.disk_hits,
+            "disk_entries": self.store.count() if self.store is not None else None,
+            "disk_max_age": self.store.max_age if self.store is not None else None,
+            "disk_path": self.store.path if self.store is not None else None,
+        }
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
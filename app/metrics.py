@@ -0,0 +1,172 @@
+import contextvars
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+# Buckets (s) para chamadas ao gateway e para as rotas da aplicação
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinação de labels: contagem por bucket (não cumulativa), soma e total
+        self.series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self.series[labels] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+def gauge(name: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    # Valores lidos no momento da coleta (pool, jobs em andamento, estado do circuito)
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+    return lines
+
+
+def counter_value(name: str, help: str, value: float) -> List[str]:
+    # Contadores mantidos fora do registro (ex.: logins do FOCOClient)
+    return [f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {_number(value)}"]
+
+
+class RequestTiming:
+    def __init__(self):
+        self.gateway = 0.0
+        self.calls = 0
+
+    def header(self, total: float) -> str:
+        local = max(total - self.gateway, 0.0)
+        return (
+            f'gateway;dur={self.gateway * 1000:.1f};desc="{self.calls} chamadas", '
+            f"app;dur={local * 1000:.1f}, total;dur={total * 1000:.1f}"
+        )
+
+
+# Tempo gasto no gateway durante a requisição atual (preenchido pelo FOCOClient)
+request_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("foco_request_timing", default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self.upstream_latency = Histogram(
+            "foco_upstream_request_duration_seconds",
+            "Latência das chamadas ao gateway FOCO (até os cabeçalhos da resposta)",
+            ("operation", "sobject"),
+        )
+        self.upstream_requests = Counter("foco_upstream_requests_total", "Chamadas ao gateway por operação e status", ("operation", "status"))
+        self.upstream_request_bytes = Counter("foco_upstream_request_bytes_total", "Bytes enviados ao gateway", ("operation",))
+        self.upstream_response_bytes = Counter("foco_upstream_response_bytes_total", "Bytes recebidos do gateway (corpo lido ou Content-Length)", ("operation",))
+        self.http_latency = Histogram("foco_http_request_duration_seconds", "Duração das rotas da aplicação (até os cabeçalhos da resposta)", ("route",))
+        self.http_requests = Counter("foco_http_requests_total", "Requisições recebidas por rota, método e status", ("route", "method", "status"))
+
+    def observe_upstream(self, operation: str, sobject: str, status: str, seconds: float, request_bytes: int, response_bytes: int) -> None:
+        self.upstream_latency.observe(seconds, operation, sobject)
+        self.upstream_requests.inc(operation, status)
+        if request_bytes:
+            self.upstream_request_bytes.inc(operation, amount=request_bytes)
+        if response_bytes:
+            self.upstream_response_bytes.inc(operation, amount=response_bytes)
+        timing = request_timing.get()
+        if timing is not None:
+            timing.gateway += seconds
+            timing.calls += 1
+
+    def render(self, extra: Iterable[List[str]] = ()) -> str:
+        lines: List[str] = []
+        for metric in (self.upstream_latency, self.upstream_requests, self.upstream_request_bytes, self.upstream_response_bytes, self.http_latency, self.http_requests):
+            lines.extend(metric.render())
+        for block in extra:
+            lines.extend(block)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    # Middleware ASGI: mede cada rota e, opcionalmente, devolve Server-Timing (gateway x processamento local)
+    def __init__(self, app, metrics: Metrics, server_timing: bool = False):
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+        token = request_timing.set(timing)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                # Rota como template (/api/describe/{object_name}) para limitar a cardinalidade
+                path = getattr(scope.get("route"), "path", None) or "unmatched"
+                self.metrics.http_latency.observe(elapsed, path)
+                self.metrics.http_requests.inc(path, scope.get("method", ""), str(message["status"]))
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", timing.header(elapsed))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timing.reset(token)
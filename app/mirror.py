@@ -0,0 +1,781 @@
+import asyncio
+import csv
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from app.bulk_query import BulkQueryDownload
+from app.jsoncodec import dumps, loads
+from app.ratelimit import batch_traffic
+
+if TYPE_CHECKING:
+    from app.main import FOCOClient
+
+logger = logging.getLogger("mapeamentofoco")
+
+# Tipos que a Bulk API não exporta (campos compostos e binários)
+EXCLUDED_TYPES = ("address", "location", "base64", "complexvalue")
+INTEGER_TYPES = ("int", "long")
+REAL_TYPES = ("double", "currency", "percent")
+# Texto usa COLLATE NOCASE (o SOQL não diferencia maiúsculas), exceto Ids e valores de data/hora
+CASE_SENSITIVE_TYPES = ("id", "reference", "date", "datetime", "time")
+
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+INSERT_BATCH = 2000
+
+Field = Tuple[str, str]
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+# -----------------------------
+# Conversão de valores
+# -----------------------------
+def normalize_datetime(value: str) -> str:
+    # Guarda datetimes em UTC num formato único, para que comparações de texto sigam a ordem cronológica
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _to_storage(value, ftype: str):
+    if value is None or value == "":
+        return None
+    if ftype == "boolean":
+        return 1 if value is True or str(value).lower() == "true" else 0
+    if ftype in INTEGER_TYPES:
+        return int(float(value))
+    if ftype in REAL_TYPES:
+        return float(value)
+    if ftype == "datetime":
+        return normalize_datetime(str(value))
+    return value
+
+
+def _to_json(value, ftype: str):
+    if value is None:
+        return None
+    if ftype == "boolean":
+        return bool(value)
+    if ftype == "datetime":
+        # Mesmo formato da API REST (2024-06-01T12:00:00.000+0000)
+        return value[:-1] + "+0000"
+    return value
+
+
+def mirror_fields(describe: dict) -> List[Field]:
+    fields = [(f["name"], f.get("type") or "string") for f in describe.get("fields") or [] if f.get("type") not in EXCLUDED_TYPES]
+    names = {name for name, _ in fields}
+    if "Id" not in names or "SystemModstamp" not in names:
+        raise HTTPException(status_code=400, detail=f"{describe.get('name')} não tem Id/SystemModstamp; não pode ser espelhado")
+    return fields
+
+
+def _column(name: str, ftype: str) -> str:
+    if ftype in ("boolean",) + INTEGER_TYPES:
+        affinity = "INTEGER"
+    elif ftype in REAL_TYPES:
+        affinity = "REAL"
+    else:
+        affinity = "TEXT" if ftype in CASE_SENSITIVE_TYPES else "TEXT COLLATE NOCASE"
+    if name == "Id":
+        return '"Id" TEXT PRIMARY KEY'
+    return f'"{name}" {affinity}'
+
+
+def _table(object_name: str) -> str:
+    if not _NAME_RE.match(object_name):
+        raise ValueError(f"Nome de objeto inválido: {object_name}")
+    return f"mirror_{object_name.lower()}"
+
+
+def _insert_sql(table: str, fields: List[Field]) -> str:
+    columns = ", ".join(f'"{name}"' for name, _ in fields)
+    return f'INSERT OR REPLACE INTO "{table}" ({columns}) VALUES ({", ".join("?" * len(fields))})'
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -----------------------------
+# Armazenamento (SQLite)
+# -----------------------------
+@dataclass
+class MirrorMeta:
+    object: str
+    env: str
+    fields: List[Field]
+    watermark: Optional[str] = None
+    deleted_watermark: Optional[str] = None
+    loaded_at: Optional[float] = None
+    synced_at: Optional[float] = None
+    rows: int = 0
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        now = time.time()
+        return {
+            "object": self.object,
+            "rows": self.rows,
+            "fields": len(self.fields),
+            "watermark": self.watermark,
+            "deletedWatermark": self.deleted_watermark,
+            "loadedAt": self.loaded_at,
+            "syncedAt": self.synced_at,
+            "age": round(now - self.synced_at, 1) if self.synced_at else None,
+            "lastError": self.last_error,
+        }
+
+
+class MirrorStore:
+    # Uma tabela por objeto (uma coluna por campo) e a tabela mirror_meta com as marcas d'água.
+    # Leituras e deltas usam a conexão principal; a carga completa usa uma conexão própria e
+    # troca a tabela numa única transação, então consultas locais seguem respondendo durante a carga.
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mirror_meta ("
+            " object TEXT PRIMARY KEY, env TEXT NOT NULL, fields TEXT NOT NULL, watermark TEXT,"
+            " deleted_watermark TEXT, loaded_at REAL, synced_at REAL, rows INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def load_meta(self, object_name: str) -> Optional[MirrorMeta]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT object, env, fields, watermark, deleted_watermark, loaded_at, synced_at, rows, last_error"
+                " FROM mirror_meta WHERE lower(object) = lower(?)",
+                (object_name,),
+            ).fetchone()
+        if row is None:
+            return None
+        return MirrorMeta(row[0], row[1], [tuple(f) for f in loads(row[2])], *row[3:])
+
+    def _save_meta(self, conn: sqlite3.Connection, meta: MirrorMeta) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO mirror_meta (object, env, fields, watermark, deleted_watermark, loaded_at, synced_at, rows, last_error)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (meta.object, meta.env, dumps(meta.fields).decode("utf-8"), meta.watermark, meta.deleted_watermark, meta.loaded_at, meta.synced_at, meta.rows, meta.last_error),
+        )
+
+    def save_meta(self, meta: MirrorMeta) -> None:
+        with self._lock:
+            with self._conn:
+                self._save_meta(self._conn, meta)
+
+    def replace_table(self, meta: MirrorMeta, rows: Iterable[Sequence]) -> int:
+        # Carga completa em tabela nova; a troca (e a gravação da meta) é atômica
+        table = _table(meta.object)
+        staging = f"{table}__load"
+        conn = self._connect()
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+            conn.execute(f'CREATE TABLE "{staging}" ({", ".join(_column(n, t) for n, t in meta.fields)})')
+            sql = _insert_sql(staging, meta.fields)
+            batch: List[Sequence] = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH:
+                    conn.executemany(sql, batch)
+                    batch = []
+            if batch:
+                conn.executemany(sql, batch)
+            # Linhas com Id repetido (páginas sobrepostas) substituem a anterior
+            meta.rows = conn.execute(f'SELECT COUNT(*) FROM "{staging}"').fetchone()[0]
+            with conn:
+                conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+                for name, ftype in meta.fields:
+                    if ftype == "reference" or name in ("SystemModstamp", "Name"):
+                        conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}__{name.lower()}" ON "{table}" ("{name}")')
+                self._save_meta(conn, meta)
+            return meta.rows
+        finally:
+            conn.close()
+
+    def apply_changes(self, meta: MirrorMeta, rows: List[Sequence], deleted_ids: Sequence[str]) -> None:
+        table = _table(meta.object)
+        with self._lock:
+            with self._conn:
+                if rows:
+                    self._conn.executemany(_insert_sql(table, meta.fields), rows)
+                if deleted_ids:
+                    self._conn.executemany(f'DELETE FROM "{table}" WHERE "Id" = ?', [(i,) for i in deleted_ids])
+                meta.rows = self._conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                self._save_meta(self._conn, meta)
+
+    def execute(self, sql: str, params: Sequence) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def drop(self, object_name: str) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute(f'DROP TABLE IF EXISTS "{_table(object_name)}"')
+                self._conn.execute("DELETE FROM mirror_meta WHERE lower(object) = lower(?)", (object_name,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# -----------------------------
+# SOQL → SQL (subconjunto atendido localmente)
+# -----------------------------
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*')
+    |(?P<datetime>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2}))
+    |(?P<date>\d{4}-\d{2}-\d{2})
+    |(?P<number>-?\d+(?:\.\d+)?)
+    |(?P<op><=|>=|!=|<>|=|<|>)
+    |(?P<punct>[(),])
+    |(?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+    |(?P<other>\S)
+    )""",
+    re.VERBOSE,
+)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_CLAUSES = ("where", "order", "limit", "offset")
+
+
+def _tokenize(soql: str) -> List[Tuple[str, str]]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(soql.strip()):
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        if kind == "other":
+            raise UnsupportedQuery(f"símbolo não suportado: {match.group(kind)}")
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _unescape(literal: str) -> str:
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), literal[1:-1])
+
+
+def _like_pattern(literal: str) -> str:
+    # Padrão para LIKE ... ESCAPE '\': \_ e \% continuam escapados (no SOQL são literais, não
+    # curingas) e a barra literal é escapada de novo; os demais escapes viram o próprio caractere
+    def escape(match: re.Match) -> str:
+        char = match.group(1)
+        if char in "_%\\":
+            return "\\" + char
+        return _ESCAPES.get(char, char)
+    return re.sub(r"\\(.)", escape, literal[1:-1])
+
+
+@dataclass
+class LocalQuery:
+    meta: MirrorMeta
+    sql: str
+    params: List
+    fields: List[Field]
+
+
+class _Compiler:
+    # SELECT campos FROM Objeto [WHERE ...] [ORDER BY ...] [LIMIT n] [OFFSET n], com =, !=, <, >,
+    # LIKE, IN/NOT IN, AND/OR/NOT e literais simples. Relacionamentos, subconsultas, funções,
+    # literais de data relativos (TODAY, LAST_N_DAYS) e binds ficam para o gateway.
+    def __init__(self, soql: str, resolve: Callable[[str], MirrorMeta]):
+        self.tokens = _tokenize(soql)
+        self.pos = 0
+        self.resolve = resolve
+        self.fields: Dict[str, Field] = {}
+        self.params: List = []
+
+    def _peek(self, offset: int = 0) -> Tuple[str, str]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else ("end", "")
+
+    def _next(self) -> Tuple[str, str]:
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _keyword(self, *words: str) -> bool:
+        kind, value = self._peek()
+        if kind == "name" and value.lower() in words:
+            self.pos += 1
+            return True
+        return False
+
+    def _expect(self, word: str) -> None:
+        if not self._keyword(word):
+            raise UnsupportedQuery(f"esperado {word.upper()}")
+
+    def _field(self) -> Field:
+        kind, value = self._next()
+        if kind != "name" or value.lower() in _CLAUSES + ("from", "and", "or", "not"):
+            raise UnsupportedQuery(f"campo esperado, encontrado '{value}'")
+        if "." in value:
+            raise UnsupportedQuery(f"campos de relacionamento não são suportados ({value})")
+        if self._peek()[1] == "(":
+            raise UnsupportedQuery(f"funções não são suportadas ({value})")
+        field = self.fields.get(value.lower())
+        if field is None:
+            raise UnsupportedQuery(f"campo {value} não está no espelho")
+        return field
+
+    def compile(self) -> LocalQuery:
+        self._expect("select")
+        selected = [self._field_name()]
+        while self._peek() == ("punct", ","):
+            self.pos += 1
+            selected.append(self._field_name())
+        self._expect("from")
+        kind, object_name = self._next()
+        if kind != "name" or "." in object_name:
+            raise UnsupportedQuery("objeto esperado após FROM")
+        meta = self.resolve(object_name)
+        self.fields = {name.lower(): (name, ftype) for name, ftype in meta.fields}
+        columns = [self._resolve_selected(name) for name in selected]
+        select = ", ".join(f'"{name}"' for name, _ in columns)
+        sql = f'SELECT "Id", {select} FROM "{_table(meta.object)}"'
+        if self._keyword("where"):
+            sql += " WHERE " + self._or()
+        if self._keyword("order"):
+            self._expect("by")
+            sql += " ORDER BY " + self._order()
+        if self._keyword("limit"):
+            sql += " LIMIT " + self._integer()
+            if self._keyword("offset"):
+                sql += " OFFSET " + self._integer()
+        elif self._keyword("offset"):
+            sql += " LIMIT -1 OFFSET " + self._integer()
+        if self._peek()[0] != "end":
+            raise UnsupportedQuery(f"cláusula não suportada: {self._peek()[1]}")
+        return LocalQuery(meta=meta, sql=sql, params=self.params, fields=columns)
+
+    def _field_name(self) -> str:
+        kind, value = self._next()
+        if kind != "name" or value.lower() == "from":
+            raise UnsupportedQuery(f"campo esperado, encontrado '{value}'")
+        if "." in value:
+            raise UnsupportedQuery(f"campos de relacionamento não são suportados ({value})")
+        if self._peek()[1] == "(":
+            raise UnsupportedQuery(f"funções e subconsultas não são suportadas ({value})")
+        return value
+
+    def _resolve_selected(self, name: str) -> Field:
+        field = self.fields.get(name.lower())
+        if field is None:
+            raise UnsupportedQuery(f"campo {name} não está no espelho")
+        return field
+
+    def _integer(self) -> str:
+        kind, value = self._next()
+        if kind != "number" or not value.isdigit():
+            raise UnsupportedQuery("LIMIT/OFFSET precisam de um inteiro")
+        return value
+
+    def _order(self) -> str:
+        parts = []
+        while True:
+            name, _ = self._field()
+            part = f'"{name}"'
+            if self._keyword("desc"):
+                part += " DESC"
+            else:
+                self._keyword("asc")
+            if self._keyword("nulls"):
+                if self._keyword("first"):
+                    part += " NULLS FIRST"
+                elif self._keyword("last"):
+                    part += " NULLS LAST"
+                else:
+                    raise UnsupportedQuery("NULLS FIRST|LAST esperado")
+            parts.append(part)
+            if self._peek() != ("punct", ","):
+                return ", ".join(parts)
+            self.pos += 1
+
+    def _or(self) -> str:
+        parts = [self._and()]
+        while self._keyword("or"):
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+    def _and(self) -> str:
+        parts = [self._not()]
+        while self._keyword("and"):
+            parts.append(self._not())
+        return parts[0] if len(parts) == 1 else "(" + " AND ".join(parts) + ")"
+
+    def _not(self) -> str:
+        if self._keyword("not"):
+            return f"NOT ({self._not()})"
+        if self._peek() == ("punct", "("):
+            self.pos += 1
+            inner = self._or()
+            if self._next() != ("punct", ")"):
+                raise UnsupportedQuery("parêntese não fechado")
+            return f"({inner})"
+        return self._condition()
+
+    def _condition(self) -> str:
+        name, ftype = self._field()
+        column = f'"{name}"'
+        kind, value = self._peek()
+        if kind == "op":
+            self.pos += 1
+            literal = self._literal(ftype)
+            op = "!=" if value == "<>" else value
+            if literal is None:
+                if op == "=":
+                    return f"{column} IS NULL"
+                if op == "!=":
+                    return f"{column} IS NOT NULL"
+                raise UnsupportedQuery("null só pode ser comparado com = ou !=")
+            self.params.append(literal)
+            # No SOQL, "!=" também devolve os registros com o campo nulo
+            return f"{column} IS NOT ?" if op == "!=" else f"{column} {op} ?"
+        negate = self._keyword("not")
+        if self._keyword("in"):
+            values = self._list(ftype)
+            placeholders = ", ".join("?" * len(values))
+            self.params.extend(values)
+            if negate:
+                return f"({column} IS NULL OR {column} NOT IN ({placeholders}))"
+            return f"{column} IN ({placeholders})"
+        if not negate and self._keyword("like"):
+            kind, literal = self._next()
+            if kind != "string":
+                raise UnsupportedQuery("LIKE precisa de um texto")
+            self.params.append(_like_pattern(literal))
+            return f"{column} LIKE ? ESCAPE '\\'"
+        raise UnsupportedQuery(f"operador não suportado após {name}: {self._peek()[1]}")
+
+    def _list(self, ftype: str) -> List:
+        if self._next() != ("punct", "("):
+            raise UnsupportedQuery("lista esperada após IN")
+        if self._peek()[0] == "name" and self._peek()[1].lower() == "select":
+            raise UnsupportedQuery("semi-joins não são suportados")
+        values = []
+        while True:
+            literal = self._literal(ftype)
+            if literal is not None:
+                values.append(literal)
+            kind, value = self._next()
+            if value == ")":
+                return values
+            if value != ",":
+                raise UnsupportedQuery("lista IN malformada")
+
+    def _literal(self, ftype: str):
+        kind, value = self._next()
+        lowered = value.lower()
+        if kind == "name" and lowered == "null":
+            return None
+        if ftype == "boolean":
+            if kind == "name" and lowered in ("true", "false"):
+                return 1 if lowered == "true" else 0
+            raise UnsupportedQuery("campo booleano exige true/false")
+        if ftype == "datetime":
+            if kind != "datetime":
+                raise UnsupportedQuery("campo datetime exige literal AAAA-MM-DDThh:mm:ssZ")
+            return normalize_datetime(value)
+        if ftype == "date":
+            if kind != "date":
+                raise UnsupportedQuery("campo date exige literal AAAA-MM-DD")
+            return value
+        if ftype in INTEGER_TYPES + REAL_TYPES:
+            if kind != "number":
+                raise UnsupportedQuery("campo numérico exige número")
+            return float(value) if "." in value else int(value)
+        if kind != "string":
+            raise UnsupportedQuery(f"literal não suportado: {value}")
+        return _unescape(value)
+
+
+# -----------------------------
+# Sincronização
+# -----------------------------
+class SObjectMirror:
+    # Espelho local de objetos de referência: carga inicial via Bulk Query e, depois, deltas por
+    # SystemModstamp (REST) e exclusões via getDeleted, em ciclos de `interval` segundos.
+    # Com vários workers, só quem obtém o lease "mirror" do estado compartilhado sincroniza;
+    # todos leem o mesmo arquivo SQLite.
+    def __init__(
+        self,
+        client: "FOCOClient",
+        store: MirrorStore,
+        objects: Sequence[str],
+        interval: float = 300.0,
+        lag: float = 60.0,
+        max_staleness: Optional[float] = None,
+        bulk_timeout: float = 1800.0,
+        lock_ttl: float = 3600.0,
+    ):
+        self.client = client
+        self.store = store
+        self.objects = [o for o in objects if o]
+        self.interval = interval
+        self.lag = lag
+        self.max_staleness = max_staleness if max_staleness is not None else interval * 2
+        self.bulk_timeout = bulk_timeout
+        self.lock_ttl = lock_ttl
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.syncing: Dict[str, str] = {}
+        # Falhas esperam um intervalo inteiro antes de nova tentativa
+        self._failed_at: Dict[str, float] = {}
+        self.full_loads = 0
+        self.delta_syncs = 0
+        self._requested: Dict[str, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.objects and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def request_sync(self, objects: Optional[Sequence[str]] = None, full: bool = False) -> List[str]:
+        wanted = self._configured(objects) if objects else list(self.objects)
+        for name in wanted:
+            self._requested[name] = self._requested.get(name, False) or full
+        self._wakeup.set()
+        return wanted
+
+    def _configured(self, objects: Sequence[str]) -> List[str]:
+        by_lower = {o.lower(): o for o in self.objects}
+        unknown = [o for o in objects if o.lower() not in by_lower]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Objetos fora do espelho (FOCO_MIRROR_OBJECTS): {', '.join(unknown)}")
+        return [by_lower[o.lower()] for o in objects]
+
+    def status(self) -> dict:
+        objects = []
+        for name in self.objects:
+            meta = self.store.load_meta(name)
+            item = meta.as_dict() if meta is not None else {"object": name, "rows": 0, "syncedAt": None}
+            item["syncing"] = self.syncing.get(name)
+            item["stale"] = meta is None or not meta.synced_at or time.time() - meta.synced_at > self.max_staleness
+            objects.append(item)
+        return {
+            "interval": self.interval,
+            "maxStaleness": self.max_staleness,
+            "fullLoads": self.full_loads,
+            "deltaSyncs": self.delta_syncs,
+            "objects": objects,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            requested, self._requested = self._requested, {}
+            try:
+                await self._cycle(requested)
+            except Exception:
+                logger.exception("Falha na sincronização do espelho local")
+            self._wakeup.clear()
+            if self._requested:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_due())
+            except asyncio.TimeoutError:
+                pass
+
+    def _last_attempt(self, name: str) -> float:
+        meta = self.store.load_meta(name)
+        return max((meta.synced_at or 0) if meta else 0, self._failed_at.get(name, 0))
+
+    def _next_due(self) -> float:
+        now = time.time()
+        return max(min(self._last_attempt(name) + self.interval - now for name in self.objects), 1.0)
+
+    async def _cycle(self, requested: Dict[str, bool]) -> None:
+        now = time.time()
+        due = {name: requested.get(name, False) for name in self.objects if name in requested or now - self._last_attempt(name) >= self.interval}
+        if not due:
+            return
+        if not await asyncio.to_thread(self.client.state.try_acquire, "mirror", self.owner, self.lock_ttl):
+            # Outro worker está sincronizando; este só lê
+            return
+        try:
+            for name, full in due.items():
+                try:
+                    await self.sync(name, full=full)
+                    self._failed_at.pop(name, None)
+                except Exception:
+                    self._failed_at[name] = time.time()
+                    logger.exception("Falha ao sincronizar o espelho de %s", name)
+        finally:
+            await asyncio.to_thread(self.client.state.release, "mirror", self.owner)
+
+    async def sync(self, object_name: str, full: bool = False) -> MirrorMeta:
+        meta = self.store.load_meta(object_name)
+        try:
+            with batch_traffic():
+                fields = mirror_fields(await self.client.describe(object_name))
+                env = self.client.base_url
+                # Ambiente ou campos diferentes (ou watermark ausente) exigem carga completa
+                if full or meta is None or meta.env != env or meta.fields != fields or not meta.watermark:
+                    return await self._full_load(object_name, env, fields)
+                if not await self._delta(meta):
+                    return await self._full_load(object_name, env, fields)
+                return meta
+        except Exception as e:
+            if meta is not None:
+                meta.last_error = getattr(e, "detail", None) or str(e)
+                await asyncio.to_thread(self.store.save_meta, meta)
+            raise
+        finally:
+            self.syncing.pop(object_name, None)
+
+    async def _full_load(self, object_name: str, env: str, fields: List[Field]) -> MirrorMeta:
+        self.syncing[object_name] = "full"
+        started = _utc_now()
+        soql = f"SELECT {', '.join(name for name, _ in fields)} FROM {object_name}"
+        job = await self.client.bulk_query_create_job({"operation": "query", "query": soql})
+        status = await self.client.bulk_query_wait(job["id"], timeout=self.bulk_timeout)
+        if status.get("state") != "JobComplete":
+            raise HTTPException(status_code=502, detail=f"Carga do espelho de {object_name}: job {job['id']} em {status.get('state')}")
+        # O snapshot começa na criação do job: os deltas seguintes partem daí (menos a folga `lag`)
+        created = status.get("createdDate") or job.get("createdDate")
+        watermark = normalize_datetime(created) if created else normalize_datetime(started.isoformat())
+        directory = os.path.dirname(self.store.path) or "."
+        fd, path = tempfile.mkstemp(prefix=f"mirror_{object_name.lower()}_", suffix=".csv", dir=directory)
+        os.close(fd)
+        try:
+            await BulkQueryDownload(self.client, job["id"]).write_to(path)
+            meta = MirrorMeta(object=object_name, env=env, fields=fields, watermark=watermark, deleted_watermark=watermark)
+            meta.loaded_at = meta.synced_at = time.time()
+            await asyncio.to_thread(self.store.replace_table, meta, _read_csv(path, fields))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        self.full_loads += 1
+        logger.info("Espelho de %s carregado: %s registros", object_name, meta.rows)
+        return meta
+
+    async def _delta(self, meta: MirrorMeta) -> bool:
+        # Devolve False quando o histórico de exclusões não cobre a última sincronização
+        self.syncing[meta.object] = "delta"
+        since = datetime.fromisoformat(meta.watermark) - timedelta(seconds=self.lag)
+        soql = (
+            f"SELECT {', '.join(name for name, _ in meta.fields)} FROM {meta.object}"
+            f" WHERE SystemModstamp >= {since.strftime('%Y-%m-%dT%H:%M:%SZ')} ORDER BY SystemModstamp"
+        )
+        watermark = meta.watermark
+        async for page in self.client.query_pages(soql):
+            rows = [_record_row(record, meta.fields) for record in page.get("records") or []]
+            if rows:
+                modstamp = max(r.get("SystemModstamp") or "" for r in page["records"])
+                if modstamp:
+                    watermark = max(watermark, normalize_datetime(modstamp))
+                await asyncio.to_thread(self.store.apply_changes, meta, rows, ())
+        deleted, deleted_watermark = await self._deleted(meta)
+        if deleted is None:
+            return False
+        meta.watermark = watermark
+        meta.deleted_watermark = deleted_watermark
+        meta.synced_at = time.time()
+        meta.last_error = None
+        await asyncio.to_thread(self.store.apply_changes, meta, [], deleted)
+        self.delta_syncs += 1
+        return True
+
+    async def _deleted(self, meta: MirrorMeta) -> Tuple[Optional[List[str]], Optional[str]]:
+        start = datetime.fromisoformat(meta.deleted_watermark or meta.watermark) - timedelta(seconds=self.lag)
+        end = _utc_now()
+        # getDeleted trabalha em minutos e exige start < end
+        if end - start < timedelta(minutes=1):
+            return [], meta.deleted_watermark
+        try:
+            data = await self.client.get_deleted(meta.object, start, end)
+        except HTTPException as e:
+            if e.status_code == 400 and "INVALID_REPLICATION_DATE" in str(e.detail):
+                # Mais de 30 dias sem sincronizar: a lixeira não cobre mais o intervalo
+                return None, None
+            raise
+        earliest = data.get("earliestDateAvailable")
+        if earliest and normalize_datetime(earliest) > normalize_datetime(start.isoformat()):
+            return None, None
+        covered = data.get("latestDateCovered")
+        ids = [r.get("id") for r in data.get("deletedRecords") or [] if r.get("id")]
+        return ids, normalize_datetime(covered) if covered else meta.deleted_watermark
+
+    # -----------------------------
+    # Consulta local
+    # -----------------------------
+    def _resolve(self, object_name: str) -> MirrorMeta:
+        meta = self.store.load_meta(object_name)
+        if meta is None or not meta.synced_at or object_name.lower() not in {o.lower() for o in self.objects}:
+            raise UnsupportedQuery(f"{object_name} não está no espelho local")
+        if meta.env != self.client.base_url:
+            raise UnsupportedQuery(f"espelho de {object_name} pertence a outro ambiente")
+        return meta
+
+    def compile(self, soql: str) -> LocalQuery:
+        return _Compiler(soql, self._resolve).compile()
+
+    async def query(self, soql: str, max_age: Optional[float] = None) -> Tuple[bytes, float]:
+        # Devolve (corpo no formato de /query, idade do espelho em segundos) ou UnsupportedQuery
+        query = self.compile(soql)
+        age = time.time() - query.meta.synced_at
+        if max_age is not None and age > max_age:
+            raise UnsupportedQuery(f"espelho de {query.meta.object} desatualizado ({int(age)}s)")
+        return await asyncio.to_thread(self._execute, query), age
+
+    def _execute(self, query: LocalQuery) -> bytes:
+        meta = query.meta
+        rows = self.store.execute(query.sql, query.params)
+        prefix = f"/services/data/v{self.client.api_version}/sobjects/{meta.object}/"
+        records = []
+        for row in rows:
+            record = {"attributes": {"type": meta.object, "url": prefix + row[0]}}
+            for (name, ftype), value in zip(query.fields, row[1:]):
+                record[name] = _to_json(value, ftype)
+            records.append(record)
+        return dumps({"totalSize": len(records), "done": True, "records": records})
+
+
+def _record_row(record: dict, fields: List[Field]) -> tuple:
+    return tuple(_to_storage(record.get(name), ftype) for name, ftype in fields)
+
+
+def _read_csv(path: str, fields: List[Field]) -> Iterator[tuple]:
+    # Resultado Bulk em CSV: valores como texto, vazio = nulo; colunas casadas pelo cabeçalho
+    types = dict(fields)
+    with open(path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
+            return
+        index = {name: i for i, name in enumerate(header)}
+        positions = [(index.get(name), types[name]) for name, _ in fields]
+        for row in reader:
+            yield tuple(_to_storage(row[i], ftype) if i is not None and i < len(row) else None for i, ftype in positions)
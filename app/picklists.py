@@ -0,0 +1,172 @@
+import base64
+import csv
+import io
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.bulk_ingest import iter_csv_blocks
+
+PICKLIST_TYPES = ("picklist", "multipicklist")
+
+
+def decode_valid_for(valid_for: Optional[str], controller_count: int) -> List[int]:
+    # validFor é um bitset base64 sobre os índices dos valores do campo controlador;
+    # o bit de cada índice é lido do mais significativo para o menos significativo (0x80 >> i % 8)
+    if not valid_for:
+        return []
+    try:
+        raw = base64.b64decode(valid_for)
+    except (ValueError, TypeError):
+        return []
+    limit = min(controller_count, len(raw) * 8)
+    return [i for i in range(limit) if raw[i >> 3] & (0x80 >> (i & 7))]
+
+
+class PicklistField:
+    def __init__(self, field: dict):
+        self.name: str = field["name"]
+        self.type: str = field.get("type", "picklist")
+        self.controller: Optional[str] = field.get("controllerName") if field.get("dependentPicklist") else None
+        values = field.get("picklistValues") or []
+        self.values: List[str] = [pv.get("value") for pv in values]
+        self.active: FrozenSet[str] = frozenset(pv.get("value") for pv in values if pv.get("active", True))
+        # label→value; valores (API names) também mapeiam para si mesmos
+        self.lookup_all: Dict[str, str] = {}
+        self.lookup_active: Dict[str, str] = {}
+        for pv in values:
+            value = pv.get("value")
+            label = pv.get("label") or value
+            for key in (value, label):
+                self.lookup_all.setdefault(key, value)
+                if value in self.active:
+                    self.lookup_active.setdefault(key, value)
+        self._valid_for: List[Optional[str]] = [pv.get("validFor") for pv in values]
+        # Preenchido por PicklistIndex quando o controlador é conhecido
+        self.allowed_by_controller: Dict[str, FrozenSet[str]] = {}
+
+    def link_controller(self, controller_values: List[str]) -> None:
+        allowed: Dict[str, Set[str]] = {cv: set() for cv in controller_values}
+        for value, valid_for in zip(self.values, self._valid_for):
+            for i in decode_valid_for(valid_for, len(controller_values)):
+                allowed[controller_values[i]].add(value)
+        self.allowed_by_controller = {cv: frozenset(vs) for cv, vs in allowed.items()}
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "controller": self.controller,
+            "values": self.values,
+            "active": sorted(self.active),
+            "labels": {k: v for k, v in self.lookup_all.items() if k != v},
+            "dependencies": {cv: sorted(vs) for cv, vs in self.allowed_by_controller.items()},
+        }
+
+
+class PicklistIndex:
+    # Índices pré-calculados a partir de um describe (construído uma vez e reutilizado)
+    def __init__(self, describe: dict):
+        self.object_name = describe.get("name")
+        self.fields: Dict[str, PicklistField] = {}
+        checkboxes: Set[str] = set()
+        for field in describe.get("fields") or []:
+            if field.get("type") in PICKLIST_TYPES:
+                self.fields[field["name"]] = PicklistField(field)
+            elif field.get("type") == "boolean":
+                checkboxes.add(field["name"])
+        for pf in self.fields.values():
+            if not pf.controller:
+                continue
+            if pf.controller in self.fields:
+                pf.link_controller(self.fields[pf.controller].values)
+            elif pf.controller in checkboxes:
+                # Controlador checkbox: índice 0 = false, 1 = true
+                pf.link_controller(["false", "true"])
+
+    def _controller_key(self, value: object) -> Optional[str]:
+        if value is None or value == "":
+            return None
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    def map_value(self, pf: PicklistField, value: str, active_only: bool) -> Tuple[str, Optional[str]]:
+        lookup = pf.lookup_active if active_only else pf.lookup_all
+        mapped = lookup.get(value)
+        if mapped is not None:
+            return mapped, None
+        if value in pf.lookup_all:
+            return pf.lookup_all[value], f"{pf.name}: valor inativo '{value}'"
+        return value, f"{pf.name}: valor inválido '{value}'"
+
+    def transform_record(self, record: dict, active_only: bool = True, validate: bool = True) -> Tuple[dict, List[str]]:
+        out = dict(record)
+        errors: List[str] = []
+        # Controladores primeiro, para validar dependentes com o valor já mapeado
+        for pf in sorted(self.fields.values(), key=lambda f: f.controller is not None):
+            raw = out.get(pf.name)
+            if not isinstance(raw, str) or raw == "":
+                continue
+            if pf.type == "multipicklist":
+                parts = [p.strip() for p in raw.split(";") if p.strip()]
+                mapped_parts = []
+                for part in parts:
+                    mapped, err = self.map_value(pf, part, active_only)
+                    mapped_parts.append(mapped)
+                    if err:
+                        errors.append(err)
+                out[pf.name] = ";".join(mapped_parts)
+                selected = mapped_parts
+            else:
+                mapped, err = self.map_value(pf, raw, active_only)
+                out[pf.name] = mapped
+                if err:
+                    errors.append(err)
+                selected = [mapped]
+            if validate and pf.allowed_by_controller:
+                controller_value = self._controller_key(out.get(pf.controller))
+                if controller_value is not None:
+                    allowed = pf.allowed_by_controller.get(controller_value, frozenset())
+                    for value in selected:
+                        if value not in allowed:
+                            errors.append(f"{pf.name}: '{value}' não é permitido para {pf.controller}='{controller_value}'")
+        return out, (errors if validate else [])
+
+    def summary(self) -> dict:
+        return {"object": self.object_name, "fields": [pf.as_dict() for pf in self.fields.values()]}
+
+
+async def transform_csv(
+    source: AsyncIterator[bytes], index: PicklistIndex, active_only: bool = True, delimiter: str = ","
+) -> AsyncIterator[bytes]:
+    # Reescreve as colunas de picklist de um CSV em streaming (labels → values), bloco a bloco.
+    # O delimitador tem de ser o columnDelimiter do job: com outro, o parser junta as colunas
+    # e a reescrita corrompe os campos entre aspas
+    header: Optional[List[str]] = None
+    columns: List[Tuple[int, PicklistField]] = []
+    lineterminator = "\n"
+    encoding = "utf-8"
+    async for block in iter_csv_blocks(source):
+        text = block.decode(encoding)
+        if header is None and text.startswith("\ufeff"):
+            text = text[1:]
+        rows = csv.reader(io.StringIO(text, newline=""), delimiter=delimiter)
+        out = io.StringIO()
+        if header is None:
+            header = next(rows, None)
+            if header is None:
+                continue
+            lineterminator = "\r\n" if block.split(b"\n", 1)[0].endswith(b"\r") else "\n"
+            columns = [(i, index.fields[name]) for i, name in enumerate(header) if name in index.fields]
+            writer = csv.writer(out, delimiter=delimiter, lineterminator=lineterminator)
+            writer.writerow(header)
+        writer = csv.writer(out, delimiter=delimiter, lineterminator=lineterminator)
+        for row in rows:
+            for i, pf in columns:
+                if i >= len(row) or not row[i]:
+                    continue
+                if pf.type == "multipicklist":
+                    row[i] = ";".join(index.map_value(pf, p.strip(), active_only)[0] for p in row[i].split(";") if p.strip())
+                else:
+                    row[i] = index.map_value(pf, row[i], active_only)[0]
+            writer.writerow(row)
+        yield out.getvalue().encode(encoding)
@@ -0,0 +1,206 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+import httpx
+
+_FROM_RE = re.compile(r"\bfrom\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_SOBJECT_URL_RE = re.compile(r"/sobjects/([A-Za-z_][A-Za-z0-9_]*)")
+_SUBQUERY_FROM_RE = re.compile(r"\(\s*select\b[^()]*?\bfrom\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+HIT = "HIT"
+MISS = "MISS"
+COALESCED = "COALESCED"
+BYPASS = "BYPASS"
+
+# Devolve a resposta do gateway para a SOQL (status 2xx esperado)
+QueryFetcher = Callable[[], Awaitable[httpx.Response]]
+
+
+def normalize_soql(soql: str) -> str:
+    # SOQL não diferencia maiúsculas fora de literais: padroniza caixa e espaços, preservando '...'
+    parts = re.split(r"('(?:[^'\\]|\\.)*')", soql.strip())
+    out = []
+    for i, part in enumerate(parts):
+        out.append(part if i % 2 else re.sub(r"\s+", " ", part).lower())
+    return "".join(out).strip()
+
+
+def _strip_literals(soql: str) -> str:
+    return re.sub(r"'(?:[^'\\]|\\.)*'", "''", soql)
+
+
+def query_objects(soql: str) -> FrozenSet[str]:
+    # Objetos (em minúsculas) cujas escritas invalidam o resultado: FROM principal e de semi-joins.
+    # Subconsultas filho usam o nome do relacionamento (Contacts, Itens__r); também registramos o
+    # nome provável do objeto (Contact, Itens__c), já que o describe não é consultado aqui.
+    text = _strip_literals(soql)
+    names: Set[str] = {m.group(1).lower() for m in _FROM_RE.finditer(text)}
+    for m in _SUBQUERY_FROM_RE.finditer(text):
+        name = m.group(1).lower()
+        if name.endswith("__r"):
+            names.add(name[:-3] + "__c")
+        elif name.endswith("ies"):
+            names.add(name[:-3] + "y")
+        elif name.endswith("s"):
+            names.add(name[:-1])
+    return frozenset(names)
+
+
+def primary_object(soql: str) -> Optional[str]:
+    # Objeto do FROM principal (o primeiro FROM fora de literais), como escrito na SOQL
+    match = _FROM_RE.search(_strip_literals(soql))
+    return match.group(1) if match else None
+
+
+def written_objects(payload: dict) -> Set[str]:
+    # Objetos alterados por um payload de composite ou composite/sobjects
+    names: Set[str] = set()
+    for record in payload.get("records") or []:
+        if isinstance(record, dict):
+            names.add((record.get("attributes") or {}).get("type"))
+    for sub in payload.get("compositeRequest") or []:
+        if not isinstance(sub, dict) or str(sub.get("method", "GET")).upper() == "GET":
+            continue
+        match = _SOBJECT_URL_RE.search(sub.get("url") or "")
+        if match:
+            names.add(match.group(1))
+    names.discard(None)
+    return names
+
+
+@dataclass
+class QueryCacheEntry:
+    raw: bytes
+    size: int
+    fetched_at: float
+    expires_at: float
+    objects: FrozenSet[str] = field(default_factory=frozenset)
+
+
+class QueryCache:
+    # Cache de resultados de /query por SOQL normalizada: TTL por consulta, LRU limitado por bytes,
+    # coalescência de requisições idênticas em voo e invalidação por escrita nos objetos do FROM.
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max(1, max_bytes)
+        self.max_entry_bytes = max_entry_bytes or self.max_bytes // 4
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, QueryCacheEntry]" = OrderedDict()
+        self._by_object: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Geração por objeto: resultados buscados antes de uma escrita não são guardados
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _drop(self, key: str) -> Optional[QueryCacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.bytes -= entry.size
+        for name in entry.objects:
+            keys = self._by_object.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_object[name]
+        return entry
+
+    def _remember(self, key: str, entry: QueryCacheEntry) -> None:
+        self._drop(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        for name in entry.objects:
+            self._by_object.setdefault(name, set()).add(key)
+        while self.bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _generation(self, objects: Iterable[str]) -> Tuple[int, ...]:
+        return (self._epoch,) + tuple(self._generations.get(name, 0) for name in sorted(objects))
+
+    async def get(self, key: str, soql: str, fetch: QueryFetcher, ttl: Optional[float] = None) -> Tuple[bytes, str, float]:
+        # Devolve (corpo JSON do gateway, HIT|MISS|COALESCED, idade em segundos)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.raw, HIT, now - entry.fetched_at
+            self._drop(key)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), COALESCED, 0.0
+        # A busca é uma tarefa do cache, não de quem a iniciou: se essa requisição for cancelada
+        # (cliente desconectou), as coalescidas ainda recebem o resultado
+        task = asyncio.create_task(self._fetch(key, soql, fetch, self.ttl if ttl is None else ttl))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), MISS, 0.0
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Evita "Task exception was never retrieved" quando ninguém mais aguarda
+            task.exception()
+
+    async def _fetch(self, key: str, soql: str, fetch: QueryFetcher, ttl: float) -> bytes:
+        objects = query_objects(soql)
+        generation = self._generation(objects)
+        resp = await fetch()
+        raw = resp.content
+        self.misses += 1
+        size = len(raw)
+        # Só guarda resultados completos: o gateway inclui nextRecordsUrl apenas quando done=false
+        # (e esses cursores expiram), então basta procurar a chave sem decodificar o JSON
+        cacheable = ttl > 0 and b'"nextRecordsUrl"' not in raw and size <= self.max_entry_bytes
+        if cacheable and self._generation(objects) == generation:
+            now = time.time()
+            self._remember(key, QueryCacheEntry(raw=raw, size=size, fetched_at=now, expires_at=now + ttl, objects=objects))
+        return raw
+
+    def invalidate_objects(self, names: Iterable[Optional[str]]) -> int:
+        removed = 0
+        for name in {n.lower() for n in names if n}:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            for key in list(self._by_object.get(name, ())):
+                if self._drop(key) is not None:
+                    removed += 1
+        self.invalidations += removed
+        return removed
+
+    def clear(self) -> int:
+        removed = len(self._entries)
+        self._epoch += 1
+        self._entries.clear()
+        self._by_object.clear()
+        self.bytes = 0
+        self.invalidations += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "max_entry_bytes": self.max_entry_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "in_flight": len(self._inflight),
+            "objects": sorted(self._by_object),
+        }
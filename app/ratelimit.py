@@ -0,0 +1,282 @@
+import asyncio
+import contextvars
+import random
+import re
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Classe de tráfego da tarefa atual; subsistemas de carga (bulk, escrita em lotes) marcam "batch"
+traffic_class: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("foco_traffic_class", default=None)
+
+_LIMIT_INFO_RE = re.compile(r"api-usage=(\d+)/(\d+)")
+RETRY_STATUSES = (429, 503)
+# Métodos que podem ser repetidos após qualquer falha de transporte; o token OAuth também pode
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+IDEMPOTENT_OPERATIONS = ("login",)
+# Falhas antes do envio da requisição: seguras para repetir mesmo em POST/PATCH
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@contextmanager
+def batch_traffic():
+    token = traffic_class.set(BATCH)
+    try:
+        yield
+    finally:
+        traffic_class.reset(token)
+
+
+def parse_limit_info(value: Optional[str]) -> Optional[tuple]:
+    # Sforce-Limit-Info: api-usage=25/15000
+    if not value:
+        return None
+    match = _LIMIT_INFO_RE.search(value)
+    if not match:
+        return None
+    used, limit = int(match.group(1)), int(match.group(2))
+    return (used, limit) if limit > 0 else None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        # Devolve quanto tempo a chamada esperou por um token
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / max(self.rate, 0.01)
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class TrafficPool:
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.bucket.rate, 3),
+            "base_rate": self.bucket.base_rate,
+            "burst": self.bucket.burst,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+class CircuitBreaker:
+    # Fechado → aberto após `threshold` falhas seguidas; após `cooldown`, meio-aberto (uma sonda)
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def before_request(self) -> bool:
+        # Devolve True quando esta chamada é a sonda do estado meio-aberto
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        retry_in = max(self.cooldown - (time.monotonic() - (self.opened_at or 0)), 1)
+        raise HTTPException(
+            status_code=503,
+            detail="Gateway FOCO indisponível (circuito aberto); tente novamente em instantes",
+            headers={"Retry-After": str(int(retry_in))},
+        )
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probe_in_flight or self.failures >= self.threshold:
+            if self.opened_at is None or self._probe_in_flight:
+                self.opened_count += 1
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        # Sonda interrompida sem resultado (ex.: cliente desconectou): a próxima chamada sonda de novo
+        self._probe_in_flight = False
+
+
+class RateLimiter:
+    # Limita as chamadas ao gateway: token bucket + semáforo por classe de tráfego,
+    # desaceleração conforme o consumo informado em Sforce-Limit-Info, retentativas para
+    # 429/503 (respeitando Retry-After) e circuit breaker para falhas seguidas.
+    def __init__(
+        self,
+        pools: Dict[str, TrafficPool],
+        soft_limit: float = 0.8,
+        hard_limit: float = 0.95,
+        min_factor: float = 0.1,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+        enabled: bool = True,
+    ):
+        self.pools = pools
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.min_factor = min_factor
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(5, 30.0)
+        self.enabled = enabled
+        self.api_usage: Optional[tuple] = None
+        self.retries = 0
+
+    def pool_for(self, operation: str) -> TrafficPool:
+        name = traffic_class.get() or (BATCH if operation.startswith("bulk_") else INTERACTIVE)
+        return self.pools.get(name) or self.pools[INTERACTIVE]
+
+    def _observe(self, resp: httpx.Response) -> None:
+        usage = parse_limit_info(resp.headers.get("Sforce-Limit-Info"))
+        if usage is None:
+            return
+        self.api_usage = usage
+        ratio = usage[0] / usage[1]
+        # Lotes desaceleram a partir do limite suave; tráfego interativo só perto do limite rígido
+        if ratio <= self.soft_limit:
+            batch_factor = 1.0
+        elif ratio >= self.hard_limit:
+            batch_factor = self.min_factor
+        else:
+            span = (ratio - self.soft_limit) / (self.hard_limit - self.soft_limit)
+            batch_factor = 1.0 - span * (1.0 - self.min_factor)
+        interactive_factor = 1.0 if ratio < self.hard_limit else max(self.min_factor, 0.5)
+        for name, pool in self.pools.items():
+            factor = interactive_factor if name == INTERACTIVE else batch_factor
+            pool.bucket.rate = pool.bucket.base_rate * factor
+
+    def _delay(self, attempt: int, resp: Optional[httpx.Response]) -> float:
+        retry_after = parse_retry_after(resp.headers.get("Retry-After")) if resp is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Backoff exponencial com "full jitter"
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, operation: str, send, replayable: bool = True, method: str = "GET") -> httpx.Response:
+        if not self.enabled:
+            return await send()
+        pool = self.pool_for(operation)
+        # POST/PATCH que falharam depois de enviados podem já ter sido aplicados (ex.: registro
+        # criado): só repetem se a falha foi na conexão
+        idempotent = method.upper() in IDEMPOTENT_METHODS or operation in IDEMPOTENT_OPERATIONS
+        attempt = 0
+        while True:
+            probe = self.breaker.before_request()
+            try:
+                pool.throttled_seconds += await pool.bucket.acquire()
+                async with pool.semaphore:
+                    pool.in_flight += 1
+                    pool.requests += 1
+                    try:
+                        resp = await send()
+                    except (httpx.TransportError, httpx.TimeoutException) as e:
+                        self.breaker.record_failure()
+                        if not replayable or attempt >= self.max_retries:
+                            raise
+                        if not idempotent and not isinstance(e, CONNECT_ERRORS):
+                            raise
+                        resp = None
+                    except Exception:
+                        self.breaker.record_failure()
+                        raise
+                    finally:
+                        pool.in_flight -= 1
+            except BaseException:
+                # Cancelamento (ou erro já registrado): nunca deixa a sonda presa
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            if resp is not None:
+                self._observe(resp)
+                if resp.status_code < 500 and resp.status_code != 429:
+                    self.breaker.record_success()
+                    return resp
+                self.breaker.record_failure()
+                if resp.status_code not in RETRY_STATUSES or not replayable or attempt >= self.max_retries:
+                    return resp
+                await resp.aclose()
+            self.retries += 1
+            await asyncio.sleep(self._delay(attempt, resp))
+            attempt += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "api_usage": {"used": self.api_usage[0], "limit": self.api_usage[1]} if self.api_usage else None,
+            "soft_limit": self.soft_limit,
+            "hard_limit": self.hard_limit,
+            "retries": self.retries,
+            "circuit": {
+                "state": self.breaker.state,
+                "failures": self.breaker.failures,
+                "threshold": self.breaker.threshold,
+                "cooldown": self.breaker.cooldown,
+                "opened_count": self.breaker.opened_count,
+            },
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+        }
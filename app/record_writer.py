@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Union
+
+from fastapi import HTTPException
+
+from app.jsoncodec import loads
+from app.ratelimit import batch_traffic
+
+if TYPE_CHECKING:
+    from app.main import FOCOClient
+
+# Limite de registros por chamada de sObject Collections (composite/sobjects)
+COMPOSITE_BATCH_SIZE = 200
+OPERATIONS = ("create", "update", "upsert")
+
+
+class InvalidRecord:
+    # Linha da entrada que não é um registro: vira um resultado com erro na posição dela, sem
+    # interromper o envio (lotes já enviados podem ter sido gravados e precisam de resposta)
+    def __init__(self, line_no: int, message: str):
+        self.line_no = line_no
+        self.message = message
+
+    def result(self) -> dict:
+        return {"id": None, "success": False, "line": self.line_no, "errors": [{"statusCode": "400", "message": self.message}]}
+
+
+async def iter_ndjson(source: AsyncIterator[bytes]) -> AsyncIterator[Union[dict, InvalidRecord]]:
+    # Um registro JSON por linha; linhas vazias são ignoradas e linhas inválidas viram InvalidRecord
+    buf = b""
+    line_no = 0
+    async for chunk in source:
+        buf += chunk
+        lines = buf.split(b"\n")
+        buf = lines.pop()
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield _parse_record(line, line_no)
+    if buf.strip():
+        yield _parse_record(buf, line_no + 1)
+
+
+async def iter_json_array(body: bytes) -> AsyncIterator[dict]:
+    try:
+        data = loads(body or b"[]")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+    if isinstance(data, dict):
+        data = data.get("records", [])
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Esperado um array JSON de registros")
+    # O corpo já está todo em memória: confere antes do primeiro registro para não enviar metade
+    if not all(isinstance(record, dict) for record in data):
+        raise HTTPException(status_code=400, detail="Cada registro deve ser um objeto JSON")
+    for record in data:
+        yield record
+
+
+def _parse_record(line: bytes, line_no: int) -> Union[dict, InvalidRecord]:
+    try:
+        record = loads(line)
+    except ValueError as e:
+        return InvalidRecord(line_no, f"NDJSON inválido na linha {line_no}: {e}")
+    if not isinstance(record, dict):
+        return InvalidRecord(line_no, f"NDJSON inválido na linha {line_no}: esperado objeto")
+    return record
+
+
+async def write_records(
+    client: "FOCOClient",
+    object_name: str,
+    operation: str,
+    records: AsyncIterator[Union[dict, InvalidRecord]],
+    external_field: Optional[str] = None,
+    all_or_none: bool = False,
+    batch_size: int = COMPOSITE_BATCH_SIZE,
+    concurrency: int = 4,
+) -> dict:
+    # Agrupa os registros em lotes de sObject Collections e envia até `concurrency` lotes em paralelo.
+    # Os resultados voltam na mesma ordem da entrada (allOrNone vale por lote); linhas inválidas
+    # recebem um resultado com erro e não interrompem o envio das demais.
+    if operation not in OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Operação inválida: {operation}")
+    if operation == "upsert" and not external_field:
+        raise HTTPException(status_code=400, detail="Upsert requer externalIdField")
+    batch_size = max(1, min(batch_size, COMPOSITE_BATCH_SIZE))
+    started = time.perf_counter()
+    results: List[Optional[list]] = []
+    slots = asyncio.Semaphore(max(1, concurrency))
+    tasks: List[asyncio.Task] = []
+
+    async def send(index: int, batch: List[dict]) -> None:
+        try:
+            payload = {"allOrNone": all_or_none, "records": batch}
+            # Lotes usam o pool "batch" do limitador, sem disputar com o tráfego interativo
+            with batch_traffic():
+                if operation == "create":
+                    data = await client.composite_sobjects(payload)
+                elif operation == "update":
+                    data = await client.composite_sobjects_update(payload)
+                else:
+                    data = await client.composite_sobjects_upsert(object_name, external_field, payload)
+            if not isinstance(data, list) or len(data) != len(batch):
+                raise HTTPException(status_code=502, detail="Resposta inesperada do composite/sobjects")
+            results[index] = data
+        except HTTPException as e:
+            # Falha do lote inteiro: replica o erro em cada registro para manter o alinhamento
+            error = {"statusCode": str(e.status_code), "message": e.detail if isinstance(e.detail, str) else json.dumps(e.detail, ensure_ascii=False)}
+            results[index] = [{"id": None, "success": False, "errors": [error]} for _ in batch]
+        except Exception as e:
+            # Timeout/falha de transporte após as retentativas: o lote pode ter sido aplicado ou não,
+            # mas os demais lotes seguem e cada registro deste recebe o erro
+            error = {"statusCode": "502", "message": str(e) or type(e).__name__}
+            results[index] = [{"id": None, "success": False, "errors": [error]} for _ in batch]
+        finally:
+            slots.release()
+
+    async def dispatch(batch: List[dict]) -> None:
+        # Só lê mais registros da entrada quando há slot livre (memória limitada)
+        await slots.acquire()
+        results.append(None)
+        tasks.append(asyncio.create_task(send(len(results) - 1, batch)))
+
+    batch: List[dict] = []
+    invalid = 0
+    try:
+        async for record in records:
+            if isinstance(record, InvalidRecord):
+                # Fecha o lote corrente para o erro ficar na posição da linha nos resultados
+                if batch:
+                    await dispatch(batch)
+                    batch = []
+                results.append([record.result()])
+                invalid += 1
+                continue
+            if "attributes" not in record:
+                record = {"attributes": {"type": object_name}, **record}
+            if operation == "update" and "id" not in record and "Id" in record:
+                record["id"] = record.pop("Id")
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await dispatch(batch)
+                batch = []
+        if batch:
+            await dispatch(batch)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    flat = [r for batch_results in results for r in (batch_results or [])]
+    succeeded = sum(1 for r in flat if r.get("success"))
+    return {
+        "object": object_name,
+        "operation": operation,
+        "batches": len(tasks),
+        "records": len(flat),
+        "success": succeeded,
+        "failed": len(flat) - succeeded,
+        "invalid": invalid,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": flat,
+    }
@@ -0,0 +1,181 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+NUMBER_TYPES = ("double", "currency", "percent")
+
+
+def _required(field: dict) -> bool:
+    # Mesmo critério da validação de CSV: obrigatório na criação e sem valor padrão
+    return bool(
+        field.get("createable")
+        and not field.get("nillable", True)
+        and not field.get("defaultedOnCreate")
+        and field.get("type") != "boolean"
+    )
+
+
+def _compact_field(field: dict) -> dict:
+    out = {"name": field["name"], "label": field.get("label"), "type": field.get("type")}
+    if field.get("type") in NUMBER_TYPES:
+        out["precision"] = field.get("precision")
+        out["scale"] = field.get("scale")
+    elif field.get("length"):
+        out["length"] = field.get("length")
+    for key in ("createable", "updateable", "externalId", "unique", "nameField", "calculated"):
+        if field.get(key):
+            out[key] = True
+    if _required(field):
+        out["required"] = True
+    if field.get("referenceTo"):
+        out["referenceTo"] = field["referenceTo"]
+        out["relationshipName"] = field.get("relationshipName")
+    if field.get("picklistValues"):
+        out["picklist"] = [pv.get("value") for pv in field["picklistValues"] if pv.get("active", True)]
+    return out
+
+
+class ObjectSchema:
+    # Resumo compacto de um describe: campos, obrigatórios, Ids externos e relacionamentos
+    def __init__(self, describe: dict):
+        self.name: str = describe.get("name")
+        self.label: Optional[str] = describe.get("label")
+        self.custom = bool(describe.get("custom"))
+        self.key_prefix: Optional[str] = describe.get("keyPrefix")
+        fields = describe.get("fields") or []
+        self.fields: List[dict] = [_compact_field(f) for f in fields]
+        self.required: List[str] = [f["name"] for f in fields if _required(f)]
+        self.external_ids: List[str] = [f["name"] for f in fields if f.get("externalId")]
+        self.name_field: Optional[str] = next((f["name"] for f in fields if f.get("nameField")), None)
+        # Lookups e master-detail deste objeto (campo → objetos referenciados)
+        self.parents: List[dict] = []
+        for f in fields:
+            if f.get("type") != "reference" or not f.get("referenceTo"):
+                continue
+            self.parents.append({
+                "field": f["name"],
+                "relationshipName": f.get("relationshipName"),
+                "referenceTo": list(f["referenceTo"]),
+                "kind": "masterDetail" if f.get("relationshipOrder") is not None or f.get("cascadeDelete") else "lookup",
+                "required": _required(f),
+                "polymorphic": len(f["referenceTo"]) > 1,
+            })
+        self.children: List[dict] = [
+            {
+                "childSObject": c.get("childSObject"),
+                "field": c.get("field"),
+                "relationshipName": c.get("relationshipName"),
+                "cascadeDelete": bool(c.get("cascadeDelete")),
+            }
+            for c in describe.get("childRelationships") or []
+            if c.get("childSObject") and c.get("field")
+        ]
+
+    def as_dict(self, fields: bool = True) -> dict:
+        data = {
+            "name": self.name,
+            "label": self.label,
+            "custom": self.custom,
+            "keyPrefix": self.key_prefix,
+            "nameField": self.name_field,
+            "required": self.required,
+            "externalIds": self.external_ids,
+            "parents": self.parents,
+            "children": self.children,
+        }
+        if fields:
+            data["fields"] = self.fields
+        return data
+
+
+class SchemaGraph:
+    # Grafo de relacionamentos entre os objetos descritos (arestas filho → pai por campo de referência)
+    def __init__(self, schemas: Iterable[ObjectSchema]):
+        self.objects: Dict[str, ObjectSchema] = {s.name.lower(): s for s in schemas if s.name}
+        self.edges: List[dict] = []
+        self._parents: Dict[str, Set[str]] = {key: set() for key in self.objects}
+        self._children: Dict[str, Set[str]] = {key: set() for key in self.objects}
+        # Vizinhos em qualquer direção, para busca de caminhos
+        self._adjacent: Dict[str, List[tuple]] = {key: [] for key in self.objects}
+        for key, schema in self.objects.items():
+            for parent in schema.parents:
+                for target in parent["referenceTo"]:
+                    self.edges.append({
+                        "from": schema.name,
+                        "field": parent["field"],
+                        "to": target,
+                        "kind": parent["kind"],
+                        "required": parent["required"],
+                        "described": target.lower() in self.objects,
+                    })
+                    target_key = target.lower()
+                    if target_key in self.objects and target_key != key:
+                        self._parents[key].add(target_key)
+                        self._children[target_key].add(key)
+                        self._adjacent[key].append((target_key, self.edges[-1]))
+                        self._adjacent[target_key].append((key, self.edges[-1]))
+
+    def get(self, object_name: str) -> Optional[ObjectSchema]:
+        return self.objects.get(object_name.lower())
+
+    def neighbours(self, object_name: str) -> dict:
+        key = object_name.lower()
+        schema = self.objects[key]
+        return {
+            "parentObjects": sorted(self.objects[k].name for k in self._parents[key]),
+            "childObjects": sorted(self.objects[k].name for k in self._children[key]),
+            "edges": [e for e in self.edges if e["from"] == schema.name or e["to"].lower() == key],
+        }
+
+    def load_order(self) -> List[List[str]]:
+        # Ondas de carga: cada objeto vem depois dos pais que também foram descritos. Objetos em
+        # ciclo (e os que dependem deles) ficam juntos na última onda
+        pending = {key: set(parents) for key, parents in self._parents.items()}
+        waves: List[List[str]] = []
+        ready = sorted(k for k, p in pending.items() if not p)
+        while ready:
+            waves.append([self.objects[k].name for k in ready])
+            for key in ready:
+                pending.pop(key, None)
+            unlocked: Set[str] = set()
+            for key in ready:
+                for child in self._children[key]:
+                    parents = pending.get(child)
+                    if parents is not None:
+                        parents.discard(key)
+                        if not parents:
+                            unlocked.add(child)
+            ready = sorted(unlocked)
+        if pending:
+            waves.append(sorted(self.objects[k].name for k in pending))
+        return waves
+
+    def path(self, source: str, target: str) -> Optional[List[dict]]:
+        # Menor caminho de relacionamentos (em qualquer direção) entre dois objetos descritos
+        start, goal = source.lower(), target.lower()
+        if start not in self.objects or goal not in self.objects:
+            return None
+        previous: Dict[str, Optional[tuple]] = {start: None}
+        queue = deque([start])
+        while queue:
+            key = queue.popleft()
+            if key == goal:
+                break
+            for there, edge in self._adjacent[key]:
+                if there not in previous:
+                    previous[there] = (key, edge)
+                    queue.append(there)
+        if goal not in previous:
+            return None
+        steps: List[dict] = []
+        key = goal
+        while previous[key] is not None:
+            key, edge = previous[key]
+            steps.append(edge)
+        return list(reversed(steps))
+
+    def as_dict(self, fields: bool = False) -> dict:
+        return {
+            "objects": {s.name: s.as_dict(fields=fields) for s in self.objects.values()},
+            "edges": self.edges,
+            "loadOrder": self.load_order(),
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+
+@dataclass
+class TokenRecord:
+    access_token: str
+    instance_url: Optional[str]
+    issued_at: Optional[float]
+    expires_at: Optional[float]
+    config_version: int
+    login_variant: Optional[str] = None
+
+
+@dataclass
+class ConfigRecord:
+    version: int
+    fingerprint: str
+    data: Dict[str, Optional[str]]
+
+
+def config_fingerprint(data: dict) -> str:
+    # Identifica a configuração de origem (.env) para detectar quando ela mudou entre reinícios
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class StateStore:
+    # Estado compartilhado entre workers: token de acesso, configuração do cliente (com contador de
+    # versão) e locks com prazo (lease), para que só um processo faça login por vez.
+    # Implementações são síncronas; o FOCOClient as chama via asyncio.to_thread.
+    name = "base"
+
+    def load_token(self) -> Optional[TokenRecord]:
+        raise NotImplementedError
+
+    def save_token(self, record: TokenRecord) -> None:
+        raise NotImplementedError
+
+    def clear_token(self) -> None:
+        raise NotImplementedError
+
+    def load_config(self) -> Optional[ConfigRecord]:
+        raise NotImplementedError
+
+    def save_config(self, data: dict, fingerprint: str) -> int:
+        # Grava a configuração, incrementa a versão, descarta o token e devolve a nova versão
+        raise NotImplementedError
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 60.0, poll: float = 0.05) -> AsyncIterator[None]:
+        # O lease expira sozinho se o processo que o detém morrer, então a espera é limitada a `ttl`
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        while not await asyncio.to_thread(self.try_acquire, name, owner, ttl):
+            await asyncio.sleep(poll)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.release, name, owner)
+
+
+class MemoryStateStore(StateStore):
+    # Apenas para um único processo (sem compartilhamento entre workers)
+    name = "memory"
+
+    def __init__(self):
+        self._token: Optional[TokenRecord] = None
+        self._config: Optional[ConfigRecord] = None
+        self._locks: Dict[str, Tuple[str, float]] = {}
+        self._mutex = threading.Lock()
+
+    def load_token(self) -> Optional[TokenRecord]:
+        return self._token
+
+    def save_token(self, record: TokenRecord) -> None:
+        self._token = record
+
+    def clear_token(self) -> None:
+        self._token = None
+
+    def load_config(self) -> Optional[ConfigRecord]:
+        return self._config
+
+    def save_config(self, data: dict, fingerprint: str) -> int:
+        version = (self._config.version if self._config else 0) + 1
+        self._config = ConfigRecord(version=version, fingerprint=fingerprint, data=dict(data))
+        self._token = None
+        return version
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        with self._mutex:
+            now = time.time()
+            held = self._locks.get(name)
+            if held is not None and held[0] != owner and held[1] > now:
+                return False
+            self._locks[name] = (owner, now + ttl)
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        with self._mutex:
+            if self._locks.get(name, (None,))[0] == owner:
+                del self._locks[name]
+
+
+class SQLiteStateStore(StateStore):
+    # Arquivo SQLite local compartilhado pelos workers da mesma máquina
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # O arquivo guarda credenciais: somente o dono lê
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1), data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS config ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, fingerprint TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS locks ("
+            " name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load_token(self) -> Optional[TokenRecord]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM token WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        try:
+            return TokenRecord(**json.loads(row[0]))
+        except (TypeError, ValueError):
+            return None
+
+    def save_token(self, record: TokenRecord) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO token (id, data) VALUES (1, ?)", (json.dumps(asdict(record)),))
+            self._conn.commit()
+
+    def clear_token(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM token")
+            self._conn.commit()
+
+    def load_config(self) -> Optional[ConfigRecord]:
+        with self._lock:
+            row = self._conn.execute("SELECT version, fingerprint, data FROM config WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        try:
+            return ConfigRecord(version=row[0], fingerprint=row[1], data=json.loads(row[2]))
+        except ValueError:
+            return None
+
+    def save_config(self, data: dict, fingerprint: str) -> int:
+        with self._lock:
+            # Transação única: versão lida e incrementada sem corrida entre processos
+            with self._conn:
+                row = self._conn.execute("SELECT version FROM config WHERE id = 1").fetchone()
+                version = (row[0] if row else 0) + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO config (id, version, fingerprint, data) VALUES (1, ?, ?, ?)",
+                    (version, fingerprint, json.dumps(data)),
+                )
+                self._conn.execute("DELETE FROM token")
+        return version
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                    " WHERE locks.expires_at < ? OR locks.owner = excluded.owner",
+                    (name, owner, now + ttl, now),
+                )
+        return cur.rowcount == 1
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_state_store(backend: str, path: str) -> StateStore:
+    backend = (backend or "sqlite").strip().lower()
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(path)
+    raise ValueError(f"FOCO_STATE_BACKEND desconhecido: {backend}")
@@ -0,0 +1,210 @@
+import csv
+import io
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from app.jsoncodec import dumps
+
+
+def flatten_record(record: dict, prefix: str = "") -> Dict[str, object]:
+    # Achata relacionamentos (Owner.Name) e descarta o bloco "attributes"
+    flat: Dict[str, object] = {}
+    for key, value in record.items():
+        if key == "attributes":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if "records" in value and isinstance(value.get("records"), list):
+                # Subquery (relacionamento filho): mantém como JSON na célula
+                flat[name] = dumps(value["records"]).decode("utf-8")
+            else:
+                flat.update(flatten_record(value, prefix=f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+# Funções que devolvem o valor com o nome do próprio campo; as demais (agregações) viram exprN
+_FIELD_FUNCTIONS = ("tolabel", "convertcurrency", "format")
+_ITEM_RE = re.compile(r"^(?:(\w+)\s*\((.*)\)|([\w.]+))(?:\s+(\w+))?$", re.DOTALL)
+_PATH_RE = re.compile(r"^[\w.]+$")
+_SUBQUERY_FROM_RE = re.compile(r"\bfrom\s+(\w+)", re.IGNORECASE)
+
+
+def _split_top_level(text: str) -> List[str]:
+    # Separa por vírgulas fora de parênteses e de literais entre aspas simples
+    items: List[str] = []
+    depth = 0
+    quoted = False
+    start = 0
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quoted:
+            if ch == "\\":
+                i += 1
+            elif ch == "'":
+                quoted = False
+        elif ch == "'":
+            quoted = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    items.append(text[start:].strip())
+    return items
+
+
+def select_columns(soql: str) -> Optional[List[str]]:
+    # Colunas do CSV a partir da lista do SELECT (relacionamentos nulos não somem do cabeçalho).
+    # None quando a lista não define as colunas (TYPEOF, FIELDS(...)): vale o primeiro registro
+    match = re.match(r"\s*select\s", soql, re.IGNORECASE)
+    if not match:
+        return None
+    rest = soql[match.end():]
+    # FROM do nível principal: o primeiro fora de parênteses
+    depth = 0
+    end = None
+    for m in re.finditer(r"[()]|\bfrom\b", rest, re.IGNORECASE):
+        token = m.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            end = m.start()
+            break
+    if end is None:
+        return None
+    columns: List[str] = []
+    expressions = 0
+    for item in _split_top_level(rest[:end]):
+        if not item:
+            return None
+        if item.startswith("("):
+            # Subconsulta: a coluna é o nome do relacionamento filho
+            sub = _SUBQUERY_FROM_RE.search(item)
+            if sub is None:
+                return None
+            columns.append(sub.group(1))
+            continue
+        parsed = _ITEM_RE.match(item)
+        if parsed is None:
+            return None
+        function, argument, path, alias = parsed.groups()
+        if path is not None:
+            if path.lower() == "typeof":
+                return None
+            columns.append(alias or path)
+            continue
+        if function.lower() == "fields":
+            return None
+        if function.lower() == "count" and not argument.strip():
+            # COUNT() só preenche totalSize
+            continue
+        if alias:
+            columns.append(alias)
+        elif function.lower() in _FIELD_FUNCTIONS and _PATH_RE.match(argument.strip()):
+            columns.append(argument.strip())
+        else:
+            columns.append(f"expr{expressions}")
+            expressions += 1
+    return columns or None
+
+
+class QueryStreamStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.pages = 0
+        self.total_size: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "totalSize": self.total_size,
+            "rows": self.rows,
+            "pages": self.pages,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+async def ndjson_stream(pages: AsyncIterator[dict], stats: QueryStreamStats, meta: bool = True) -> AsyncIterator[bytes]:
+    # Uma linha JSON por registro; um chunk por página mantém a memória limitada a ~2 páginas
+    try:
+        async for page in pages:
+            stats.pages += 1
+            if stats.total_size is None:
+                stats.total_size = page.get("totalSize")
+            records = page.get("records") or []
+            stats.rows += len(records)
+            if records:
+                yield b"".join(dumps(r) + b"\n" for r in records)
+    except Exception as e:
+        # O status HTTP já foi enviado: sinaliza o erro no próprio stream
+        yield dumps({"_error": _error_detail(e)}) + b"\n"
+        return
+    if meta:
+        yield dumps({"_meta": stats.as_dict()}) + b"\n"
+
+
+async def csv_stream(
+    pages: AsyncIterator[dict], stats: QueryStreamStats, meta: bool = False, columns: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    # Com `columns` (lista do SELECT) o cabeçalho não depende do primeiro registro: um lookup nulo
+    # nele não descarta as colunas Owner.* das linhas seguintes. Nomes casam sem diferenciar
+    # maiúsculas, como no SOQL
+    buf = io.StringIO()
+    writer = None
+    lookup = {c.lower(): c for c in columns or []}
+    # Chave do registro → coluna do cabeçalho, quando a grafia difere da usada na query
+    rename: Dict[str, str] = {}
+    known: Set[str] = set(columns or [])
+    try:
+        async for page in pages:
+            stats.pages += 1
+            if stats.total_size is None:
+                stats.total_size = page.get("totalSize")
+            records = page.get("records") or []
+            stats.rows += len(records)
+            for record in records:
+                flat = flatten_record(record)
+                if writer is None:
+                    if not columns:
+                        # Sem lista de colunas: vale o formato do primeiro registro
+                        columns = list(flat.keys())
+                        known = set(columns)
+                    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore", lineterminator="\n")
+                    writer.writeheader()
+                if lookup:
+                    for key in flat.keys() - known:
+                        known.add(key)
+                        column = lookup.get(key.lower())
+                        if column is not None and column != key:
+                            rename[key] = column
+                    if rename:
+                        flat = {rename.get(k, k): v for k, v in flat.items()}
+                writer.writerow(flat)
+            if buf.tell():
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate(0)
+        if writer is None and columns:
+            # Nenhum registro: ainda assim um CSV válido, só com o cabeçalho
+            csv.writer(buf, lineterminator="\n").writerow(columns)
+            yield buf.getvalue().encode("utf-8")
+    except Exception as e:
+        yield f"# error: {_error_detail(e)}\n".encode("utf-8")
+        return
+    if meta:
+        m = stats.as_dict()
+        yield f"# totalSize={m['totalSize']} rows={m['rows']} pages={m['pages']} elapsed_ms={m['elapsed_ms']}\n".encode("utf-8")
+
+
+def _error_detail(e: Exception) -> object:
+    detail = getattr(e, "detail", None)
+    return detail if detail is not None else str(e)
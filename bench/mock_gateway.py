@@ -0,0 +1,499 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+from app.jsoncodec import dumps, loads
+
+# Gateway FOCO/Salesforce simulado para benchmarks: implementa só o que o FOCOClient usa
+# (token OAuth, sobjects, describe, query paginada, composite e Bulk API 2.0 ingest/query),
+# com latência, tamanho de payload e taxa de erro configuráveis via BENCH_MOCK_*.
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class MockConfig:
+    api_version: str = "62.0"
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    query_records: int = 2000
+    page_size: int = 2000
+    describe_fields: int = 150
+    sobjects: int = 400
+    bulk_rows: int = 50000
+    bulk_page_rows: int = 10000
+    bulk_processing_ms: float = 500.0
+    api_limit: int = 1_000_000
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        return cls(
+            api_version=os.getenv("BENCH_MOCK_API_VERSION", cls.api_version),
+            latency_ms=_env_float("BENCH_MOCK_LATENCY_MS", cls.latency_ms),
+            jitter_ms=_env_float("BENCH_MOCK_JITTER_MS", cls.jitter_ms),
+            error_rate=_env_float("BENCH_MOCK_ERROR_RATE", cls.error_rate),
+            throttle_rate=_env_float("BENCH_MOCK_THROTTLE_RATE", cls.throttle_rate),
+            query_records=int(_env_float("BENCH_MOCK_QUERY_RECORDS", cls.query_records)),
+            page_size=int(_env_float("BENCH_MOCK_PAGE_SIZE", cls.page_size)),
+            describe_fields=int(_env_float("BENCH_MOCK_DESCRIBE_FIELDS", cls.describe_fields)),
+            sobjects=int(_env_float("BENCH_MOCK_SOBJECTS", cls.sobjects)),
+            bulk_rows=int(_env_float("BENCH_MOCK_BULK_ROWS", cls.bulk_rows)),
+            bulk_page_rows=int(_env_float("BENCH_MOCK_BULK_PAGE_ROWS", cls.bulk_page_rows)),
+            bulk_processing_ms=_env_float("BENCH_MOCK_BULK_PROCESSING_MS", cls.bulk_processing_ms),
+            api_limit=int(_env_float("BENCH_MOCK_API_LIMIT", cls.api_limit)),
+        )
+
+    def as_env(self) -> Dict[str, str]:
+        return {
+            "BENCH_MOCK_API_VERSION": self.api_version,
+            "BENCH_MOCK_LATENCY_MS": str(self.latency_ms),
+            "BENCH_MOCK_JITTER_MS": str(self.jitter_ms),
+            "BENCH_MOCK_ERROR_RATE": str(self.error_rate),
+            "BENCH_MOCK_THROTTLE_RATE": str(self.throttle_rate),
+            "BENCH_MOCK_QUERY_RECORDS": str(self.query_records),
+            "BENCH_MOCK_PAGE_SIZE": str(self.page_size),
+            "BENCH_MOCK_DESCRIBE_FIELDS": str(self.describe_fields),
+            "BENCH_MOCK_SOBJECTS": str(self.sobjects),
+            "BENCH_MOCK_BULK_ROWS": str(self.bulk_rows),
+            "BENCH_MOCK_BULK_PAGE_ROWS": str(self.bulk_page_rows),
+            "BENCH_MOCK_BULK_PROCESSING_MS": str(self.bulk_processing_ms),
+            "BENCH_MOCK_API_LIMIT": str(self.api_limit),
+        }
+
+
+def _record_id(prefix: str, n: int) -> str:
+    return f"{prefix}{n:015d}"[:18]
+
+
+def _record(n: int) -> dict:
+    return {
+        "attributes": {"type": "Account", "url": f"/services/data/v62.0/sobjects/Account/{_record_id('001', n)}"},
+        "Id": _record_id("001", n),
+        "Name": f"Empresa Benchmark {n}",
+        "CNPJ__c": f"{n:014d}",
+        "Porte__c": ("ME", "EPP", "MEI", "Demais")[n % 4],
+        "AnnualRevenue": round(n * 1234.5, 2),
+        "CreatedDate": "2024-01-01T00:00:00.000+0000",
+        "SystemModstamp": "2024-06-01T12:00:00.000+0000",
+        "Owner": {"attributes": {"type": "User"}, "Name": f"Consultor {n % 50}"},
+    }
+
+
+def _describe(name: str, fields: int) -> dict:
+    picklist = [
+        {"active": True, "defaultValue": False, "label": label, "validFor": None, "value": value}
+        for label, value in (("Microempresa", "ME"), ("Empresa de Pequeno Porte", "EPP"), ("Microempreendedor Individual", "MEI"), ("Demais", "Demais"))
+    ]
+    items = [
+        {"name": "Id", "label": "ID", "type": "id", "length": 18, "nillable": False, "createable": False, "updateable": False, "picklistValues": []},
+        {"name": "Name", "label": "Nome", "type": "string", "length": 255, "nillable": False, "createable": True, "updateable": True, "picklistValues": []},
+        {"name": "Porte__c", "label": "Porte", "type": "picklist", "length": 255, "nillable": True, "createable": True, "updateable": True, "picklistValues": picklist},
+        {"name": "CNPJ__c", "label": "CNPJ", "type": "string", "length": 14, "nillable": True, "createable": True, "updateable": True, "externalId": True, "picklistValues": []},
+        {"name": "AnnualRevenue", "label": "Receita anual", "type": "currency", "nillable": True, "createable": True, "updateable": True, "picklistValues": []},
+        {"name": "CreatedDate", "label": "Data de criação", "type": "datetime", "nillable": False, "createable": False, "updateable": False, "picklistValues": []},
+        {"name": "SystemModstamp", "label": "System Modstamp", "type": "datetime", "nillable": False, "createable": False, "updateable": False, "picklistValues": []},
+    ]
+    if name.endswith("__c"):
+        # Objetos customizados formam uma árvore (Pai__c) e apontam para Account (master-detail)
+        index = int(re.sub(r"\D", "", name) or 0)
+        items.append({"name": "Conta__c", "label": "Conta", "type": "reference", "referenceTo": ["Account"], "relationshipName": "Conta__r",
+                      "relationshipOrder": 0, "cascadeDelete": True, "nillable": False, "createable": True, "updateable": False, "picklistValues": []})
+        if index:
+            items.append({"name": "Pai__c", "label": "Pai", "type": "reference", "referenceTo": [f"Objeto{(index - 1) // 2}__c"], "relationshipName": "Pai__r",
+                          "nillable": True, "createable": True, "updateable": True, "picklistValues": []})
+    for i in range(max(fields - len(items), 0)):
+        items.append({
+            "name": f"Campo{i}__c",
+            "label": f"Campo {i}",
+            "type": ("string", "double", "date", "boolean")[i % 4],
+            "length": 255,
+            "nillable": True,
+            "createable": True,
+            "updateable": True,
+            "picklistValues": [],
+        })
+    return {"name": name, "label": name, "custom": name.endswith("__c"), "fields": items, "childRelationships": [], "recordTypeInfos": []}
+
+
+class MockState:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.requests = 0
+        self.api_used = 0
+        self.ingest_jobs: Dict[str, dict] = {}
+        self.query_jobs: Dict[str, dict] = {}
+        self._describe_cache: Dict[str, bytes] = {}
+        self._page_cache: Dict[int, bytes] = {}
+        self._bulk_page: Optional[bytes] = None
+        self._sobjects: Optional[bytes] = None
+
+    def sobjects_body(self) -> bytes:
+        if self._sobjects is None:
+            names = ["Account", "Contact", "Lead", "Opportunity"] + [f"Objeto{i}__c" for i in range(max(self.config.sobjects - 4, 0))]
+            self._sobjects = dumps({
+                "encoding": "UTF-8",
+                "maxBatchSize": 200,
+                "sobjects": [{"name": n, "label": n, "custom": n.endswith("__c"), "queryable": True, "createable": True} for n in names],
+            })
+        return self._sobjects
+
+    def describe_body(self, name: str) -> bytes:
+        body = self._describe_cache.get(name)
+        if body is None:
+            body = dumps(_describe(name, self.config.describe_fields))
+            self._describe_cache[name] = body
+        return body
+
+    def query_page(self, offset: int) -> bytes:
+        # Páginas são montadas uma vez: o custo medido deve ser o do proxy, não o do mock
+        body = self._page_cache.get(offset)
+        if body is None:
+            cfg = self.config
+            end = min(offset + cfg.page_size, cfg.query_records)
+            page = {"totalSize": cfg.query_records, "done": end >= cfg.query_records, "records": [_record(n) for n in range(offset, end)]}
+            if not page["done"]:
+                page["nextRecordsUrl"] = f"/services/data/v{cfg.api_version}/query/01gBENCH-{end}"
+            body = dumps(page)
+            self._page_cache[offset] = body
+        return body
+
+    def bulk_page(self) -> bytes:
+        if self._bulk_page is None:
+            lines = ["Id,Name,CNPJ__c,Porte__c"]
+            for n in range(self.config.bulk_page_rows):
+                lines.append(f"{_record_id('001', n)},Empresa Benchmark {n},{n:014d},ME")
+            self._bulk_page = ("\n".join(lines) + "\n").encode("utf-8")
+        return self._bulk_page
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.md5(body).hexdigest() + '"'
+
+
+def _json(body: bytes, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def _error(status_code: int, message: str, code: str = "UNKNOWN_EXCEPTION", headers: Optional[dict] = None) -> Response:
+    return _json(dumps([{"message": message, "errorCode": code}]), status_code=status_code, headers=headers)
+
+
+def _job_state(job: dict, processing: float) -> str:
+    if job["state"] == "UploadComplete" and time.monotonic() - job["closed_at"] >= processing:
+        job["state"] = "JobComplete"
+    return job["state"]
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig.from_env()
+    state = MockState(config)
+    app = FastAPI(title="Mock FOCO gateway")
+    app.state.mock = state
+    data = f"/services/data/v{config.api_version}"
+
+    @app.middleware("http")
+    async def simulate_gateway(request: Request, call_next):
+        state.requests += 1
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        if not request.url.path.startswith("/__mock"):
+            # Erros injetados: 429 (com Retry-After) e 503, como o gateway sob carga
+            roll = random.random()
+            if roll < config.throttle_rate:
+                return _error(429, "Too many requests", "REQUEST_LIMIT_EXCEEDED", headers={"Retry-After": "0"})
+            if roll < config.throttle_rate + config.error_rate:
+                return _error(503, "Service unavailable", "SERVER_UNAVAILABLE")
+        state.api_used += 1
+        response = await call_next(request)
+        response.headers["Sforce-Limit-Info"] = f"api-usage={state.api_used % config.api_limit}/{config.api_limit}"
+        return response
+
+    # -----------------------------
+    # OAuth e utilitários
+    # -----------------------------
+    @app.api_route("/services/oauth2/token", methods=["GET", "POST"])
+    async def token(request: Request):
+        base = str(request.base_url).rstrip("/")
+        body = {
+            "access_token": "bench." + uuid.uuid4().hex,
+            "instance_url": base,
+            "token_type": "Bearer",
+            "issued_at": str(int(time.time() * 1000)),
+            "expires_in": 7200,
+        }
+        return _json(dumps(body))
+
+    @app.get("/services/oauth2/userinfo")
+    async def userinfo():
+        return _json(dumps({"user_id": "005BENCH", "name": "Benchmark", "organization_id": "00DBENCH"}))
+
+    @app.get(data + "/")
+    async def versions():
+        return _json(dumps({"sobjects": f"{data}/sobjects", "query": f"{data}/query", "jobs": f"{data}/jobs"}))
+
+    @app.get("/__mock/stats")
+    async def stats():
+        return _json(dumps({"requests": state.requests, "ingest_jobs": len(state.ingest_jobs), "query_jobs": len(state.query_jobs)}))
+
+    # -----------------------------
+    # Metadados (com ETag para exercitar a revalidação do cache)
+    # -----------------------------
+    def _cached(request: Request, body: bytes) -> Response:
+        etag = _etag(body)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return _json(body, headers={"ETag": etag})
+
+    @app.get(data + "/sobjects")
+    async def sobjects(request: Request):
+        return _cached(request, state.sobjects_body())
+
+    @app.get(data + "/sobjects/{name}/describe")
+    async def describe(name: str, request: Request):
+        return _cached(request, state.describe_body(name))
+
+    # -----------------------------
+    # Query (REST, paginada por nextRecordsUrl)
+    # -----------------------------
+    @app.get(data + "/query")
+    @app.get(data + "/queryAll")
+    async def query(q: str = ""):
+        if "from" not in q.lower():
+            return _error(400, "unexpected token", "MALFORMED_QUERY")
+        return _json(state.query_page(0))
+
+    @app.get(data + "/query/{locator}")
+    async def query_more(locator: str):
+        try:
+            offset = int(locator.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return _error(400, "invalid query locator", "INVALID_QUERY_LOCATOR")
+        return _json(state.query_page(offset))
+
+    # -----------------------------
+    # Escrita de registros e composite
+    # -----------------------------
+    @app.get(data + "/sobjects/{name}/deleted/")
+    async def get_deleted(name: str, start: str, end: str):
+        # Nenhuma exclusão simulada; a lixeira cobre os últimos 30 dias
+        earliest = time.strftime("%Y-%m-%dT%H:%M:%S.000+0000", time.gmtime(time.time() - 30 * 86400))
+        return _json(dumps({"deletedRecords": [], "earliestDateAvailable": earliest, "latestDateCovered": end}))
+
+    @app.post(data + "/sobjects/{name}")
+    async def create(name: str, request: Request):
+        await request.body()
+        return _json(dumps({"id": _record_id("001", random.randrange(10**9)), "success": True, "errors": []}), status_code=201)
+
+    @app.patch(data + "/sobjects/{name}/{record_id}")
+    async def update(name: str, record_id: str, request: Request):
+        await request.body()
+        return Response(status_code=204)
+
+    @app.patch(data + "/sobjects/{name}/{field}/{value}")
+    async def upsert(name: str, field: str, value: str, request: Request):
+        await request.body()
+        return _json(dumps({"id": _record_id("001", random.randrange(10**9)), "success": True, "created": True, "errors": []}), status_code=201)
+
+    def _collection_results(records: List[dict]) -> bytes:
+        return dumps([
+            {"id": r.get("Id") or _record_id("001", random.randrange(10**9)), "success": True, "errors": []}
+            for r in records
+        ])
+
+    @app.post(data + "/composite/sobjects")
+    async def composite_sobjects(request: Request):
+        payload = loads(await request.body())
+        return _json(_collection_results(payload.get("records") or []))
+
+    @app.patch(data + "/composite/sobjects")
+    async def composite_sobjects_update(request: Request):
+        payload = loads(await request.body())
+        return _json(_collection_results(payload.get("records") or []))
+
+    @app.patch(data + "/composite/sobjects/{name}/{field}")
+    async def composite_sobjects_upsert(name: str, field: str, request: Request):
+        payload = loads(await request.body())
+        return _json(_collection_results(payload.get("records") or []))
+
+    @app.post(data + "/composite/batch")
+    async def composite_batch(request: Request):
+        # Só describes (GET .../sobjects/{nome}/describe), como o explorador de objetos usa
+        payload = loads(await request.body())
+        results = []
+        for sub in payload.get("batchRequests") or []:
+            match = re.search(r"/sobjects/([^/]+)/describe", sub.get("url") or "")
+            if match:
+                results.append({"statusCode": 200, "result": _describe(match.group(1), config.describe_fields)})
+            else:
+                results.append({"statusCode": 404, "result": [{"errorCode": "NOT_FOUND", "message": "mock"}]})
+        return _json(dumps({"hasErrors": any(r["statusCode"] >= 400 for r in results), "results": results}))
+
+    @app.post(data + "/composite")
+    async def composite(request: Request):
+        payload = loads(await request.body())
+        responses = [
+            {"body": {"id": _record_id("001", i), "success": True, "errors": []}, "httpHeaders": {}, "httpStatusCode": 201, "referenceId": sub.get("referenceId")}
+            for i, sub in enumerate(payload.get("compositeRequest") or [])
+        ]
+        return _json(dumps({"compositeResponse": responses}))
+
+    # -----------------------------
+    # Bulk API 2.0 Ingest
+    # -----------------------------
+    def _ingest_info(job: dict) -> bytes:
+        _job_state(job, config.bulk_processing_ms / 1000.0)
+        done = job["state"] == "JobComplete"
+        info = {k: v for k, v in job.items() if k != "closed_at"}
+        info["numberRecordsProcessed"] = job["rows"] if done else 0
+        info["numberRecordsFailed"] = 0
+        return dumps(info)
+
+    @app.post(data + "/jobs/ingest")
+    async def ingest_create(request: Request):
+        payload = loads(await request.body())
+        job_id = "750" + uuid.uuid4().hex[:15]
+        job = {
+            "id": job_id,
+            "object": payload.get("object"),
+            "operation": payload.get("operation"),
+            "contentType": "CSV",
+            "lineEnding": payload.get("lineEnding", "LF"),
+            "columnDelimiter": payload.get("columnDelimiter", "COMMA"),
+            "externalIdFieldName": payload.get("externalIdFieldName"),
+            "state": "Open",
+            "rows": 0,
+            "bytes": 0,
+            "closed_at": 0.0,
+        }
+        state.ingest_jobs[job_id] = job
+        return _json(_ingest_info(job))
+
+    @app.put(data + "/jobs/ingest/{job_id}/batches")
+    async def ingest_upload(job_id: str, request: Request):
+        job = state.ingest_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        # Consome o corpo em streaming, como o gateway real
+        lines = 0
+        async for chunk in request.stream():
+            job["bytes"] += len(chunk)
+            lines += chunk.count(b"\n")
+        job["rows"] += max(lines - 1, 0)
+        return Response(status_code=201)
+
+    @app.patch(data + "/jobs/ingest/{job_id}")
+    async def ingest_close(job_id: str, request: Request):
+        job = state.ingest_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        payload = loads(await request.body())
+        job["state"] = payload.get("state", "UploadComplete")
+        job["closed_at"] = time.monotonic()
+        return _json(_ingest_info(job))
+
+    @app.get(data + "/jobs/ingest/{job_id}")
+    async def ingest_status(job_id: str):
+        job = state.ingest_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        return _json(_ingest_info(job))
+
+    @app.get(data + "/jobs/ingest/{job_id}/{kind}")
+    async def ingest_results(job_id: str, kind: str):
+        job = state.ingest_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        if kind == "successfulResults":
+            body = '"sf__Id","sf__Created"\n' + "".join(f'"{_record_id("001", n)}","true"\n' for n in range(job["rows"]))
+        elif kind == "failedResults":
+            body = '"sf__Id","sf__Error"\n'
+        else:
+            body = ""
+        return Response(content=body, media_type="text/csv")
+
+    # -----------------------------
+    # Bulk API 2.0 Query (resultados paginados por Sforce-Locator)
+    # -----------------------------
+    def _query_info(job: dict) -> bytes:
+        _job_state(job, config.bulk_processing_ms / 1000.0)
+        info = {k: v for k, v in job.items() if k != "closed_at"}
+        info["numberRecordsProcessed"] = config.bulk_rows if job["state"] == "JobComplete" else 0
+        return dumps(info)
+
+    @app.post(data + "/jobs/query")
+    async def query_job_create(request: Request):
+        payload = loads(await request.body())
+        job_id = "750" + uuid.uuid4().hex[:15]
+        job = {
+            "id": job_id,
+            "operation": payload.get("operation", "query"),
+            "object": "Account",
+            "contentType": "CSV",
+            "state": "UploadComplete",
+            "createdDate": time.strftime("%Y-%m-%dT%H:%M:%S.000+0000", time.gmtime()),
+            "closed_at": time.monotonic(),
+        }
+        state.query_jobs[job_id] = job
+        return _json(_query_info(job))
+
+    @app.get(data + "/jobs/query/{job_id}")
+    async def query_job_status(job_id: str):
+        job = state.query_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        return _json(_query_info(job))
+
+    @app.patch(data + "/jobs/query/{job_id}")
+    async def query_job_abort(job_id: str):
+        job = state.query_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        job["state"] = "Aborted"
+        return _json(_query_info(job))
+
+    @app.get(data + "/jobs/query/{job_id}/results")
+    async def query_job_results(job_id: str, locator: Optional[str] = None, maxRecords: Optional[int] = None):
+        job = state.query_jobs.get(job_id)
+        if job is None:
+            return _error(404, "job not found", "NOT_FOUND")
+        if _job_state(job, config.bulk_processing_ms / 1000.0) != "JobComplete":
+            return _error(400, "job not complete", "INVALIDJOBSTATE")
+        # O locator é o deslocamento em linhas; cada página tem bulk_page_rows linhas
+        offset = int(locator) if locator and locator.isdigit() else 0
+        per_page = min(config.bulk_page_rows, maxRecords) if maxRecords else config.bulk_page_rows
+        page_rows = min(per_page, max(config.bulk_rows - offset, 0))
+        end = offset + page_rows
+        headers = {
+            "Sforce-Locator": str(end) if end < config.bulk_rows else "null",
+            "Sforce-NumberOfRecords": str(page_rows),
+        }
+        body = state.bulk_page()
+        if page_rows < config.bulk_page_rows:
+            # Última página menor: corta no fim da linha correspondente
+            cut = 0
+            for _ in range(page_rows + 1):
+                cut = body.index(b"\n", cut) + 1
+            body = body[:cut]
+        return Response(content=body, media_type="text/csv", headers=headers)
+
+    return app
+
+
+app = create_app()
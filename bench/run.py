@@ -0,0 +1,449 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from bench.mock_gateway import MockConfig
+
+# Executa cenários de carga contra as rotas /api/* do app, com o gateway simulado
+# (bench/mock_gateway.py) no lugar do hlg-gateway. App e mock rodam em processos próprios,
+# para que o pico de memória medido seja só o do app.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cada cenário recebe o cliente HTTP e devolve (status, bytes lidos)
+Action = Callable[[httpx.AsyncClient], Awaitable[tuple]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    action: Callable[["BenchContext"], Action]
+    concurrency: Optional[int] = None
+
+
+@dataclass
+class BenchContext:
+    args: argparse.Namespace
+    mock: MockConfig
+    bulk_query_job: Optional[str] = None
+    ingest_csv: bytes = b""
+    records_payload: bytes = b""
+    composite_payload: bytes = b""
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int = 0
+    errors: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    peak_rss_kb: Optional[int] = None
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def as_dict(self) -> dict:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput_rps": round(self.requests / self.elapsed, 2) if self.elapsed else 0.0,
+            "mb_per_s": round(self.bytes / self.elapsed / 1e6, 2) if self.elapsed else 0.0,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(max(self.latencies) if self.latencies else None),
+            "peak_rss_mb": round(self.peak_rss_kb / 1024, 1) if self.peak_rss_kb else None,
+            "statuses": self.statuses,
+        }
+
+
+# -----------------------------
+# Cenários
+# -----------------------------
+SOQL = "SELECT Id, Name, CNPJ__c, Porte__c, AnnualRevenue, Owner.Name FROM Account"
+
+
+async def _read(resp: httpx.Response) -> int:
+    size = 0
+    async for chunk in resp.aiter_raw():
+        size += len(chunk)
+    return size
+
+
+def _get(path: str, params: Optional[dict] = None) -> Callable[[BenchContext], Action]:
+    def build(ctx: BenchContext) -> Action:
+        async def action(client: httpx.AsyncClient) -> tuple:
+            async with client.stream("GET", path, params=params) as resp:
+                return resp.status_code, await _read(resp)
+        return action
+    return build
+
+
+def _send(method: str, path: str, body: Callable[[BenchContext], bytes], content_type: str, params: Optional[dict] = None) -> Callable[[BenchContext], Action]:
+    def build(ctx: BenchContext) -> Action:
+        content = body(ctx)
+
+        async def action(client: httpx.AsyncClient) -> tuple:
+            async with client.stream(method, path, params=params, content=content, headers={"Content-Type": content_type}) as resp:
+                return resp.status_code, await _read(resp)
+        return action
+    return build
+
+
+def _bulk_results(ctx: BenchContext) -> Action:
+    async def action(client: httpx.AsyncClient) -> tuple:
+        async with client.stream("GET", f"/api/bulk/query/{ctx.bulk_query_job}/results", params={"wait": "true"}) as resp:
+            return resp.status_code, await _read(resp)
+    return action
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    s.name: s
+    for s in (
+        Scenario("sobjects", "GET /api/sobjects (cache de metadados aquecido)", _get("/api/sobjects")),
+        Scenario("describe", "GET /api/describe/Account (cache de metadados aquecido)", _get("/api/describe/Account")),
+        Scenario(
+            "describe_batch",
+            "POST /api/describe/batch (todos os objetos customizados, cache aquecido, índice de relacionamentos)",
+            _send("POST", "/api/describe/batch", lambda ctx: b'{"custom": true, "fields": false}', "application/json"),
+            concurrency=4,
+        ),
+        Scenario("query", "GET /api/query em passthrough, sem cache", _get("/api/query", {"q": SOQL, "cache": "false"})),
+        Scenario("query_cached", "GET /api/query com cache de resultados", _get("/api/query", {"q": SOQL, "cache": "true"})),
+        Scenario("query_stream", "GET /api/query/stream (NDJSON, todas as páginas)", _get("/api/query/stream", {"q": SOQL})),
+        Scenario(
+            "records_create",
+            "POST /api/records/Account/create (lotes de 200 via composite/sobjects)",
+            _send("POST", "/api/records/Account/create", lambda ctx: ctx.records_payload, "application/json"),
+        ),
+        Scenario(
+            "composite",
+            "POST /api/composite/sobjects (200 registros, passthrough)",
+            _send("POST", "/api/composite/sobjects", lambda ctx: ctx.composite_payload, "application/json"),
+        ),
+        Scenario(
+            "bulk_ingest",
+            "PUT /api/bulk/ingest (CSV em streaming, cria/envia/fecha o job)",
+            _send("PUT", "/api/bulk/ingest", lambda ctx: ctx.ingest_csv, "text/csv", {"object": "Account", "operation": "insert"}),
+            concurrency=4,
+        ),
+        Scenario("bulk_query_results", "GET /api/bulk/query/{id}/results (todas as páginas em um CSV)", _bulk_results, concurrency=4),
+    )
+}
+
+
+def _build_payloads(ctx: BenchContext) -> None:
+    records = [{"Name": f"Empresa {n}", "CNPJ__c": f"{n:014d}", "Porte__c": "ME"} for n in range(ctx.args.records)]
+    ctx.records_payload = json.dumps(records).encode("utf-8")
+    composite = {"allOrNone": False, "records": [{"attributes": {"type": "Account"}, **r} for r in records[:200]]}
+    ctx.composite_payload = json.dumps(composite).encode("utf-8")
+    lines = ["Name,CNPJ__c,Porte__c"] + [f"Empresa {n},{n:014d},ME" for n in range(ctx.args.ingest_rows)]
+    ctx.ingest_csv = ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# -----------------------------
+# Processos (mock e app)
+# -----------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _uvicorn(target: str, port: int, env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"processo terminou antes de responder em {url}")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"sem resposta em {url} após {timeout}s")
+
+
+def _app_env(args: argparse.Namespace, mock_url: str, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "FOCO_BASE_URL": mock_url,
+        "FOCO_LOGIN_URL": f"{mock_url}/services/oauth2/token",
+        "FOCO_CLIENT_ID": "bench",
+        "FOCO_CLIENT_SECRET": "bench",
+        "FOCO_GRANT_TYPE": "client_credentials",
+        "FOCO_STATE_BACKEND": "memory",
+        "FOCO_METADATA_CACHE_PATH": "",
+        # Sem disco, o LRU precisa caber todos os objetos do mock (describe_batch)
+        "FOCO_METADATA_CACHE_MAX_ENTRIES": "1024",
+        "FOCO_BULK_DOWNLOAD_DIR": os.path.join(workdir, "bulk"),
+        "FOCO_BULK_POLL_MIN_INTERVAL": "0.2",
+    })
+    if not args.keep_rate_limits:
+        # O limitador protegeria o gateway real; aqui mediríamos só o token bucket
+        env.update({
+            "FOCO_RATE_INTERACTIVE_RPS": "100000",
+            "FOCO_RATE_INTERACTIVE_BURST": "100000",
+            "FOCO_RATE_INTERACTIVE_CONCURRENCY": "1000",
+            "FOCO_RATE_BATCH_RPS": "100000",
+            "FOCO_RATE_BATCH_BURST": "100000",
+            "FOCO_RATE_BATCH_CONCURRENCY": "1000",
+        })
+    for item in args.app_env or []:
+        name, _, value = item.partition("=")
+        env[name] = value
+    return env
+
+
+def _peak_rss_kb(pid: int) -> Optional[int]:
+    # VmHWM: pico de memória residente do processo (Linux)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss(pid: int) -> bool:
+    # Zera o VmHWM para medir o pico de cada cenário separadamente (Linux >= 4.0)
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# -----------------------------
+# Carga
+# -----------------------------
+async def _run_scenario(client: httpx.AsyncClient, scenario: Scenario, ctx: BenchContext, app_pid: int) -> ScenarioResult:
+    args = ctx.args
+    action = scenario.action(ctx)
+    concurrency = min(args.concurrency, scenario.concurrency or args.concurrency)
+    result = ScenarioResult(scenario.name)
+
+    async def worker(deadline: float, record: bool) -> None:
+        while time.perf_counter() < deadline:
+            if record and args.requests and result.requests >= args.requests:
+                return
+            started = time.perf_counter()
+            try:
+                status, size = await action(client)
+                key = str(status)
+            except httpx.HTTPError as e:
+                status, size, key = 0, 0, type(e).__name__
+            if not record:
+                continue
+            result.latencies.append(time.perf_counter() - started)
+            result.requests += 1
+            result.bytes += size
+            result.statuses[key] = result.statuses.get(key, 0) + 1
+            if not 200 <= status < 300:
+                result.errors += 1
+
+    if args.warmup > 0:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+    # Sem clear_refs, o pico informado é o acumulado desde o início do processo
+    _reset_peak_rss(app_pid)
+    started = time.perf_counter()
+    deadline = started + (args.duration if not args.requests else 3600.0)
+    await asyncio.gather(*(worker(deadline, True) for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    result.peak_rss_kb = _peak_rss_kb(app_pid)
+    return result
+
+
+async def _prepare(client: httpx.AsyncClient, ctx: BenchContext, names: List[str]) -> None:
+    _build_payloads(ctx)
+    if "bulk_query_results" in names:
+        resp = await client.post("/api/bulk/query", json={"query": SOQL, "operation": "query"})
+        resp.raise_for_status()
+        ctx.bulk_query_job = resp.json()["id"]
+
+
+def _report(results: List[ScenarioResult], baseline: Optional[dict], threshold: float) -> List[str]:
+    header = f"{'cenário':<20} {'req':>7} {'erros':>6} {'req/s':>9} {'MB/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}"
+    print(header)
+    print("-" * len(header))
+    regressions: List[str] = []
+    for r in results:
+        d = r.as_dict()
+        print(
+            f"{r.name:<20} {d['requests']:>7} {d['errors']:>6} {d['throughput_rps']:>9} {d['mb_per_s']:>8} "
+            f"{d['p50_ms'] or '-':>9} {d['p95_ms'] or '-':>9} {d['p99_ms'] or '-':>9} {d['peak_rss_mb'] or '-':>8}"
+        )
+        base = (baseline or {}).get("scenarios", {}).get(r.name)
+        if not base:
+            continue
+        deltas = []
+        for key, worse_when_higher in (("throughput_rps", False), ("p95_ms", True), ("p99_ms", True), ("peak_rss_mb", True)):
+            old, new = base.get(key), d.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            deltas.append(f"{key} {change:+.1%}")
+            if (change > threshold) if worse_when_higher else (change < -threshold):
+                regressions.append(f"{r.name}: {key} {old} -> {new} ({change:+.1%})")
+        if deltas:
+            print(f"{'':<20} vs. base: {', '.join(deltas)}")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    names = [n.strip() for n in args.scenarios.split(",")] if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"cenários desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(SCENARIOS)})", file=sys.stderr)
+        return 2
+    mock = MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        query_records=args.query_records,
+        page_size=args.page_size,
+        describe_fields=args.describe_fields,
+        bulk_rows=args.bulk_rows,
+        bulk_page_rows=args.bulk_page_rows,
+    )
+    ctx = BenchContext(args=args, mock=mock)
+    workdir = tempfile.mkdtemp(prefix="foco-bench-")
+    mock_port, app_port = _free_port(), _free_port()
+    mock_url, app_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+    mock_proc = _uvicorn("bench.mock_gateway:app", mock_port, {**os.environ, **mock.as_env()}, os.path.join(workdir, "mock.log"))
+    app_proc = _uvicorn("app.main:app", app_port, _app_env(args, mock_url, workdir), os.path.join(workdir, "app.log"))
+    try:
+        await _wait_ready(f"{mock_url}/__mock/stats", mock_proc)
+        await _wait_ready(f"{app_url}/api/health", app_proc)
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        timeout = httpx.Timeout(args.timeout)
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=timeout) as client:
+            ready = await client.get("/api/ready")
+            if ready.status_code != 200:
+                print(f"app não ficou pronto: {ready.text}", file=sys.stderr)
+                return 1
+            await _prepare(client, ctx, names)
+            results = []
+            for name in names:
+                print(f"# {name}: {SCENARIOS[name].description}", file=sys.stderr)
+                results.append(await _run_scenario(client, SCENARIOS[name], ctx, app_proc.pid))
+    finally:
+        for proc in (app_proc, mock_proc):
+            proc.terminate()
+        for proc in (app_proc, mock_proc):
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = _report(results, baseline, args.threshold)
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "duration": args.duration,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "mock": mock.as_env(),
+            },
+            "scenarios": {r.name: r.as_dict() for r in results},
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"resultados gravados em {args.output}", file=sys.stderr)
+    print(f"logs do app e do mock em {workdir}", file=sys.stderr)
+    if regressions:
+        print("\nRegressões acima de {:.0%}:".format(args.threshold))
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark das rotas /api/* contra um gateway FOCO simulado")
+    parser.add_argument("--scenarios", help=f"Lista separada por vírgulas (padrão: todos). Disponíveis: {', '.join(SCENARIOS)}")
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos de medição por cenário")
+    parser.add_argument("--requests", type=int, default=0, help="Número fixo de requisições por cenário (ignora --duration)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Segundos de aquecimento (não medidos) por cenário")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes simultâneos")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout de cada requisição (s)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latência simulada do gateway")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Variação da latência simulada")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas 503 do gateway")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fração de respostas 429 do gateway")
+    parser.add_argument("--query-records", type=int, default=2000, help="Registros devolvidos por /query")
+    parser.add_argument("--page-size", type=int, default=2000, help="Registros por página de /query")
+    parser.add_argument("--describe-fields", type=int, default=150, help="Campos por describe")
+    parser.add_argument("--bulk-rows", type=int, default=50000, help="Linhas do resultado de um job Bulk Query")
+    parser.add_argument("--bulk-page-rows", type=int, default=10000, help="Linhas por página do resultado Bulk Query")
+    parser.add_argument("--records", type=int, default=1000, help="Registros por chamada de /api/records")
+    parser.add_argument("--ingest-rows", type=int, default=20000, help="Linhas do CSV enviado a /api/bulk/ingest")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="Mantém os limites FOCO_RATE_* do ambiente")
+    parser.add_argument("--app-env", action="append", metavar="NOME=VALOR", help="Variável extra para o app (repetível)")
+    parser.add_argument("--output", help="Grava os resultados em JSON")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora relativa que conta como regressão")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return asyncio.run(main_async(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
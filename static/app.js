@@ -577,11 +577,40 @@ async function bulkClose() {
       res = await apiPostJson(`/api/bulk/job/${encodeURIComponent(jobId)}`, { state: "UploadComplete" });
     }
     $("#bulkOutput").textContent = prettyJson(res);
+    await watchBulkJob(jobId);
   } catch (e) {
     $("#bulkOutput").textContent = String(e);
   }
 }
 
+// Acompanhamento no servidor: o backend faz o polling e envia as mudanças via SSE
+let BULK_EVENTS = null;
+
+async function watchBulkJob(jobId) {
+  if (!jobId || !window.EventSource) return;
+  await apiPostJson("/api/bulk/tracker/jobs", { jobIds: [jobId] }).catch(() => {});
+  if (BULK_EVENTS) BULK_EVENTS.close();
+  const source = new EventSource(`/api/bulk/tracker/events?jobId=${encodeURIComponent(jobId)}`);
+  BULK_EVENTS = source;
+  const render = (ev) => {
+    try {
+      const job = JSON.parse(ev.data);
+      $("#bulkOutput").textContent = prettyJson(job);
+      // JobComplete/Failed ainda recebem o evento "results" depois do estado final
+      const awaitingResults = ev.type !== "results" && ["JobComplete", "Failed"].includes(job.state)
+        && !Object.keys(job.results || {}).length;
+      if (job.finishedAt && !awaitingResults) {
+        showToast(`Job ${job.jobId}: ${job.state || job.error}`, job.state === "JobComplete" ? "success" : ev.type === "jobError" ? "error" : "info");
+        source.close();
+        if (BULK_EVENTS === source) BULK_EVENTS = null;
+      }
+    } catch (e) {
+      console.warn("Evento bulk inválido", e);
+    }
+  };
+  ["snapshot", "tracked", "state", "results", "jobError"].forEach((name) => source.addEventListener(name, render));
+}
+
 async function bulkStatus() {
   try {
     const jobId = $("#bulkJobId").value.trim();